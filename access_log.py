@@ -0,0 +1,231 @@
+"""
+Asynchronous access logging for server.py and ophthalmics.py.
+
+Request threads only build a small dict and put it on a bounded queue; a
+background thread formats records (plain text or JSON lines), writes them
+in batches and rotates the log file by size. When the queue is full,
+records are dropped and counted instead of blocking the request.
+
+Usage:
+    class Handler(AccessLogMixin, http.server.SimpleHTTPRequestHandler):
+        access_log = AccessLog(fmt='json', path='logs/access.log',
+                               sample_rates={'/health': 0.1, 'OPTIONS': 0.1})
+
+Sampling keys may be a status code (int), a path or a method; the first
+match wins in that order. Responses with status >= 400 are always logged
+unless their status itself is listed.
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_QUEUE_SIZE = 10000
+BATCH_SIZE = 256
+
+_STOP = object()
+
+
+class AccessLog:
+    """Bounded queue plus background writer thread."""
+
+    def __init__(self, path=None, fmt='text', sample_rates=None,
+                 max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self.fmt = fmt
+        self.sample_rates = dict(sample_rates or {})
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stream = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # -- request thread side -------------------------------------------------
+
+    def sampled(self, method, path, status):
+        """Return True if a request with these attributes should be logged."""
+        rates = self.sample_rates
+        if not rates:
+            return True
+        if status in rates:
+            rate = rates[status]
+        elif isinstance(status, int) and status >= 400:
+            return True
+        elif path in rates:
+            rate = rates[path]
+        elif method in rates:
+            rate = rates[method]
+        else:
+            return True
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def submit(self, record):
+        """Queue a record without blocking; drops it if the writer is behind."""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # -- writer thread side --------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self, timeout=2.0):
+        """Flush pending records and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _open(self):
+        if self.path is None:
+            return sys.stdout
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return open(self.path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        """Rename path -> path.1 -> ... -> path.N (oldest discarded) and reopen."""
+        self._stream.close()
+        for n in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{n}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{n + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._stream = self._open()
+
+    def format(self, record):
+        if self.fmt == 'json':
+            out = dict(record)
+            out['ts'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record['ts'])) + 'Z'
+            return json.dumps(out, ensure_ascii=False, separators=(',', ':'))
+        stamp = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(record['ts']))
+        if 'msg' in record:
+            return f"[{stamp}] {record['msg']}"
+        return (f"[{stamp}] \"{record.get('request', '')}\" {record.get('status', '-')} "
+                f"{record.get('bytes', '-')} {record.get('ms', 0):.1f}ms")
+
+    def _write(self, records):
+        text = ''.join(self.format(r) + '\n' for r in records)
+        if self.dropped:
+            text += self.format({'ts': time.time(), 'msg': f"access log dropped {self.dropped} record(s)"}) + '\n'
+            self.dropped = 0
+        self._stream.write(text)
+        self._stream.flush()
+        if self.path is not None and self.max_bytes and self._stream.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        self._stream = self._open()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(r is _STOP for r in batch):
+                stopping = True
+                batch = [r for r in batch if r is not _STOP]
+            if batch:
+                try:
+                    self._write(batch)
+                except (OSError, ValueError):
+                    # Never let a logging failure take down the writer
+                    pass
+        if self._stream is not sys.stdout:
+            self._stream.close()
+
+
+class AccessLogMixin:
+    """Request handler mixin: times each request and queues one record for it.
+
+    Put it before the http.server base class and set `access_log`.
+    Subclasses can add fields by overriding access_log_extra().
+    """
+
+    access_log = None
+
+    def handle_one_request(self):
+        self._log_started = time.perf_counter()
+        self._log_status = None
+        self._log_size = '-'
+        try:
+            super().handle_one_request()
+        finally:
+            if self._log_status is not None:
+                try:
+                    self._emit_access_record()
+                except Exception:
+                    # Runs in a finally block: a bad record must not mask the request's outcome;
+                    # it is counted with the other dropped records instead
+                    self.access_log.dropped += 1
+
+    def log_request(self, code='-', size='-'):
+        # Called from send_response(); the record is emitted once the request finishes
+        self._log_status = getattr(code, 'value', code)
+        self._log_size = size
+
+    def log_message(self, format, *args):
+        if self.access_log is None:
+            return super().log_message(format, *args)
+        self.access_log.submit({'ts': time.time(), 'msg': format % args})
+
+    def access_log_extra(self):
+        """Return extra fields for this request's record (override in subclasses)."""
+        return None
+
+    def _emit_access_record(self):
+        log = self.access_log
+        if log is None:
+            return
+        method = getattr(self, 'command', None)
+        path = getattr(self, 'path', '') or ''
+        status = self._log_status
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            pass
+        if not log.sampled(method, path.split('?', 1)[0], status):
+            return
+        record = {
+            'ts': time.time(),
+            'client': self.client_address[0] if self.client_address else '',
+            'method': method,
+            'path': path,
+            'request': getattr(self, 'requestline', ''),
+            'status': status,
+            'bytes': self._log_size,
+            'ms': round((time.perf_counter() - self._log_started) * 1000, 3),
+        }
+        extra = self.access_log_extra()
+        if extra:
+            record.update(extra)
+        log.submit(record)
@@ -0,0 +1,317 @@
+"""
+Request admission control for server.py and ophthalmics.py.
+
+Each request is checked right after its headers are parsed and before any
+handler code runs:
+    - request bodies over the size limit for their path get 413, without
+      reading the body (chunked uploads get 411)
+    - each client IP has a token bucket; an empty bucket means 429 + Retry-After
+    - at most `max_in_flight` requests are handled at once; beyond that the
+      server answers 503 + Retry-After instead of queueing more work
+
+The socket timeout on a connection only limits each single read, so a
+client that sends one byte just before it runs out could hold a thread
+forever. Two deadlines cover the whole transfer instead:
+    - the request line and headers must arrive within `header_timeout`
+      (HeaderDeadlines closes the connection otherwise)
+    - handlers read bodies through read_body(), or iter_body() to stream
+      them, within a base timeout plus time for the body at MIN_UPLOAD_RATE
+and ConnectionLimitMixin caps the connections (and so the threads) a server
+holds at once, including those still sending headers. Together they drop
+slow-drip clients (slowloris) instead of letting them tie up the server.
+
+In prefork mode each worker keeps its own buckets and budget, so the
+effective limits scale with the number of workers.
+
+Usage:
+    class Handler(AdmissionMixin, http.server.SimpleHTTPRequestHandler):
+        timeout = 30  # socket read timeout (any single read)
+        admission = Admission(rate=20, burst=100, max_in_flight=32, header_timeout=20,
+                              max_body=1 << 20, body_limits={'/upload': 32 << 20})
+
+    class Server(ConnectionLimitMixin, http.server.ThreadingHTTPServer):
+        max_connections = 256
+"""
+
+import itertools
+import json
+import math
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+MAX_TRACKED_CLIENTS = 10000     # token buckets kept (least recently seen are dropped)
+MIN_UPLOAD_RATE = 16 * 1024     # bytes/second a body upload must sustain
+BODY_READ_TIMEOUT = 30          # seconds allowed for a body on top of MIN_UPLOAD_RATE
+READ_CHUNK = 64 * 1024
+DEADLINE_CHECK_INTERVAL = 0.5   # seconds between checks for expired header deadlines
+BUSY_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n'
+                 b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+
+
+class BodyTooSlow(Exception):
+    """The client did not send the request body within its deadline."""
+
+
+class TokenBuckets:
+    """Per-key token buckets: `rate` tokens per second, up to `burst`."""
+
+    def __init__(self, rate, burst, max_keys=MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Take one token for key. Returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+
+class HeaderDeadlines:
+    """Shuts down connections whose request line and headers take longer than `timeout`.
+
+    One watcher thread (started on first use, so after fork in prefork mode)
+    checks the pending deadlines every DEADLINE_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expired = 0
+        self._pending = {}   # token -> (deadline, socket)
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, sock):
+        """Start the deadline for the next request head on sock. Returns a token for finish()."""
+        with self._lock:
+            token = next(self._tokens)
+            self._pending[token] = (time.monotonic() + self.timeout, sock)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='header-deadlines', daemon=True)
+                self._thread.start()
+        return token
+
+    def finish(self, token):
+        """Stop the deadline. Returns False if it had already expired."""
+        with self._lock:
+            return self._pending.pop(token, None) is not None
+
+    def _run(self):
+        while True:
+            time.sleep(DEADLINE_CHECK_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                expired = [token for token, (deadline, _) in self._pending.items() if deadline <= now]
+                socks = [self._pending.pop(token)[1] for token in expired]
+                self.expired += len(socks)
+            for sock in socks:
+                try:
+                    # The plain socket call, so a TLS socket is not unwrapped under its reader;
+                    # the blocked read in the request thread then sees end of stream
+                    socket.socket.shutdown(sock, socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class Admission:
+    """Admission policy shared by all request threads of one process."""
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None, max_body=None,
+                 body_limits=None, exempt_paths=(), header_timeout=None):
+        self.buckets = TokenBuckets(rate, burst or rate) if rate else None
+        self.header_deadlines = HeaderDeadlines(header_timeout) if header_timeout else None
+        self.max_in_flight = max_in_flight
+        self.max_body = max_body
+        self.body_limits = dict(body_limits or {})  # path suffix -> max body bytes
+        self.exempt_paths = tuple(exempt_paths)
+        self.in_flight = 0
+        self.rejected = {413: 0, 429: 0, 503: 0}
+        self._lock = threading.Lock()
+
+    def body_limit(self, path):
+        for suffix, limit in self.body_limits.items():
+            if path.endswith(suffix):
+                return limit
+        return self.max_body
+
+    def admit(self, client, method, path, headers):
+        """Return None to admit (caller must release()), or (status, retry_after, message)."""
+        path = path.split('?', 1)[0]
+
+        if method in ('POST', 'PUT', 'PATCH'):
+            if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+                return 411, None, 'Chunked request bodies are not supported; send Content-Length.'
+            limit = self.body_limit(path)
+            try:
+                length = int(headers.get('Content-Length', 0))
+            except ValueError:
+                return 400, None, 'Invalid Content-Length.'
+            if length < 0 or (limit is not None and length > limit):
+                self._count(413)
+                return 413, None, f'Request body too large (limit {limit} bytes).'
+
+        if self.buckets is not None and not (self.exempt_paths and path.startswith(self.exempt_paths)):
+            wait = self.buckets.take(client)
+            if wait:
+                self._count(429)
+                return 429, max(1, math.ceil(wait)), 'Too many requests; slow down.'
+
+        with self._lock:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                self.rejected[503] += 1  # under self._lock already
+                return 503, 1, 'Server busy; try again shortly.'
+            self.in_flight += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _count(self, status):
+        with self._lock:
+            self.rejected[status] += 1
+
+
+class AdmissionMixin:
+    """Request handler mixin: applies `admission` after the headers are parsed.
+
+    Put it before the http.server base class. Rejections are answered with a
+    small JSON body plus `admission_headers` (e.g. CORS headers) and the
+    connection is closed without reading any request body.
+    """
+
+    admission = None
+    admission_headers = ()
+
+    def handle_one_request(self):
+        self._admitted = False
+        deadlines = self.admission.header_deadlines if self.admission is not None else None
+        self._head_token = deadlines.start(self.connection) if deadlines is not None else None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._head_token is not None:
+                deadlines.finish(self._head_token)
+                self._head_token = None
+            if self._admitted:
+                self._admitted = False
+                self.admission.release()
+
+    def parse_request(self):
+        parsed = super().parse_request()
+        if self._head_token is not None:
+            # The head is complete (or rejected); a head cut short by the deadline is not served
+            on_time = self.admission.header_deadlines.finish(self._head_token)
+            self._head_token = None
+            if not on_time:
+                self.close_connection = True
+                return False
+        if not parsed:
+            return False
+        if self.admission is None:
+            return True
+        client = self.client_address[0] if self.client_address else ''
+        decision = self.admission.admit(client, self.command, self.path, self.headers)
+        if decision is None:
+            self._admitted = True
+            return True
+        status, retry_after, message = decision
+        self.reject_request(status, message, retry_after)
+        return False
+
+    def reject_request(self, status, message, retry_after=None):
+        body = json.dumps({'success': False, 'error': message}).encode('utf-8')
+        self.close_connection = True
+        try:
+            self.send_response(status)
+            for name, value in self.admission_headers:
+                self.send_header(name, value)
+            if retry_after is not None:
+                self.send_header('Retry-After', str(retry_after))
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # client already gone
+
+    def iter_body(self):
+        """Yield the request body (size already checked) in chunks, within its deadline.
+
+        For handlers that write a large body to disk as it arrives.
+        """
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        deadline = time.monotonic() + BODY_READ_TIMEOUT + length / MIN_UPLOAD_RATE
+        remaining = length
+        while remaining > 0:
+            if time.monotonic() > deadline:
+                raise BodyTooSlow(f'request body not received within {BODY_READ_TIMEOUT}s')
+            chunk = self.rfile.read1(min(remaining, READ_CHUNK))
+            if not chunk:
+                raise BodyTooSlow('client closed the connection mid-body')
+            remaining -= len(chunk)
+            yield chunk
+
+    def read_body(self):
+        """Read the request body (size already checked) within its deadline."""
+        return b''.join(self.iter_body())
+
+
+class ConnectionLimitMixin:
+    """Server mixin: serve at most `max_connections` connections at once.
+
+    Put it before the socketserver base class. A connection over the limit
+    is answered with a bare 503 (plain HTTP) or closed (TLS, where nothing
+    can be sent before the handshake) without starting a thread for it.
+    """
+
+    max_connections = None
+    connections_rejected = 0
+    _connection_slots = None
+
+    def process_request(self, request, client_address):
+        slots = self._connection_slots
+        if slots is None and self.max_connections is not None:
+            slots = self._connection_slots = threading.BoundedSemaphore(self.max_connections)
+        if slots is not None and not slots.acquire(blocking=False):
+            self.connections_rejected += 1
+            if not isinstance(request, ssl.SSLSocket):
+                try:
+                    request.sendall(BUSY_RESPONSE)
+                except OSError:
+                    pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            if slots is not None:
+                slots.release()  # no thread was started for it
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            if self._connection_slots is not None:
+                self._connection_slots.release()
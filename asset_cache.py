@@ -0,0 +1,59 @@
+"""
+Content-hashed ("fingerprinted") static assets.
+
+sync_to_github.py writes copies such as script.<hash>.js next to the
+originals and points the HTML pages at them. Because a fingerprinted name
+only ever refers to one exact content, both servers can tell browsers to
+cache it for a year without revalidating; entry pages (HTML) are served with
+no-cache instead, so a new deploy is picked up on the next visit.
+
+Usage:
+    class Handler(AssetCacheMixin, http.server.SimpleHTTPRequestHandler):
+        ...
+"""
+
+import re
+
+FINGERPRINT_LENGTH = 10  # hex digits of SHA-256 in asset names
+FINGERPRINT_RE = re.compile(r'[^/]+\.[0-9a-f]{%d}\.(?:js|css|json)$' % FINGERPRINT_LENGTH)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+REVALIDATE_FILES = ('.html', '/', 'sw.js', 'precache-manifest.json')  # names that stay the same across deploys
+
+
+def fingerprinted_name(name, digest):
+    """'script.js' -> 'script.<digest>.js'"""
+    stem, dot, suffix = name.rpartition('.')
+    return f"{stem}.{digest[:FINGERPRINT_LENGTH]}.{suffix}" if dot else f"{name}.{digest[:FINGERPRINT_LENGTH]}"
+
+
+def is_fingerprinted(path):
+    """True if the URL path names a fingerprinted asset."""
+    return bool(FINGERPRINT_RE.search(path.split('?', 1)[0]))
+
+
+class AssetCacheMixin:
+    """Request handler mixin: Cache-Control for fingerprinted assets and HTML pages.
+
+    Put it before the http.server base class. Only static files served by
+    send_head() with 200 or 304 get a header; routed responses set their own.
+    """
+
+    _serving_static = False
+
+    def send_head(self):
+        self._serving_static = True
+        try:
+            return super().send_head()
+        finally:
+            self._serving_static = False
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if not self._serving_static or code not in (200, 304):
+            return
+        path = self.path.split('?', 1)[0]
+        if is_fingerprinted(path):
+            self.send_header('Cache-Control', IMMUTABLE)
+        elif path.endswith(REVALIDATE_FILES):
+            self.send_header('Cache-Control', REVALIDATE)
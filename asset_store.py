@@ -0,0 +1,187 @@
+"""
+Content-addressed store for binary assets (clinical images such as the Kanski photos).
+
+Every asset is stored once under the SHA-256 of its bytes. Library items can
+then reference an image by hash instead of embedding it as base64, and
+uploading the same image twice costs no extra space. Uploads are streamed:
+each chunk is hashed and written to a temp file as it arrives, and the file
+is renamed into place when complete (or dropped if that content is already
+stored). A hash always names the same bytes, so readers may cache an asset
+forever.
+
+Layout:
+    <root>/<first 2 hex digits>/<sha256>        the bytes
+    <root>/<first 2 hex digits>/<sha256>.type   Content-Type given with the first upload
+    <root>/tmp/                                 uploads in progress
+
+Usage:
+    store = AssetStore("assets")
+    asset, created = store.put(chunks, content_type="image/jpeg")
+    f, asset = store.open(asset.digest)
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+
+HASH_RE = re.compile(r'[0-9a-f]{64}')
+DEFAULT_TYPE = 'application/octet-stream'
+# Served as given; anything else (e.g. text/html, which would run in our origin) as DEFAULT_TYPE
+SAFE_TYPE_RE = re.compile(r'(?:image/(?:png|jpeg|gif|webp|avif|bmp|tiff)|application/pdf|video/(?:mp4|webm))')
+STALE_UPLOAD_SECONDS = 3600   # temp files older than this are left over from aborted uploads
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class AssetError(Exception):
+    """A rejected asset request; status is the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Asset:
+    """A stored asset: its hash, size in bytes and Content-Type."""
+
+    __slots__ = ('digest', 'size', 'content_type')
+
+    def __init__(self, digest, size, content_type):
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+
+    def __repr__(self):
+        return f"Asset({self.digest[:12]}…, size={self.size}, type={self.content_type!r})"
+
+
+def normalize_type(content_type):
+    """The Content-Type to store for an upload: the media type if SAFE_TYPE_RE allows it."""
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    return media_type if SAFE_TYPE_RE.fullmatch(media_type) else DEFAULT_TYPE
+
+
+def parse_range(header, size):
+    """Resolve a Range header against an asset of `size` bytes.
+
+    Returns None to send the whole asset (no header, a unit other than bytes,
+    or several ranges, which RFC 9110 allows a server to ignore), else
+    (start, end) with end inclusive. Raises AssetError(416) if unsatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.fullmatch(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise AssetError('Range not satisfiable', 416)
+        return max(0, size - length), size - 1
+    start = int(first)
+    if start >= size:
+        raise AssetError('Range not satisfiable', 416)
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None  # invalid range syntax: ignored
+    return start, end
+
+
+class AssetStore:
+    """Assets under one directory, shared by every worker process (see module docstring)."""
+
+    def __init__(self, root, max_size=None):
+        self.root = os.fspath(root)
+        self.max_size = max_size
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._remove_stale_uploads()
+
+    def _remove_stale_uploads(self):
+        cutoff = time.time() - STALE_UPLOAD_SECONDS
+        for entry in os.scandir(self.tmp_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def path(self, digest):
+        """File path of an asset; raises AssetError for anything but a lowercase SHA-256 hex digest."""
+        if not isinstance(digest, str) or not HASH_RE.fullmatch(digest):
+            raise AssetError('Asset id must be a SHA-256 hex digest')
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, chunks, content_type=None, expected=None):
+        """Store the bytes from an iterable of chunks. Returns (Asset, created).
+
+        With `expected` (a hex digest) the upload is rejected unless the
+        content matches it, so a client can verify the transfer.
+        """
+        if expected is not None:
+            self.path(expected)
+        hasher = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.tmp_dir, f"{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}")
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if self.max_size is not None and size > self.max_size:
+                        raise AssetError(f'Asset too large (limit {self.max_size} bytes)', 413)
+                    hasher.update(chunk)
+                    f.write(chunk)
+            if size == 0:
+                raise AssetError('Empty asset')
+            digest = hasher.hexdigest()
+            if expected is not None and digest != expected:
+                raise AssetError(f'Content hash {digest} does not match {expected}')
+
+            path = self.path(digest)
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Two uploads of the same content may race here; both files hold the same bytes
+                os.replace(tmp_path, path)
+        finally:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        stored_type = self._read_type(path)
+        if stored_type is None:
+            stored_type = normalize_type(content_type)
+            type_tmp = f"{tmp_path}.type"
+            with open(type_tmp, 'w', encoding='ascii') as f:
+                f.write(stored_type)
+            os.replace(type_tmp, path + '.type')
+        return Asset(digest, size, stored_type), created
+
+    def _read_type(self, path):
+        try:
+            with open(path + '.type', encoding='ascii') as f:
+                return f.read().strip() or DEFAULT_TYPE
+        except FileNotFoundError:
+            return None
+
+    def open(self, digest):
+        """Open an asset for reading. Returns (binary file, Asset); raises AssetError(404) if missing."""
+        path = self.path(digest)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            raise AssetError(f'No asset {digest}', 404) from None
+        size = os.fstat(f.fileno()).st_size
+        return f, Asset(digest, size, self._read_type(path) or DEFAULT_TYPE)
+
+    def __contains__(self, digest):
+        try:
+            return os.path.exists(self.path(digest))
+        except AssetError:
+            return False
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+JSON codec micro-benchmark on the real library corpus.
+
+Times, for the stdlib and every fast backend that is installed:
+    decode   every library/*.json file (what the index build and a server rescan do)
+    encode   each item compactly (the server's per-item cache and /api/library/list)
+    index    the whole library as library-index.json (indent=2, ensure_ascii=False)
+
+and checks that json_codec produces exactly the stdlib bytes for the index.
+
+Usage:
+    python3 benchmarks/bench_json.py [--repeat 5] [--library PATH]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import json_codec  # noqa: E402
+
+
+def stdlib_backend():
+    return {
+        'loads': json.loads,
+        'dumps': lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        'index': lambda obj: json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8'),
+    }
+
+
+def available_backends():
+    backends = {'json': stdlib_backend()}
+    try:
+        import orjson
+        backends['orjson'] = {
+            'loads': orjson.loads,
+            'dumps': orjson.dumps,
+            'index': lambda obj: orjson.dumps(obj, option=orjson.OPT_INDENT_2),
+        }
+    except ImportError:
+        pass
+    try:
+        import ujson
+        backends['ujson'] = {
+            'loads': ujson.loads,
+            'dumps': lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8'),
+            'index': lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, indent=2).encode('utf-8'),
+        }
+    except ImportError:
+        pass
+    try:
+        import simdjson
+        parser = simdjson.Parser()
+        backends['simdjson'] = {'loads': lambda data: parser.parse(data, recursive=True)}
+    except ImportError:
+        pass
+    backends['json_codec'] = {
+        'loads': json_codec.loads,
+        'dumps': json_codec.dumps,
+        'index': lambda obj: json_codec.dumps(obj, indent=2),
+    }
+    return backends
+
+
+def best_of(repeat, func):
+    """Fastest of `repeat` runs, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON backends on the library corpus")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement (best is reported)")
+    parser.add_argument('--library', type=Path, default=ROOT / 'library', help="folder of item JSON files")
+    args = parser.parse_args()
+
+    raw = [path.read_bytes() for path in sorted(args.library.glob('*.json'))]
+    if not raw:
+        print(f"[!] No JSON files in {args.library}")
+        return 1
+    items = [json.loads(data) for data in raw]
+    print(f"[*] {len(raw)} files, {sum(map(len, raw)) / 1e6:.1f} MB "
+          f"(json_codec: {json_codec.LOADS_BACKEND} decode, {json_codec.DUMPS_BACKEND} encode)")
+
+    expected_index = stdlib_backend()['index'](items)
+    identical = json_codec.dumps(items, indent=2) == expected_index
+    print(f"[{'+' if identical else '!'}] json_codec index bytes {'match' if identical else 'DIFFER from'} the stdlib")
+
+    results = {}
+    for name, backend in available_backends().items():
+        row = {'decode': best_of(args.repeat, lambda: [backend['loads'](data) for data in raw])}
+        if 'dumps' in backend:
+            row['encode'] = best_of(args.repeat, lambda: [backend['dumps'](item) for item in items])
+            row['index'] = best_of(args.repeat, lambda: backend['index'](items))
+            row['same'] = backend['index'](items) == expected_index
+        results[name] = row
+
+    base = results['json']
+    print(f"\n{'backend':<12}{'decode ms':>12}{'encode ms':>12}{'index ms':>12}  index bytes")
+    for name, row in results.items():
+        cells = []
+        for column in ('decode', 'encode', 'index'):
+            if column in row:
+                cells.append(f"{row[column]:8.1f} x{base[column] / row[column]:<3.1f}".rjust(12))
+            else:
+                cells.append('-'.rjust(12))
+        same = '-' if 'same' not in row else ('identical' if row['same'] else 'differ')
+        print(f"{name:<12}{''.join(cells)}  {same}")
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
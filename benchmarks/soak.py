@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Soak and concurrency stress test for the library server (ophthalmics.py).
+
+Runs ophthalmics.RequestHandler in-process on a copy of the library and,
+for --duration seconds, keeps --clients threads sending a weighted mix of
+    upload    POST /api/library/upload (1-3 items, overwriting a fixed set of
+              soak ids, so the library stays the same size)
+    list      GET  /api/library/list (must be a complete JSON array)
+    stream    GET  /api/library/stream (every line must be a JSON item)
+    changes   GET  /api/library/changes
+    facets    GET  /api/library/facets
+    static    GET  index.html / style.css / script.js
+while --slow-clients threads dribble upload bodies and read list responses a
+few KB at a time. A checker thread keeps re-reading the library files and
+reports any that do not parse (a torn or partial write).
+
+Every --sample seconds it records RSS, the number of live Python objects,
+threads and open file descriptors. RSS and object growth after the warm-up
+(the first fifth of the run), thread and descriptor counts before and after
+the load, the latency percentiles per operation and the error count are
+compared with the budgets. Memory is compared by its floor (the lowest
+sample) at the start and end of the settled part of the run, because each
+sample also counts whatever responses happen to be in flight. Runs with less
+than MIN_MEMORY_WINDOW seconds after the warm-up report memory growth
+without checking it.
+
+Budgets live in soak_budgets.json next to this script. The exit status is
+1 when any budget is exceeded.
+
+Usage:
+    python3 benchmarks/soak.py                      # 60 s, budgets from soak_budgets.json
+    python3 benchmarks/soak.py --duration 600 --clients 16 --report soak-report.json
+"""
+
+import argparse
+import contextlib
+import gc
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import ophthalmics  # noqa: E402
+from access_log import AccessLog  # noqa: E402
+from admission import Admission  # noqa: E402
+from prefork import LISTEN_BACKLOG  # noqa: E402
+
+BUDGETS_FILE = Path(__file__).resolve().parent / "soak_budgets.json"
+STATIC_FILES = ["index.html", "style.css", "script.js"]
+SOAK_ID_BASE = 9_000_000_000_000   # ids of the items the uploads overwrite
+SOAK_ID_COUNT = 20
+OPERATION_WEIGHTS = {"list": 25, "static": 25, "upload": 15, "stream": 10, "changes": 15, "facets": 10}
+WARMUP_FRACTION = 0.2
+MIN_MEMORY_WINDOW = 30      # seconds after the warm-up needed to check the memory budgets
+SLOW_SEND_CHUNK = 2048      # bytes a slow client sends at a time
+SLOW_READ_CHUNK = 16384     # bytes a slow client reads at a time
+SLOW_PAUSE = 0.05           # seconds between its chunks
+QUIESCE_SECONDS = 1.0       # wait after the load before counting threads and descriptors
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def rss_bytes():
+    """Current resident set size (Linux), or the peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+class Stats:
+    """Latencies and failures per operation, shared by the client threads."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.samples = []
+        self.torn = []
+        self._lock = threading.Lock()
+
+    def record(self, op, started, error=None):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            if error is None:
+                self.latencies.setdefault(op, []).append(elapsed)
+            else:
+                self.errors.setdefault(op, []).append(error)
+
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.stop = threading.Event()
+        self.upload_counter = 0
+        self.counter_lock = threading.Lock()
+
+    # -- server ----------------------------------------------------------------
+
+    def start_server(self):
+        self.app_dir = Path(tempfile.mkdtemp(prefix="ophthalmics-soak-"))
+        shutil.copytree(self.args.library, self.app_dir / "library")
+        for name in STATIC_FILES:
+            if (ROOT / name).exists():
+                shutil.copy(ROOT / name, self.app_dir / name)
+        ophthalmics.APP_PATH = str(self.app_dir)
+        ophthalmics.LIBRARY_CACHE = ophthalmics.LibraryCache()
+        ophthalmics.LIBRARY_CACHE.warm_start()
+
+        class SoakHandler(ophthalmics.RequestHandler):
+            # Everything comes from one address: keep the concurrency cap, drop the per-IP rate limit
+            admission = Admission(
+                max_in_flight=ophthalmics.MAX_IN_FLIGHT,
+                max_body=ophthalmics.MAX_BODY_BYTES,
+                body_limits=ophthalmics.BODY_LIMITS,
+                header_timeout=ophthalmics.REQUEST_HEADER_TIMEOUT,
+            )
+            access_log = AccessLog(path=str(self.app_dir / "access.log"))
+
+            def log_message(self, format, *args):
+                pass
+
+        class SoakServer(ophthalmics.HTTPServer):
+            request_queue_size = LISTEN_BACKLOG  # as the prefork listeners (the default of 5 drops SYNs)
+
+        self.server = SoakServer(("127.0.0.1", 0), SoakHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="soak-server", daemon=True).start()
+
+    def stop_server(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.app_dir, ignore_errors=True)
+
+    # -- client operations -----------------------------------------------------
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.args.timeout)
+        try:
+            conn.request(method, ophthalmics.URL_PATH + path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+            length = response.getheader("Content-Length")
+            if length is not None and int(length) != len(data):
+                raise ValueError(f"short body: {len(data)} of {length} bytes")
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            return data
+        finally:
+            conn.close()
+
+    def soak_items(self):
+        with self.counter_lock:
+            self.upload_counter += 1
+            serial = self.upload_counter
+        items = []
+        for _ in range(random.randint(1, 3)):
+            item_id = SOAK_ID_BASE + random.randrange(SOAK_ID_COUNT)
+            paragraphs = random.randint(1, 200)
+            items.append({
+                "id": item_id,
+                "title": f"Soak item {item_id - SOAK_ID_BASE}",
+                "chapterId": "soak",
+                "date": "2026-01-01T00:00:00",
+                "data": {"sections": [{"type": "plain_text", "title": f"Upload {serial}",
+                                       "content": "Soak test paragraph. " * paragraphs}]},
+            })
+        return json.dumps(items).encode("utf-8")
+
+    def op_upload(self):
+        self.request("POST", "/api/library/upload", self.soak_items(), {"Content-Type": "application/json"})
+
+    def op_list(self):
+        items = json.loads(self.request("GET", "/api/library/list"))
+        if not isinstance(items, list) or not items:
+            raise ValueError("list is not a non-empty array")
+
+    def op_stream(self):
+        lines = self.request("GET", "/api/library/stream").splitlines()
+        for line in lines:
+            json.loads(line)
+        if not lines:
+            raise ValueError("empty stream")
+
+    def op_changes(self):
+        json.loads(self.request("GET", "/api/library/changes?since=0"))
+
+    def op_facets(self):
+        json.loads(self.request("GET", "/api/library/facets"))
+
+    def op_static(self):
+        self.request("GET", "/" + random.choice(STATIC_FILES))
+
+    def client(self):
+        ops = list(OPERATION_WEIGHTS)
+        weights = [OPERATION_WEIGHTS[op] for op in ops]
+        while not self.stop.is_set():
+            op = random.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try:
+                getattr(self, f"op_{op}")()
+            except Exception as e:
+                self.stats.record(op, started, f"{type(e).__name__}: {e}")
+            else:
+                self.stats.record(op, started)
+
+    # -- slow clients ------------------------------------------------------------
+
+    def slow_upload(self):
+        body = self.soak_items()
+        head = (f"POST {ophthalmics.URL_PATH}/api/library/upload HTTP/1.1\r\n"
+                f"Host: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("ascii")
+        with socket.create_connection(("127.0.0.1", self.port), timeout=self.args.timeout) as sock:
+            sock.sendall(head)
+            for start in range(0, len(body), SLOW_SEND_CHUNK):
+                sock.sendall(body[start:start + SLOW_SEND_CHUNK])
+                time.sleep(SLOW_PAUSE)
+            response = self._read_slowly(sock)
+        if not response.startswith(b"HTTP/1.") or b" 200 " not in response.split(b"\r\n", 1)[0]:
+            raise ValueError(response.split(b"\r\n", 1)[0].decode("latin-1"))
+
+    def slow_list(self):
+        head = (f"GET {ophthalmics.URL_PATH}/api/library/list HTTP/1.1\r\n"
+                f"Host: 127.0.0.1\r\nConnection: close\r\n\r\n").encode("ascii")
+        with socket.create_connection(("127.0.0.1", self.port), timeout=self.args.timeout) as sock:
+            sock.sendall(head)
+            response = self._read_slowly(sock)
+        json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+    def _read_slowly(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(SLOW_READ_CHUNK)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+            time.sleep(SLOW_PAUSE)
+
+    def slow_client(self):
+        while not self.stop.is_set():
+            op = random.choice(["slow_upload", "slow_list"])
+            started = time.perf_counter()
+            try:
+                getattr(self, op)()
+            except Exception as e:
+                self.stats.record(op, started, f"{type(e).__name__}: {e}")
+            else:
+                self.stats.record(op, started)
+
+    # -- checks ------------------------------------------------------------------
+
+    def check_library_files(self):
+        """Return the names of library files that do not parse."""
+        torn = []
+        library = self.app_dir / "library"
+        for path in library.glob("*.json"):
+            try:
+                json.loads(path.read_bytes())
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                torn.append(path.name)
+        return torn
+
+    def checker(self):
+        while not self.stop.wait(0.2):
+            for name in self.check_library_files():
+                self.stats.torn.append(name)
+
+    def snapshot(self):
+        gc.collect()
+        return {
+            "rss": rss_bytes(),
+            "objects": len(gc.get_objects()),
+            "threads": threading.active_count(),
+            "fds": open_fds(),
+        }
+
+    def sampler(self):
+        started = time.monotonic()
+        while True:
+            sample = self.snapshot()
+            sample["t"] = round(time.monotonic() - started, 2)
+            self.stats.samples.append(sample)
+            if self.stop.wait(self.args.sample):
+                return
+
+    # -- run -----------------------------------------------------------------------
+
+    def run(self):
+        self.start_server()
+        try:
+            # One request of each kind first, so lazily started threads exist before the baseline
+            for op in OPERATION_WEIGHTS:
+                getattr(self, f"op_{op}")()
+            self.idle_before = self.snapshot()
+
+            threads = [threading.Thread(target=self.sampler, name="soak-sampler", daemon=True),
+                       threading.Thread(target=self.checker, name="soak-checker", daemon=True)]
+            threads += [threading.Thread(target=self.client, name=f"soak-client-{n}", daemon=True)
+                        for n in range(self.args.clients)]
+            threads += [threading.Thread(target=self.slow_client, name=f"soak-slow-{n}", daemon=True)
+                        for n in range(self.args.slow_clients)]
+            for thread in threads:
+                thread.start()
+            self.stop.wait(self.args.duration)
+            self.stop.set()
+            for thread in threads:
+                thread.join(self.args.timeout + 5)
+            self.stats.torn.extend(self.check_library_files())
+            time.sleep(QUIESCE_SECONDS)
+            self.idle_after = self.snapshot()
+        finally:
+            self.stop_server()
+        return self.report()
+
+    def report(self):
+        stats = self.stats
+        operations = {}
+        for op in sorted(set(stats.latencies) | set(stats.errors)):
+            latencies = stats.latencies.get(op, [])
+            operations[op] = {
+                "count": len(latencies),
+                "errors": len(stats.errors.get(op, [])),
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+            }
+
+        # Memory: the lowest sample in the first third after the warm-up against the lowest
+        # in the last third. A sample also counts the responses being built and parsed at
+        # that moment (the live-object count swings by a third with them); the floor is
+        # what stays. Threads and descriptors vary with the requests in flight, so they
+        # are compared between the idle moments before and after the load.
+        samples = stats.samples
+        settled = [s for s in samples if s["t"] >= self.args.duration * WARMUP_FRACTION] or samples
+        growth = {}
+        for key in ("rss", "objects"):
+            values = [s[key] for s in settled]
+            if len(values) >= 2:
+                third = max(1, len(values) // 3)
+                head, tail = min(values[:third]), min(values[-third:])
+                growth[key] = {"start": head, "end": tail, "growth": tail - head}
+        for key in ("threads", "fds"):
+            before, after = self.idle_before[key], self.idle_after[key]
+            if before is not None and after is not None:
+                growth[key] = {"start": before, "end": after, "growth": after - before}
+        return {
+            "duration": self.args.duration,
+            "memory_window": round(settled[-1]["t"] - settled[0]["t"], 1) if settled else 0,
+            "clients": self.args.clients,
+            "slow_clients": self.args.slow_clients,
+            "operations": operations,
+            "error_samples": {op: errors[:5] for op, errors in stats.errors.items()},
+            "torn_files": sorted(set(stats.torn)),
+            "growth": growth,
+            "samples": samples,
+        }
+
+
+def check_budgets(report, budgets):
+    """Return a list of budget violations (empty when everything is within budget)."""
+    violations = []
+    for op, row in report["operations"].items():
+        limits = budgets.get("latency_ms", {}).get(op, {})
+        for key, limit in limits.items():
+            if row.get(key) is not None and row[key] > limit:
+                violations.append(f"{op} {key} {row[key]:.1f} ms > {limit} ms")
+    total = sum(row["count"] + row["errors"] for row in report["operations"].values())
+    errors = sum(row["errors"] for row in report["operations"].values())
+    if total and errors / total > budgets.get("max_error_rate", 0):
+        violations.append(f"error rate {errors}/{total} > {budgets.get('max_error_rate', 0)}")
+    if report["torn_files"]:
+        violations.append(f"torn library files: {', '.join(report['torn_files'][:5])}")
+
+    growth = report["growth"]
+    if report["memory_window"] < MIN_MEMORY_WINDOW:
+        growth = {key: row for key, row in growth.items() if key not in ("rss", "objects")}
+    if "rss" in growth and growth["rss"]["growth"] / 2**20 > budgets.get("max_rss_growth_mb", float("inf")):
+        violations.append(f"RSS grew {growth['rss']['growth'] / 2**20:.1f} MB > {budgets['max_rss_growth_mb']} MB")
+    if "objects" in growth and growth["objects"]["start"]:
+        percent = 100 * growth["objects"]["growth"] / growth["objects"]["start"]
+        if percent > budgets.get("max_object_growth_percent", float("inf")):
+            violations.append(f"live objects grew {percent:.1f}% > {budgets['max_object_growth_percent']}%")
+    for key in ("threads", "fds"):
+        limit = budgets.get(f"max_{key}_growth")
+        if key in growth and limit is not None and growth[key]["growth"] > limit:
+            violations.append(f"{key} grew by {growth[key]['growth']} > {limit}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak/stress test the library server in-process")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load (default 60)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--slow-clients", type=int, default=2, help="threads that send and read slowly")
+    parser.add_argument("--sample", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--timeout", type=float, default=30, help="client socket timeout")
+    parser.add_argument("--library", type=Path, default=ROOT / "library", help="library folder to copy")
+    parser.add_argument("--budgets", type=Path, default=BUDGETS_FILE, help="budget file (JSON)")
+    parser.add_argument("--report", type=Path, help="write the full report (with samples) here")
+    args = parser.parse_args()
+
+    budgets = json.loads(args.budgets.read_text(encoding="utf-8"))
+    print(f"[*] Soak: {args.duration:g}s, {args.clients} clients + {args.slow_clients} slow, "
+          f"library {args.library}")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = Soak(args).run()  # without the server's per-upload messages
+
+    print(f"\n{'operation':<12}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, row in report["operations"].items():
+        cells = "".join(f"{row[key]:10.1f}" if row[key] is not None else f"{'-':>10}" for key in ("p50", "p95", "p99"))
+        print(f"{op:<12}{row['count']:>8}{row['errors']:>8}{cells}")
+    for key, row in report["growth"].items():
+        if key == "rss":
+            print(f"[*] rss: {row['start'] / 2**20:.1f} MB -> {row['end'] / 2**20:.1f} MB")
+        else:
+            print(f"[*] {key}: {row['start']} -> {row['end']}")
+    if report["memory_window"] < MIN_MEMORY_WINDOW:
+        print(f"[*] Memory budgets not checked: {report['memory_window']:g}s after the warm-up, "
+              f"{MIN_MEMORY_WINDOW}s needed (use a longer --duration)")
+    for op, errors in report["error_samples"].items():
+        print(f"[!] {op}: {errors[0]}")
+
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[*] Report written to {args.report}")
+
+    violations = check_budgets(report, budgets)
+    for violation in violations:
+        print(f"[!] Over budget: {violation}")
+    if not violations:
+        print("[+] Within all budgets")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
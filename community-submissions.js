@@ -57,6 +57,11 @@ const IP_SERVICE_URL = 'https://api.ipify.org?format=json';
 const COMMUNITY_CACHE_KEY = 'ophthalmic_community_cache';
 const COMMUNITY_CACHE_EXPIRY = 5 * 60 * 1000; // 5 minutes
 
+// Local community service (ophthalmics.py). When the page is served by it,
+// submissions live in its event log instead of the Gist (see community_store.py)
+const COMMUNITY_API_BASE = 'api/community';
+const COMMUNITY_PAGE_SIZE = 20;
+
 // ============================================
 // UTILITY FUNCTIONS
 // ============================================
@@ -208,10 +213,80 @@ function configureGist(id, token) {
     return false;
 }
 
+// ============================================
+// LOCAL SERVER BACKEND
+// ============================================
+
+let communityServerProbe = null;
+
+/**
+ * Check (once per page load) whether the local community service is available
+ */
+function hasCommunityServer() {
+    if (!communityServerProbe) {
+        communityServerProbe = fetch(`${COMMUNITY_API_BASE}/stats`, { cache: 'no-store' })
+            .then(r => r.ok && (r.headers.get('Content-Type') || '').includes('application/json'))
+            .catch(() => false);
+    }
+    return communityServerProbe;
+}
+
+/**
+ * POST an action to the local community service
+ */
+async function communityApi(action, payload = {}) {
+    try {
+        const response = await fetch(`${COMMUNITY_API_BASE}/${action}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+        return await response.json();
+    } catch (err) {
+        console.error(`Community service error (${action}):`, err);
+        return { success: false, message: 'Could not reach the community server.' };
+    }
+}
+
+/**
+ * Get one page of pending or approved submissions, newest first
+ * @returns {Promise<Object>} - { items, total, offset, limit }
+ */
+async function getSubmissionsPage(status = 'pending', offset = 0, limit = COMMUNITY_PAGE_SIZE) {
+    if (await hasCommunityServer()) {
+        try {
+            const params = new URLSearchParams({ status, offset, limit });
+            const response = await fetch(`${COMMUNITY_API_BASE}/submissions?${params}`, { cache: 'no-store' });
+            if (response.ok) return await response.json();
+        } catch (err) {
+            console.error('Error fetching submissions page:', err);
+        }
+        return { items: [], total: 0, offset, limit };
+    }
+
+    // Gist backend: page the full document client-side
+    const data = await fetchSubmissions();
+    const pool = status === 'approved'
+        ? (data.approved || [])
+        : (data.submissions || []).filter(s => s.status === 'pending');
+    return { items: pool.slice(offset, offset + limit), total: pool.length, offset, limit };
+}
+
 /**
  * Fetch all submissions from configured storage
  */
 async function fetchSubmissions() {
+    if (await hasCommunityServer()) {
+        try {
+            const response = await fetch(`${COMMUNITY_API_BASE}/all`, { cache: 'no-store' });
+            if (!response.ok) throw new Error(`Community server error (${response.status})`);
+            return await response.json();
+        } catch (err) {
+            console.error('Error fetching submissions:', err);
+            return { submissions: [], approved: [], deleted: [] };
+        }
+    }
+
     // Wait a moment for auto-init if not configured? 
     // Synchronous check is safer.
 
@@ -379,6 +454,24 @@ async function submitToCommunity(infographicData, userName) {
         return { success: false, message: 'Please provide your name.' };
     }
 
+    if (await hasCommunityServer()) {
+        const result = await communityApi('submit', {
+            userName,
+            items: [{
+                title: infographicData.title || 'Untitled Infographic',
+                summary: infographicData.summary || '',
+                chapterId: infographicData.chapterId || 'uncategorized',
+                data: infographicData
+            }]
+        });
+        if (!result.success) return { success: false, message: `Submission failed: ${result.message || 'Unknown error'}` };
+        return {
+            success: true,
+            message: 'Your infographic has been submitted for review!',
+            submissionId: result.submissionIds[0]
+        };
+    }
+
     try {
         // Get user IP
         const userIP = await getUserIP();
@@ -437,6 +530,24 @@ async function submitMultiple(infographicsList, userName) {
         return { success: false, message: 'Please provide your name.' };
     }
 
+    if (await hasCommunityServer()) {
+        const result = await communityApi('submit', {
+            userName,
+            items: infographicsList.map(item => ({
+                title: (item.title || item.data?.title) || 'Untitled Infographic',
+                summary: (item.summary || item.data?.summary) || '',
+                chapterId: item.chapterId || item.data?.chapterId || 'uncategorized',
+                data: item.data || item
+            }))
+        });
+        if (!result.success) return { success: false, message: `Batch submission failed: ${result.message || 'Please try again'}` };
+        return {
+            success: true,
+            count: result.count,
+            message: `Successfully submitted ${result.count} infographics!`
+        };
+    }
+
     try {
         const userIP = await getUserIP();
         const currentData = await fetchSubmissions();
@@ -515,6 +626,10 @@ async function getAllSubmissions() {
  * @param {string} submissionId - The submission to like
  */
 async function likeSubmission(submissionId) {
+    if (await hasCommunityServer()) {
+        return communityApi('like', { id: submissionId });
+    }
+
     try {
         const userIP = await getUserIP();
         const data = await fetchSubmissions();
@@ -575,6 +690,10 @@ async function approveSubmission(submissionId, pin) {
         return { success: false, message: 'Invalid admin PIN.' };
     }
 
+    if (await hasCommunityServer()) {
+        return communityApi('approve', { id: submissionId, pin });
+    }
+
     try {
         const data = await fetchSubmissions();
 
@@ -616,6 +735,10 @@ async function rejectSubmission(submissionId, pin) {
         return { success: false, message: 'Invalid admin PIN.' };
     }
 
+    if (await hasCommunityServer()) {
+        return communityApi('reject', { id: submissionId, pin });
+    }
+
     try {
         const data = await fetchSubmissions();
 
@@ -651,6 +774,10 @@ async function deduplicateApprovedSubmissions(pin) {
         return { success: false, message: 'Invalid admin PIN.' };
     }
 
+    if (await hasCommunityServer()) {
+        return communityApi('dedupe', { pin });
+    }
+
     try {
         const data = await fetchSubmissions();
         const approved = data.approved || [];
@@ -935,6 +1062,11 @@ function normalizeTitle(t) {
  * @param {string} title - The title of the item (will be normalized)
  */
 async function removeFromAllPools(title) {
+    if (await hasCommunityServer()) {
+        const result = await communityApi('remove', { title });
+        return result.success ? result : { success: false, removed: { pending: 0, approved: 0 } };
+    }
+
     if (!isConfigured()) {
         console.log('JSONBin not configured, cannot remove from community pools.');
         return { success: false, removed: { pending: 0, approved: 0 } };
@@ -1009,6 +1141,10 @@ async function removeFromAllPools(title) {
  * @param {string} normalizedTitle - Normalized title of the deleted item
  */
 async function trackDeletion(normalizedTitle) {
+    if (await hasCommunityServer()) {
+        return communityApi('track-deletion', { title: normalizedTitle });
+    }
+
     if (!isConfigured()) {
         console.log('JSONBin not configured, cannot track deletion for remote sync.');
         return { success: false };
@@ -1047,6 +1183,16 @@ async function trackDeletion(normalizedTitle) {
  * Get list of deleted item titles for sync
  */
 async function getDeletedItems() {
+    if (await hasCommunityServer()) {
+        try {
+            const response = await fetch(`${COMMUNITY_API_BASE}/deleted`, { cache: 'no-store' });
+            return response.ok ? await response.json() : [];
+        } catch (err) {
+            console.error('Error getting deleted items:', err);
+            return [];
+        }
+    }
+
     if (!isConfigured()) {
         return [];
     }
@@ -1076,6 +1222,8 @@ window.CommunitySubmissions = {
     getPending: getPendingSubmissions,
     getApproved: getApprovedSubmissions,
     getAll: getAllSubmissions,
+    getPage: getSubmissionsPage, // Paginated pending/approved views
+    hasServer: hasCommunityServer,
 
     // User actions
     like: likeSubmission,
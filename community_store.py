@@ -0,0 +1,459 @@
+"""
+Community submissions store backed by an append-only event log.
+
+Every action (submit, like, approve, reject, delete, dedupe) is one JSON
+line appended to events-<gen>.log, so writes cost O(1) regardless of how
+many submissions exist. The in-memory state is rebuilt from the latest
+snapshot plus the events after it. Every SNAPSHOT_EVERY events the state is
+written to snapshot.json, and the log is compacted: the next generation
+starts with an empty file.
+
+Several processes (prefork workers) can share one store directory. Writers
+take an exclusive flock, catch up on events appended by other processes and
+then append. Readers catch up under a shared lock. Catching up is a stat()
+when nothing has changed.
+
+Layout:
+    <root>/snapshot.json     {"gen", "seq", "pending", "approved", "deleted"}
+    <root>/events-<gen>.log  one event per line, {"seq", "ts", "type", ...}
+    <root>/lock              flock target
+"""
+
+import json
+import os
+import random
+import re
+import string
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+SNAPSHOT_EVERY = 1000       # events between snapshots/compactions
+DELETED_HISTORY = 100       # deleted titles kept for remote sync (as in community-submissions.js)
+MAX_PAGE_SIZE = 100
+MAX_NAME_LENGTH = 500
+
+
+class CommunityError(Exception):
+    """A rejected community action; status is the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def normalize_title(title):
+    """Lowercase alphanumerics only (consistent with normalizeTitle in script.js)."""
+    return re.sub(r'[^a-z0-9]', '', (title or '').lower().strip())
+
+
+def sanitize_input(value):
+    """Mirror sanitizeInput() in community-submissions.js."""
+    if not isinstance(value, str):
+        return ''
+    return re.sub(r'[<>]', '', value.strip())[:MAX_NAME_LENGTH]
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _submission_id():
+    suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=9))
+    return f"sub_{int(time.time() * 1000)}_{suffix}"
+
+
+class _FileLock:
+    """flock on a lock file plus a thread lock (flock is per process, not per thread)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+
+    def acquire(self, exclusive):
+        self._thread_lock.acquire()
+        if fcntl is None:
+            return None
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return fd
+
+    def release(self, fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+
+class CommunityStore:
+    """Event-sourced community state: pending and approved submissions, deleted titles."""
+
+    def __init__(self, root, seed_document=None):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.snapshot_path = os.path.join(root, 'snapshot.json')
+        self._lock = _FileLock(os.path.join(root, 'lock'))
+        self._reset()
+
+        fd = self._lock.acquire(exclusive=True)
+        try:
+            self._catch_up()
+            if self.seq == 0 and seed_document and not os.path.exists(self.snapshot_path):
+                self._seed(seed_document)
+        finally:
+            self._lock.release(fd)
+
+    # -- state ---------------------------------------------------------------
+
+    def _reset(self):
+        self.gen = 0
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.pending = {}       # id -> submission, oldest first
+        self.approved = {}      # id -> submission, oldest approval first
+        self.deleted = []       # normalized titles / ids, newest last
+        self._likers = {}       # id -> set of liker IPs
+        self._titles = {}       # normalized title -> set of ids
+        self._snapshot_token = None
+        self._log_offset = 0
+
+    def _log_path(self, gen=None):
+        return os.path.join(self.root, f"events-{self.gen if gen is None else gen}.log")
+
+    def _index(self, sub):
+        self._likers[sub['id']] = set(sub.get('likedBy') or [])
+        self._titles.setdefault(normalize_title(sub.get('title')), set()).add(sub['id'])
+
+    def _unindex(self, sub):
+        self._likers.pop(sub['id'], None)
+        ids = self._titles.get(normalize_title(sub.get('title')))
+        if ids is not None:
+            ids.discard(sub['id'])
+            if not ids:
+                del self._titles[normalize_title(sub.get('title'))]
+
+    def _find(self, sub_id):
+        sub = self.pending.get(sub_id)
+        return sub if sub is not None else self.approved.get(sub_id)
+
+    def _add_deleted(self, entry):
+        if entry not in self.deleted:
+            self.deleted.append(entry)
+            if len(self.deleted) > DELETED_HISTORY:
+                del self.deleted[:-DELETED_HISTORY]
+
+    def _apply(self, event):
+        """Apply one event to the in-memory state (must be deterministic)."""
+        kind = event['type']
+        if kind == 'submit':
+            for sub in event['submissions']:
+                self.pending[sub['id']] = sub
+                self._index(sub)
+        elif kind == 'like':
+            sub = self._find(event['id'])
+            likers = self._likers.get(event['id'])
+            if sub is not None and event['ip'] not in likers:
+                likers.add(event['ip'])
+                sub.setdefault('likedBy', []).append(event['ip'])
+                sub['likes'] = sub.get('likes', 0) + 1
+        elif kind == 'approve':
+            sub = self.pending.pop(event['id'], None)
+            if sub is not None:
+                sub['status'] = 'approved'
+                sub['approvedAt'] = event['at']
+                self.approved[sub['id']] = sub
+        elif kind == 'reject':
+            sub = self.pending.pop(event['id'], None)
+            if sub is not None:
+                self._unindex(sub)
+        elif kind == 'delete':
+            title = event['title']
+            for sub_id in list(self._titles.get(title, ())):
+                sub = self.pending.pop(sub_id, None) or self.approved.pop(sub_id, None)
+                if sub is not None:
+                    self._unindex(sub)
+            self._add_deleted(title)
+        elif kind == 'track_deletion':
+            self._add_deleted(event['title'])
+        elif kind == 'dedupe':
+            for sub_id in event['ids']:
+                sub = self.approved.pop(sub_id, None)
+                if sub is not None:
+                    self._unindex(sub)
+                    self._add_deleted(sub_id)
+        self.seq = event['seq']
+
+    # -- persistence ---------------------------------------------------------
+
+    def _stat_token(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load_snapshot(self):
+        self._reset()
+        token = self._stat_token(self.snapshot_path)
+        if token is not None:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snap = json.load(f)
+            self.gen = snap['gen']
+            self.seq = self.snapshot_seq = snap['seq']
+            for sub in snap['pending']:
+                self.pending[sub['id']] = sub
+                self._index(sub)
+            for sub in snap['approved']:
+                self.approved[sub['id']] = sub
+                self._index(sub)
+            self.deleted = list(snap['deleted'])
+        self._snapshot_token = token
+
+    def _catch_up(self):
+        """Apply events appended by other processes (reloading after a compaction)."""
+        if self._stat_token(self.snapshot_path) != self._snapshot_token:
+            self._load_snapshot()
+        try:
+            size = os.path.getsize(self._log_path())
+        except OSError:
+            return
+        if size <= self._log_offset:
+            return
+        with open(self._log_path(), 'rb') as f:
+            f.seek(self._log_offset)
+            chunk = f.read(size - self._log_offset)
+        consumed = 0
+        for line in chunk.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break  # torn trailing write from a crashed writer; ignored
+            consumed += len(line)
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('seq', 0) > self.seq:
+                self._apply(event)
+        self._log_offset += consumed
+
+    def _append(self, event):
+        event['seq'] = self.seq + 1
+        event['ts'] = _now_iso()
+        data = (json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with open(self._log_path(), 'ab') as f:
+            if f.tell() != self._log_offset:
+                # Drop a torn tail so the new event starts on its own line
+                f.truncate(self._log_offset)
+            f.write(data)
+            f.flush()
+        self._log_offset += len(data)
+        self._apply(event)
+        if self.seq - self.snapshot_seq >= SNAPSHOT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        """Write a snapshot and start a new, empty log generation."""
+        old_log = self._log_path()
+        snap = {
+            'gen': self.gen + 1,
+            'seq': self.seq,
+            'pending': list(self.pending.values()),
+            'approved': list(self.approved.values()),
+            'deleted': self.deleted,
+        }
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.snapshot_path)
+        self.gen += 1
+        self.snapshot_seq = self.seq
+        self._log_offset = 0
+        self._snapshot_token = self._stat_token(self.snapshot_path)
+        try:
+            os.remove(old_log)
+        except OSError:
+            pass
+
+    def _write(self, build_event):
+        """Run build_event() against fresh state under the write lock and append its event."""
+        fd = self._lock.acquire(exclusive=True)
+        try:
+            self._catch_up()
+            event, result = build_event()
+            if event is not None:
+                self._append(event)
+            return result
+        finally:
+            self._lock.release(fd)
+
+    def _read(self, fn):
+        fd = self._lock.acquire(exclusive=False)
+        try:
+            self._catch_up()
+            return fn()
+        finally:
+            self._lock.release(fd)
+
+    def _seed(self, document):
+        """Import an existing community_data.json document as the first events."""
+        subs = list(reversed(document.get('submissions') or []))
+        if subs:
+            self._append({'type': 'submit', 'submissions': subs})
+        approved = list(reversed(document.get('approved') or []))
+        if approved:
+            self._append({'type': 'submit', 'submissions': approved})
+            for sub in approved:
+                self._append({'type': 'approve', 'id': sub['id'], 'at': sub.get('approvedAt') or _now_iso()})
+        for title in document.get('deleted') or []:
+            self._append({'type': 'track_deletion', 'title': title})
+
+    # -- public API ----------------------------------------------------------
+
+    @staticmethod
+    def public(sub):
+        """Submission as returned to clients (the liker IP list stays server-side)."""
+        return {k: v for k, v in sub.items() if k != 'likedBy'}
+
+    def page(self, status, offset=0, limit=20):
+        """Return newest-first submissions with the given status, paginated."""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+
+        def read():
+            pool = self.approved if status == 'approved' else self.pending
+            items = []
+            for i, sub in enumerate(reversed(pool.values())):
+                if i >= offset + limit:
+                    break
+                if i >= offset:
+                    items.append(self.public(sub))
+            return {'items': items, 'total': len(pool), 'offset': offset, 'limit': limit}
+
+        return self._read(read)
+
+    def get(self, sub_id):
+        sub = self._read(lambda: self._find(sub_id))
+        if sub is None:
+            raise CommunityError('Submission not found.', 404)
+        return self.public(sub)
+
+    def stats(self):
+        return self._read(lambda: {
+            'pending': len(self.pending),
+            'approved': len(self.approved),
+            'deleted': len(self.deleted),
+            'seq': self.seq,
+        })
+
+    def deleted_items(self):
+        return self._read(lambda: list(self.deleted))
+
+    def document(self):
+        """Full state in the community_data.json shape (newest first), for sync clients."""
+        return self._read(lambda: {
+            'submissions': [self.public(s) for s in reversed(self.pending.values())],
+            'approved': [self.public(s) for s in reversed(self.approved.values())],
+            'deleted': list(self.deleted),
+            'seq': self.seq,
+        })
+
+    def submit(self, items, user_name, user_ip):
+        """Add one or more infographics to the pending pool; returns their ids."""
+        user_name = sanitize_input(user_name)
+        if not user_name:
+            raise CommunityError('Please provide your name.')
+        if not items:
+            raise CommunityError('No infographics provided.')
+
+        now = _now_iso()
+        subs = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise CommunityError('Each infographic must be a JSON object.')
+            data = item.get('data') or item
+            subs.append({
+                'id': _submission_id(),
+                'userName': user_name,
+                'title': item.get('title') or data.get('title') or 'Untitled Infographic',
+                'summary': item.get('summary') or data.get('summary') or '',
+                'chapterId': item.get('chapterId') or data.get('chapterId') or 'uncategorized',
+                'submittedAt': now,
+                'userIP': user_ip,
+                'likes': 0,
+                'likedBy': [],
+                'status': 'pending',
+                'data': data,
+            })
+        return self._write(lambda: ({'type': 'submit', 'submissions': subs}, [s['id'] for s in subs]))
+
+    def like(self, sub_id, user_ip):
+        def build():
+            sub = self._find(sub_id)
+            if sub is None:
+                raise CommunityError('Submission not found.', 404)
+            if user_ip in self._likers[sub_id]:
+                raise CommunityError('You have already liked this.', 409)
+            return {'type': 'like', 'id': sub_id, 'ip': user_ip}, sub.get('likes', 0) + 1
+
+        return self._write(build)
+
+    def approve(self, sub_id):
+        def build():
+            if sub_id not in self.pending:
+                raise CommunityError('Submission not found.', 404)
+            return {'type': 'approve', 'id': sub_id, 'at': _now_iso()}, None
+        self._write(build)
+
+    def reject(self, sub_id):
+        def build():
+            if sub_id not in self.pending:
+                raise CommunityError('Submission not found.', 404)
+            return {'type': 'reject', 'id': sub_id}, None
+        self._write(build)
+
+    def remove_from_all_pools(self, title):
+        """Delete every submission with this (normalized) title and remember the deletion."""
+        norm = normalize_title(title)
+        if not norm:
+            raise CommunityError('Title required.')
+
+        def build():
+            ids = self._titles.get(norm, ())
+            removed = {
+                'pending': sum(1 for i in ids if i in self.pending),
+                'approved': sum(1 for i in ids if i in self.approved),
+            }
+            return {'type': 'delete', 'title': norm}, removed
+
+        return self._write(build)
+
+    def track_deletion(self, normalized_title):
+        def build():
+            if not normalized_title or normalized_title in self.deleted:
+                return None, None
+            return {'type': 'track_deletion', 'title': normalized_title}, None
+        self._write(build)
+
+    def dedupe_approved(self):
+        """Drop approved submissions whose normalized title is shared with a newer one.
+
+        The newest copy of each title is kept, as in the client's dedupe.
+        """
+        def build():
+            seen = set()
+            duplicates = []
+            for sub in reversed(self.approved.values()):  # newest first, like the client
+                norm = normalize_title(sub.get('title'))
+                if norm and norm in seen:
+                    duplicates.append(sub['id'])
+                else:
+                    seen.add(norm)
+            if not duplicates:
+                return None, 0
+            return {'type': 'dedupe', 'ids': duplicates}, len(duplicates)
+
+        return self._write(build)
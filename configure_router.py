@@ -1,8 +1,36 @@
+"""
+Forward the server ports on the home router via UPnP IGD.
+
+Usage:
+    python configure_router.py               # map ports 80 and 443 permanently, verify them
+    python configure_router.py --keep-alive  # ...with renewed finite leases instead
+
+A plain run asks for permanent (lease 0) mappings, so nothing has to keep
+running. Routers that refuse permanent leases get LEASE_DURATION instead;
+those mappings expire unless --keep-alive renews them.
+"""
+
 import socket
+import sys
+import threading
+import time
 import urllib.request
 import urllib.parse
 import xml.etree.ElementTree as ET
 import re
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+# Mappings requested in one round: (external port, internal port, protocol)
+PORT_MAPPINGS = [(80, 80, 'TCP'), (443, 443, 'TCP')]  # ophthalmics.py serves HTTP and HTTPS
+LEASE_DURATION = 3600       # seconds; with --keep-alive, or when a router refuses permanent (0) leases
+RENEW_FRACTION = 0.5        # renew when this fraction of the lease has passed
+PERMANENT_CHECK_INTERVAL = 600  # seconds between checks of permanent (0-lease) mappings
+RETRY_INTERVAL = 60         # seconds before retrying a mapping that failed
+SOAP_TIMEOUT = 5            # seconds per SOAP request
+MAPPING_DESCRIPTION = 'OphthalmicsServer'
+UPNP_ONLY_PERMANENT_LEASES = '725'  # OnlyPermanentLeasesSupported
+UPNP_CONFLICT = '718'               # ConflictInMappingEntry: another host holds the port
 
 def get_all_local_ips():
     """Return all local IPv4 addresses."""
@@ -119,43 +147,178 @@ def get_control_url(description_url):
     
     return None, None
 
-def add_port_mapping(control_url, service_type, external_port, internal_client, internal_port, protocol='TCP'):
-    """Send SOAP request to add port mapping."""
-    print(f"[*] Attempting to forward External:{external_port} -> {internal_client}:{internal_port} ({protocol})")
-    
+class SoapError(Exception):
+    """A UPnP action failed; code is the UPnP errorCode (e.g. '714', '725') if the router sent one."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+def soap_request(control_url, service_type, action, arguments):
+    """Invoke a UPnP action and return its response arguments as a dict."""
+    args_xml = ''.join(f"<{name}>{escape(str(value))}</{name}>" for name, value in arguments)
     soap_body = f"""<?xml version="1.0"?>
 <s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
 <s:Body>
-<u:AddPortMapping xmlns:u="{service_type}">
-<NewRemoteHost></NewRemoteHost>
-<NewExternalPort>{external_port}</NewExternalPort>
-<NewProtocol>{protocol}</NewProtocol>
-<NewInternalPort>{internal_port}</NewInternalPort>
-<NewInternalClient>{internal_client}</NewInternalClient>
-<NewEnabled>1</NewEnabled>
-<NewPortMappingDescription>OphthalmicsServer</NewPortMappingDescription>
-<NewLeaseDuration>0</NewLeaseDuration>
-</u:AddPortMapping>
+<u:{action} xmlns:u="{service_type}">{args_xml}</u:{action}>
 </s:Body>
 </s:Envelope>"""
 
     headers = {
         'Content-Type': 'text/xml',
-        'SOAPAction': f'"{service_type}#AddPortMapping"'
+        'SOAPAction': f'"{service_type}#{action}"'
     }
-    
+
+    req = urllib.request.Request(control_url, data=soap_body.encode(), headers=headers)
     try:
-        req = urllib.request.Request(control_url, data=soap_body.encode(), headers=headers)
-        urllib.request.urlopen(req)
-        print("    [+] Port mapping added successfully!")
-        return True
+        with urllib.request.urlopen(req, timeout=SOAP_TIMEOUT) as response:
+            xml_content = response.read()
     except urllib.error.HTTPError as e:
-        print(f"    [!] SOAP Request failed: {e.code} {e.reason}")
-        print(f"    [!] Response: {e.read().decode()}")
-        return False
-    except Exception as e:
-        print(f"    [!] Error adding port mapping: {e}")
-        return False
+        body = e.read().decode(errors='replace')
+        code = re.search(r'<errorCode>\s*(\d+)\s*</errorCode>', body)
+        description = re.search(r'<errorDescription>(.*?)</errorDescription>', body, re.S)
+        detail = description.group(1).strip() if description else f"{e.code} {e.reason}"
+        raise SoapError(f"{action} failed: {detail}", code.group(1) if code else None) from None
+    except (urllib.error.URLError, OSError) as e:
+        raise SoapError(f"{action} failed: {e}") from None
+
+    # Response arguments are the children of <u:{action}Response>, whatever their namespace
+    result = {}
+    try:
+        for element in ET.fromstring(xml_content).iter():
+            if element.tag.endswith(f"{action}Response"):
+                for child in element:
+                    result[child.tag.rsplit('}', 1)[-1]] = (child.text or '').strip()
+    except ET.ParseError as e:
+        raise SoapError(f"{action}: invalid response ({e})") from None
+    return result
+
+def add_port_mapping(control_url, service_type, external_port, internal_client, internal_port,
+                     protocol='TCP', lease_duration=LEASE_DURATION):
+    """Send SOAP request to add port mapping. Returns the lease actually granted (0 = permanent)."""
+    print(f"[*] Attempting to forward External:{external_port} -> {internal_client}:{internal_port} ({protocol})")
+
+    def request(lease):
+        soap_request(control_url, service_type, 'AddPortMapping', [
+            ('NewRemoteHost', ''),
+            ('NewExternalPort', external_port),
+            ('NewProtocol', protocol),
+            ('NewInternalPort', internal_port),
+            ('NewInternalClient', internal_client),
+            ('NewEnabled', 1),
+            ('NewPortMappingDescription', MAPPING_DESCRIPTION),
+            ('NewLeaseDuration', lease),
+        ])
+        return lease
+
+    try:
+        return request(lease_duration)
+    except SoapError as e:
+        if lease_duration == 0 and e.code is not None and e.code != UPNP_CONFLICT:
+            # Routers report a refused permanent lease with various codes (402, 501, 724, ...)
+            print(f"    [*] Router refused a permanent lease for {external_port}/{protocol} ({e}); "
+                  f"retrying with lease {LEASE_DURATION}s")
+            return request(LEASE_DURATION)
+        if e.code != UPNP_ONLY_PERMANENT_LEASES or lease_duration == 0:
+            raise
+        print(f"    [*] Router only supports permanent leases for {external_port}/{protocol}; retrying with lease 0")
+        return request(0)
+
+def get_port_mapping(control_url, service_type, external_port, protocol='TCP'):
+    """Return the router's entry for external_port/protocol (GetSpecificPortMappingEntry), or None."""
+    try:
+        return soap_request(control_url, service_type, 'GetSpecificPortMappingEntry', [
+            ('NewRemoteHost', ''),
+            ('NewExternalPort', external_port),
+            ('NewProtocol', protocol),
+        ])
+    except SoapError as e:
+        if e.code == '714':  # NoSuchEntryInArray
+            return None
+        raise
+
+class PortMappingManager:
+    """Adds several port mappings at once, verifies them and keeps their leases renewed.
+
+    apply() submits every AddPortMapping concurrently, then reads each entry
+    back with GetSpecificPortMappingEntry. start_renewal() runs a background
+    scheduler that renews each finite lease after RENEW_FRACTION of it has
+    passed, re-checks permanent mappings every PERMANENT_CHECK_INTERVAL and
+    retries failed ones every RETRY_INTERVAL.
+    """
+
+    def __init__(self, control_url, service_type, internal_client, mappings=None,
+                 lease_duration=LEASE_DURATION):
+        self.control_url = control_url
+        self.service_type = service_type
+        self.internal_client = internal_client
+        self.mappings = list(mappings or PORT_MAPPINGS)
+        self.lease_duration = lease_duration
+        self.status = {}     # (external port, protocol) -> {'ok', 'lease', 'due', 'error'}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _map_one(self, mapping):
+        """Add and verify one mapping; returns its status record."""
+        external_port, internal_port, protocol = mapping
+        try:
+            lease = add_port_mapping(self.control_url, self.service_type, external_port,
+                                     self.internal_client, internal_port, protocol, self.lease_duration)
+            entry = get_port_mapping(self.control_url, self.service_type, external_port, protocol)
+            if entry is None:
+                raise SoapError("mapping not found after adding it")
+            if (entry.get('NewInternalClient') != self.internal_client
+                    or str(entry.get('NewInternalPort')) != str(internal_port)):
+                raise SoapError(f"router maps it to {entry.get('NewInternalClient')}:{entry.get('NewInternalPort')}")
+            if entry.get('NewEnabled', '1') not in ('1', 'true'):
+                raise SoapError("mapping exists but is disabled")
+            try:
+                lease = int(entry.get('NewLeaseDuration', lease))  # remaining lease as reported by the router
+            except ValueError:
+                pass
+            interval = lease * RENEW_FRACTION if lease else PERMANENT_CHECK_INTERVAL
+            return {'ok': True, 'lease': lease, 'due': time.monotonic() + interval, 'error': None}
+        except SoapError as e:
+            return {'ok': False, 'lease': None, 'due': time.monotonic() + RETRY_INTERVAL, 'error': str(e)}
+
+    def apply(self, mappings=None):
+        """Add and verify mappings concurrently (all by default). Returns True if all are in place."""
+        mappings = self.mappings if mappings is None else mappings
+        if not mappings:
+            return True
+        with ThreadPoolExecutor(max_workers=len(mappings)) as pool:
+            results = list(pool.map(self._map_one, mappings))
+        for (external_port, internal_port, protocol), record in zip(mappings, results):
+            self.status[(external_port, protocol)] = record
+            if record['ok']:
+                lease = f"lease {record['lease']}s" if record['lease'] else "permanent"
+                print(f"    [+] Verified External:{external_port} -> {self.internal_client}:{internal_port} ({protocol}, {lease})")
+            else:
+                print(f"    [!] External:{external_port}/{protocol} not mapped: {record['error']}")
+        return all(record['ok'] for record in results)
+
+    def _due(self):
+        now = time.monotonic()
+        return [m for m in self.mappings if self.status.get((m[0], m[2]), {'due': 0})['due'] <= now]
+
+    def _run(self):
+        while not self._stop.is_set():
+            due = self._due()
+            if due:
+                print(f"[*] Renewing {len(due)} port mapping(s)...")
+                self.apply(due)
+            next_due = min((record['due'] for record in self.status.values()), default=time.monotonic() + RETRY_INTERVAL)
+            self._stop.wait(max(1.0, next_due - time.monotonic()))
+
+    def start_renewal(self):
+        """Renew leases from a daemon thread until stop() is called."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="upnp-renewal", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
 
 def get_local_ip(target_ip):
     """Get local IP used to reach the gateway."""
@@ -197,13 +360,31 @@ def main():
     
     print(f"[*] Local IP detected: {local_ip}")
 
-    # 4. Add Mapping
-    success = add_port_mapping(control_url, service_type, 80, local_ip, 80, 'TCP')
+    # 4. Add and verify all mappings in one concurrent round
+    keep_alive = '--keep-alive' in sys.argv
+    manager = PortMappingManager(control_url, service_type, local_ip,
+                                 lease_duration=LEASE_DURATION if keep_alive else 0)
+    success = manager.apply()
     
     if not success:
-        print("\n[!] Automatic configuration failed.")
+        print("\n[!] Automatic configuration failed for some ports.")
         print("    This often happens if the ISP router has UPnP disabled or restricted.")
         print("    You may need to manually configure Port Forwarding in the specific web interface.")
 
+    # 5. Keep leases alive (finite leases expire unless renewed)
+    if keep_alive:
+        print(f"[*] Renewing leases in the background (lease {LEASE_DURATION}s). Press Ctrl+C to stop.")
+        manager.start_renewal()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            manager.stop()
+    else:
+        finite = [port for (port, _), record in manager.status.items() if record['ok'] and record['lease']]
+        if finite:
+            print(f"[!] The router only granted finite leases for port(s) {', '.join(map(str, finite))}; "
+                  f"they expire unless renewed: run with --keep-alive.")
+
 if __name__ == "__main__":
     main()
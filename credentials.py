@@ -0,0 +1,108 @@
+"""
+Cached credential provider.
+
+A CachedSecret resolves a value from a chain of sources (e.g. the macOS
+Keychain helper script, then a local config file) and keeps it in memory.
+Request threads only read the cached value; resolving runs on a background
+thread, so a slow source (a subprocess with a timeout) never holds up a
+request:
+    - after `ttl` seconds, or as soon as a watched file's mtime changes,
+      the cached value is still returned once more and a refresh is started
+      in the background (stale-while-revalidate)
+    - a lookup with nothing resolved yet (or after invalidate()) returns
+      None at once and starts the resolution
+    - prime(), called at startup, is the only call that waits (at most
+      `wait` seconds) for the initial resolution
+
+Usage:
+    API_KEY = CachedSecret([read_from_keychain, read_from_file],
+                           ttl=300, watch_paths=['config/api-key.local'])
+    API_KEY.prime()       # at startup
+    key = API_KEY.get()   # str, or None if no source has a value (yet)
+"""
+
+import os
+import threading
+import time
+
+DEFAULT_TTL = 300     # seconds before a background refresh
+DEFAULT_WAIT = 6      # seconds prime() waits for the initial resolution
+
+
+class CachedSecret:
+    """A secret resolved by the first source that returns a value, cached with a TTL."""
+
+    def __init__(self, sources, ttl=DEFAULT_TTL, watch_paths=(), wait=DEFAULT_WAIT):
+        self.sources = list(sources)
+        self.ttl = ttl
+        self.watch_paths = [os.fspath(p) for p in watch_paths]
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._value = None
+        self._resolved_at = None     # monotonic time of the last resolution
+        self._mtimes = None          # watched mtimes seen by the last resolution
+        self._refreshing = None      # Event set when the running refresh finishes
+
+    def _watched_mtimes(self):
+        mtimes = []
+        for path in self.watch_paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _resolve(self):
+        for source in self.sources:
+            try:
+                value = source()
+            except Exception as e:
+                print(f"[credentials] {getattr(source, '__name__', source)} failed: {e}")
+                continue
+            if value:
+                return value
+        return None
+
+    def _refresh(self, done):
+        mtimes = self._watched_mtimes()
+        value = self._resolve()
+        with self._lock:
+            self._value = value
+            self._resolved_at = time.monotonic()
+            self._mtimes = mtimes
+            self._refreshing = None
+        done.set()
+
+    def refresh(self):
+        """Start a background refresh (unless one is running); returns its completion Event."""
+        with self._lock:
+            if self._pid != os.getpid():  # forked worker: a refresh running in the parent is not ours
+                self._pid = os.getpid()
+                self._refreshing = None
+            if self._refreshing is None:
+                self._refreshing = threading.Event()
+                threading.Thread(target=self._refresh, args=(self._refreshing,),
+                                 name="credential-refresh", daemon=True).start()
+            return self._refreshing
+
+    def prime(self):
+        """Resolve at startup: start the resolution and wait up to `wait` seconds. True if it finished."""
+        return self.refresh().wait(self.wait)
+
+    def invalidate(self):
+        """Drop the cached value; the next get() returns None and re-resolves it in the background."""
+        with self._lock:
+            self._value = None
+            self._resolved_at = None
+
+    def get(self):
+        """Return the cached value (None if unavailable), refreshing it as described above."""
+        with self._lock:
+            value = self._value
+            due = (self._resolved_at is None
+                   or time.monotonic() - self._resolved_at > self.ttl
+                   or self._mtimes != self._watched_mtimes())
+        if due:
+            self.refresh()
+        return value
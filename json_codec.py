@@ -0,0 +1,137 @@
+"""
+JSON codec with optional fast backends.
+
+Decoding uses the fastest installed library of orjson, simdjson (pysimdjson)
+and ujson, else the stdlib. Encoding uses orjson when installed, else the
+stdlib. ujson and simdjson are not used for encoding because their number
+formatting and indentation differ from the stdlib's.
+
+dumps() always returns the same bytes as the stdlib call it replaces:
+    dumps(obj)            == json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+    dumps(obj, indent=2)  == json.dumps(obj, ensure_ascii=False, indent=2).encode()
+(and likewise with sort_keys=True).
+The fast encoder's result is checked for the one formatting difference that
+can occur in library data, floats below 1e-4 or from 1e16 (orjson writes
+1e-7 and 0.00001 where the stdlib writes 1e-07 and 1e-05). If such a float
+might be present, the object is re-encoded with the stdlib. The same happens for anything orjson cannot
+encode (non-string keys, integers beyond 64 bits). NaN and Infinity are not
+valid JSON; orjson writes them as null.
+
+Set OPHTHALMICS_JSON=stdlib to force the stdlib (e.g. to compare outputs).
+
+Usage:
+    from json_codec import dumps, loads
+    body = dumps(items)              # bytes
+    item = loads(path.read_bytes())
+"""
+
+import json
+import os
+import re
+
+_FORCE_STDLIB = os.environ.get('OPHTHALMICS_JSON', '').lower() == 'stdlib'
+
+_orjson = None
+if not _FORCE_STDLIB:
+    try:
+        import orjson as _orjson
+    except ImportError:
+        _orjson = None
+
+# orjson formats some floats differently from the stdlib: exponents (1e-7 vs 1e-07,
+# 1e16 vs 1e+16) and magnitudes in [1e-5, 1e-4) (0.00001 vs 1e-05). The hints are
+# cheap scans for candidates (kept separate: an alternation defeats the regex
+# engine's literal search); _FLOAT_RE checks that a candidate is a number token.
+# Text inside strings can still match (e.g. " 2e5,"); that only costs a stdlib re-encode.
+_FLOAT_HINTS = (re.compile(rb'e-?\d'), re.compile(rb'0\.0000'))
+_FLOAT_RE = re.compile(rb'(?:^|[\[:,\s])-?(?:\d+(?:\.\d+)?e-?\d+|0\.0000\d+)(?=[,\]}\s]|$)')
+_MAX_NUMBER_PREFIX = 32  # longer than any float repr before its exponent
+
+
+def _may_differ(data):
+    """True if orjson output contains a float the stdlib would format differently."""
+    for hints in _FLOAT_HINTS:
+        for hint in hints.finditer(data):
+            start = max(0, hint.start() - _MAX_NUMBER_PREFIX)
+            if _FLOAT_RE.search(data[start:hint.end() + _MAX_NUMBER_PREFIX]):
+                return True
+    return False
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _pick_loads():
+    if _FORCE_STDLIB:
+        return 'json', _stdlib_loads
+    if _orjson is not None:
+        return 'orjson', _orjson.loads
+    try:
+        import simdjson
+        parser = simdjson.Parser()
+
+        def simdjson_loads(data):
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            # parse() returns lazy proxies; as_* copies them into plain Python objects
+            doc = parser.parse(data)
+            if isinstance(doc, simdjson.Object):
+                return doc.as_dict()
+            if isinstance(doc, simdjson.Array):
+                return doc.as_list()
+            return doc
+        return 'simdjson', simdjson_loads
+    except ImportError:
+        pass
+    try:
+        import ujson
+        return 'ujson', ujson.loads
+    except ImportError:
+        pass
+    return 'json', _stdlib_loads
+
+
+LOADS_BACKEND, _fast_loads = _pick_loads()
+DUMPS_BACKEND = 'orjson' if _orjson is not None else 'json'
+
+
+def loads(data):
+    """Decode JSON from bytes or str. Falls back to the stdlib for input a fast backend rejects."""
+    try:
+        return _fast_loads(data)
+    except (ValueError, TypeError, RuntimeError):
+        if _fast_loads is _stdlib_loads:
+            raise
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj, indent, sort_keys):
+    if indent is None:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=indent, sort_keys=sort_keys).encode('utf-8')
+
+
+def dumps(obj, indent=None, sort_keys=False):
+    """Encode obj as UTF-8 JSON bytes: compact, or pretty-printed with indent=2."""
+    if _orjson is not None and indent in (None, 2):
+        option = (_orjson.OPT_INDENT_2 if indent else 0) | (_orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            data = _orjson.dumps(obj, option=option)
+        except TypeError:
+            return _stdlib_dumps(obj, indent, sort_keys)
+        if not _may_differ(data):
+            return data
+    return _stdlib_dumps(obj, indent, sort_keys)
+
+
+def load_file(path):
+    """Decode a JSON file."""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def dump_file(path, obj, indent=None):
+    """Encode obj into a JSON file (same bytes as the stdlib with ensure_ascii=False)."""
+    with open(path, 'wb') as f:
+        f.write(dumps(obj, indent=indent))
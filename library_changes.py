@@ -0,0 +1,176 @@
+"""
+Library version and change log.
+
+The library is a folder of JSON files. Every time the set of files is
+compared with the last recorded state (by the server after a rescan, or by
+sync_to_github.py when it builds the index), added or edited items become
+"upsert" entries and removed items "delete" entries, all stamped with the
+next library version. Clients remember the version they have and ask only
+for the entries after it, so a refresh costs bytes proportional to the edits.
+
+The state lives in a JSON file inside the library folder it describes, so
+there is one log per folder: ophthalmics.py keeps the one in
+APP_PATH/library (shared by its worker processes) and sync_to_github.py the
+one next to the script. They are the same log only when the server runs
+from the repository checkout. The file is server state, not content, and is
+kept out of git:
+    {"version": N, "floor": F, "origin": random id of this log,
+     "state": {filename: [digest, id]},
+     "log": [{"version", "op", "id", "file"}, ...]}
+
+Only the last CHANGE_LOG_LIMIT entries are kept. A client whose version is
+below "floor" (entries it would need were dropped) must reload everything.
+
+Versions only count within one log, and a fresh checkout (the Pages build)
+starts a new one at version 1 every time. The static feed therefore also
+names its log ("origin") and the item set it describes ("identity", a
+digest of the item digests). A client with the same identity is up to
+date; one with another origin must reload everything.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from json_codec import dumps as json_dumps
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+CHANGES_FILE = ".changes"   # inside the library folder (not *.json, so never read as an item)
+CHANGE_LOG_LIMIT = 1000     # entries kept; older clients are told to reload
+DIGEST_LENGTH = 16
+
+
+def digest_encoded(encoded):
+    """Content digest of an item's JSON encoding (bytes from json_codec.dumps(item))."""
+    return hashlib.sha256(encoded).hexdigest()[:DIGEST_LENGTH]
+
+
+def item_digest(item):
+    """Content digest of a parsed item; equal to digest_encoded(json_codec.dumps(item))."""
+    return digest_encoded(json_dumps(item))
+
+
+def library_identity(digests):
+    """Digest of a set of item digests: equal for libraries with the same items, whatever their log."""
+    return hashlib.sha256("\n".join(sorted(digests)).encode("ascii")).hexdigest()[:DIGEST_LENGTH]
+
+
+def latest_per_id(entries):
+    """Keep only the last entry per item id (entries must be in version order)."""
+    latest = {}
+    for entry in entries:
+        latest.pop(json.dumps(entry['id']), None)
+        latest[json.dumps(entry['id'])] = entry
+    return list(latest.values())
+
+
+class ChangeLog:
+    """Versioned change log of a library folder (see module docstring)."""
+
+    def __init__(self, library_dir, limit=CHANGE_LOG_LIMIT):
+        self.path = os.path.join(library_dir, CHANGES_FILE)
+        self.limit = limit
+        self._thread_lock = threading.Lock()
+        self._cached = None   # (stat token, document)
+
+    def _token(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        token = self._token()
+        cached = self._cached
+        if cached is not None and cached[0] == token:
+            return cached[1]
+        doc = {"version": 0, "floor": 0, "state": {}, "log": []}
+        if token is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    doc.update(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                pass
+        self._cached = (token, doc)
+        return doc
+
+    def _write(self, doc):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self._cached = (self._token(), doc)
+
+    @property
+    def version(self):
+        with self._thread_lock:
+            return self._read()["version"]
+
+    def update(self, current):
+        """Record the difference between the library and the last state.
+
+        current maps filename -> (digest, id). Returns the library version,
+        which only grows when something changed.
+        """
+        with self._thread_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = None
+            if fcntl is not None:
+                fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                doc = self._read()
+                state = doc["state"]
+                version = doc["version"] + 1
+                entries = []
+                for name, (digest, item_id) in current.items():
+                    known = state.get(name)
+                    if known is None or known[0] != digest:
+                        entries.append({"version": version, "op": "upsert", "id": item_id, "file": name})
+                upserted = {json.dumps(e["id"]) for e in entries}
+                for name, (_, item_id) in state.items():
+                    # A renamed file is an upsert of the same id, not a delete
+                    if name not in current and json.dumps(item_id) not in upserted:
+                        entries.append({"version": version, "op": "delete", "id": item_id, "file": name})
+                if not entries:
+                    return doc["version"]
+
+                log = doc["log"] + entries
+                floor = doc["floor"]
+                if len(log) > self.limit:
+                    floor = log[-self.limit - 1]["version"]
+                    log = log[-self.limit:]
+                self._write({
+                    "version": version,
+                    "floor": floor,
+                    "origin": doc.get("origin") or os.urandom(8).hex(),
+                    "state": {name: [digest, item_id] for name, (digest, item_id) in current.items()},
+                    "log": log,
+                })
+                return version
+            finally:
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+
+    def since(self, version):
+        """Return (library version, entries after `version`, one per id) or (version, None) to reload."""
+        with self._thread_lock:
+            doc = self._read()
+        if version < doc["floor"] or version > doc["version"]:
+            return doc["version"], None
+        return doc["version"], latest_per_id(e for e in doc["log"] if e["version"] > version)
+
+    def feed(self):
+        """The whole retained log as a static document (for hosts without the API)."""
+        with self._thread_lock:
+            doc = self._read()
+        return {"version": doc["version"], "floor": doc["floor"], "origin": doc.get("origin"),
+                "identity": library_identity(digest for digest, _ in doc["state"].values()),
+                "changes": latest_per_id(doc["log"])}
@@ -0,0 +1,100 @@
+"""
+Per-item analytics and per-chapter facets of the library.
+
+Computed in one pass over the items, so dashboards and filters can show
+counts without loading any infographic bodies:
+    items     id -> title, chapter, date, section-type histogram, word count,
+              reading time, table/mindmap counts and encoded size
+    chapters  chapterId -> the same counts summed over its items
+    totals    the same counts over the whole library
+
+sync_to_github.py writes the document to library-facets.json; ophthalmics.py
+serves it (computed from its own library cache) at /api/library/facets.
+"""
+
+import math
+import re
+
+from json_codec import dumps as json_dumps
+
+WORDS_PER_MINUTE = 200
+WORD_RE = re.compile(r"\w+(?:['’-]\w+)*")
+
+COUNTED_FIELDS = ('items', 'sections', 'words', 'reading_minutes', 'tables', 'mindmaps', 'bytes')
+
+
+def _count_words(value):
+    """Words in every string of a (nested) value."""
+    if isinstance(value, str):
+        return len(WORD_RE.findall(value))
+    if isinstance(value, list):
+        return sum(_count_words(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_count_words(v) for v in value.values())
+    return 0
+
+
+def item_chapter(item):
+    data = item.get('data') if isinstance(item.get('data'), dict) else {}
+    return item.get('chapterId') or data.get('chapterId') or 'uncategorized'
+
+
+def item_analytics(item, size=None):
+    """Derived metadata of one item. size defaults to its compact UTF-8 JSON encoding."""
+    data = item.get('data') if isinstance(item.get('data'), dict) else {}
+    sections = data.get('sections') or []
+    if isinstance(sections, dict):
+        sections = list(sections.values())
+
+    histogram = {}
+    words = _count_words(item.get('title', '')) + _count_words(item.get('summary', ''))
+    for section in sections:
+        if not isinstance(section, dict):
+            continue
+        kind = section.get('type') or 'plain_text'
+        histogram[kind] = histogram.get(kind, 0) + 1
+        words += _count_words(section.get('title', '')) + _count_words(section.get('content', ''))
+
+    if size is None:
+        size = len(json_dumps(item))
+    return {
+        'title': item.get('title', ''),
+        'chapterId': item_chapter(item),
+        'date': item.get('date', ''),
+        'sections': sum(histogram.values()),
+        'section_types': histogram,
+        'words': words,
+        'reading_minutes': max(1, math.ceil(words / WORDS_PER_MINUTE)) if words else 0,
+        'tables': histogram.get('table', 0),
+        'mindmaps': histogram.get('mindmap', 0),
+        'bytes': size,
+    }
+
+
+def _empty_aggregate():
+    aggregate = {field: 0 for field in COUNTED_FIELDS}
+    aggregate['section_types'] = {}
+    return aggregate
+
+
+def _add(aggregate, analytics):
+    aggregate['items'] += 1
+    for field in COUNTED_FIELDS[1:]:
+        aggregate[field] += analytics[field]
+    types = aggregate['section_types']
+    for kind, count in analytics['section_types'].items():
+        types[kind] = types.get(kind, 0) + count
+
+
+def build_facets(analytics_by_id):
+    """Facets document from {id: item_analytics(...)} (ids are written as strings)."""
+    chapters = {}
+    totals = _empty_aggregate()
+    for analytics in analytics_by_id.values():
+        _add(chapters.setdefault(analytics['chapterId'], _empty_aggregate()), analytics)
+        _add(totals, analytics)
+    return {
+        'items': {str(item_id): analytics for item_id, analytics in analytics_by_id.items()},
+        'chapters': dict(sorted(chapters.items())),
+        'totals': totals,
+    }
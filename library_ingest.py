@@ -0,0 +1,168 @@
+"""
+Library item ingestion: validate an item once and store it in canonical form.
+
+Both ways into library/ use it: /api/library/upload in ophthalmics.py, and
+sync_to_github.py for files that were added or edited by hand. A canonical
+item passes the schema check and has every field the index relies on:
+    id         kept, else from the file name / the upload time (ms, like Date.now())
+    title      kept, else from the file name
+    date       kept, else the file's mtime / the upload time, fixed from then on
+    chapterId  kept, else data.chapterId, else detected from the title
+               (the rules of autoDetectChapterFromTitle in community-submissions.js)
+    seqId      kept, else the next free number (sync_to_github.py assigns these)
+A null optional field counts as missing (older clients write summary or
+seqId as null). Existing keys keep their order; missing ones are appended
+and null ones are filled in place. canonicalize() returns the item
+unchanged (and changed=False) when there is nothing to add, so a second
+pass never rewrites a file.
+
+Usage:
+    item, changed = canonicalize(raw, default_id=..., default_title=..., default_date=...)
+"""
+
+import hashlib
+import re
+
+UNCATEGORIZED = 'uncategorized'
+
+
+class ItemSchemaError(ValueError):
+    """The item does not match ITEM_SCHEMA."""
+
+
+# field -> (accepted types, required)
+ITEM_SCHEMA = {
+    'id': ((int, str), False),
+    'seqId': ((int,), False),
+    'title': ((str,), False),
+    'summary': ((str,), False),
+    'date': ((str,), False),
+    'chapterId': ((str,), False),
+    'data': ((dict,), True),
+}
+DATA_SCHEMA = {
+    'sections': ((list,), False),
+    'chapterId': ((str,), False),
+}
+
+# Same order as autoDetectChapterFromTitle: the first rule with a matching keyword wins
+CHAPTER_RULES = [
+    ('neuro', ['neuro', 'optic nerve', 'optic neuritis', 'papill', 'visual field', 'pupil', 'nystagmus', 'cranial nerve', 'chiasm', 'intracranial', 'iih', 'horner', 'anisocoria', 'gaze palsy', 'diplopia cranial', 'aion', 'naion', 'pion', 'lhon', 'myasthenia', 'giant cell', 'gca', 'temporal arteritis']),
+    ('glaucoma', ['glaucoma', 'iop', 'intraocular pressure', 'trabeculectomy', 'angle closure', 'poag', 'pacg', 'migs', 'tube shunt', 'filtering', 'rnfl', 'optic disc cupping', 'visual field glaucoma', 'pigmentary glaucoma', 'pseudoexfoliation', 'pxf', 'pex', 'ocular hypertension', 'oht', 'narrow angle']),
+    ('vitreoretinal', ['vitreous', 'retinal detachment', 'vitrectomy', 'macular hole', 'pvd', 'epiretinal membrane', 'erm', 'scleral buckle', 'rhegmatogenous', 'tractional', 'pvr', 'silicone oil', 'floaters', 'vitreous hemorrhage', 'retinoschisis']),
+    ('medical_retina', ['diabetic retinopathy', 'macular degeneration', 'amd', 'csr', 'cscr', 'retinal vein', 'retinal artery', 'macular edema', 'dme', 'cme', 'brvo', 'crvo', 'drusen', 'cnv', 'anti-vegf', 'intravitreal', 'wet amd', 'dry amd', 'geographic atrophy', 'central serous', 'rvo', 'crao', 'brao', 'retinitis pigmentosa', 'dystrophy retina']),
+    ('cornea', ['cornea', 'keratitis', 'keratoconus', 'corneal transplant', 'dsaek', 'dmek', 'pterygium', 'dry eye', 'fuchs', 'corneal dystrophy', 'corneal ulcer', 'herpetic', 'acanthamoeba', 'cross-linking', 'graft rejection', 'keratoplasty', 'pemhigoid', 'sjs', 'stevens-johnson', 'ocular surface']),
+    ('lens', ['cataract', 'lens', 'phaco', 'iol', 'posterior capsule', 'pco', 'yag capsulotomy', 'femtosecond', 'ectopia lentis', 'aphakia', 'pseudophakia', 'intraocular lens', 'biometry']),
+    ('uveitis', ['uveitis', 'iritis', 'iridocyclitis', 'choroiditis', 'panuveitis', 'hla-b27', 'behcet', 'sarcoid', 'vkh', 'birdshot', 'hypopyon', 'synechia', 'toxoplasm', 'cmv retinitis', 'pars planitis', 'scleritis', 'white dot']),
+    ('strabismus', ['strabismus', 'squint', 'esotropia', 'exotropia', 'hypertropia', 'diplopia', 'motility', 'extraocular', 'eom', 'binocular', 'amblyopia', 'cover test', 'duane', 'brown syndrome', 'lazy eye', 'hess chart', 'convergence']),
+    ('paediatric', ['paediatric', 'pediatric', 'child', 'congenital', 'rop', 'retinopathy of prematurity', 'leukocoria', 'retinoblastoma child', 'infantile', 'neonatal', 'buphthalmos', 'nldo', 'nasolacrimal']),
+    ('orbit', ['orbit', 'proptosis', 'exophthalmos', 'thyroid eye', 'graves', 'orbital cellulitis', 'blow out', 'orbital fracture', 'orbital tumor', 'decompression', 'ted', 'lid retraction']),
+    ('lids', ['lid', 'eyelid', 'ptosis', 'ectropion', 'entropion', 'blephar', 'chalazion', 'hordeolum', 'trichiasis', 'lagophthalmos', 'lid tumor', 'bcc eyelid', 'levator', 'blepharoplasty', 'xanthelasma']),
+    ('lacrimal', ['lacrimal', 'tear duct', 'dacryocyst', 'nasolacrimal', 'epiphora', 'dcr', 'punctum', 'canalicul', 'watery eye', 'tearing']),
+    ('conjunctiva', ['conjunctiv', 'pinguecula', 'allergic eye', 'vernal', 'trachoma', 'subconjunctival', 'chemosis', 'pemphigoid ocular', 'sjs', 'ossn']),
+    ('sclera', ['scleritis', 'episcleritis', 'sclera', 'necrotizing scleritis', 'staphyloma']),
+    ('refractive', ['refractive', 'refraction', 'myopia', 'hyperopia', 'astigmatism', 'lasik', 'prk', 'smile', 'presbyopia', 'icl', 'phakic iol', 'biometry', 'iol calculation', 'contact lens', 'spectacle']),
+    ('trauma', ['trauma', 'injury', 'foreign body', 'hyphema', 'open globe', 'chemical burn', 'penetrating', 'iofb', 'commotio', 'laceration', 'rupture']),
+    ('tumours', ['tumour', 'tumor', 'melanoma', 'retinoblastoma', 'lymphoma', 'metasta', 'choroidal nevus', 'enucleation', 'plaque', 'oncology']),
+    ('surgery_care', ['surgery', 'surgical', 'anaesthe', 'anesthe', 'perioperative', 'complication', 'post-op', 'intraoperative', 'consent', 'theatre', 'sterilization']),
+    ('lasers', ['laser', 'yag', 'argon', 'photocoagulation', 'slt', 'prp', 'panretinal', 'micropulse', 'pdt', 'capsulotomy', 'iridotomy']),
+    ('therapeutics', ['drug', 'medication', 'drops', 'antibiotic', 'steroid eye', 'anti-vegf', 'pharmacology', 'intravitreal injection', 'eylea', 'lucentis', 'avastin', 'pharmacy', 'prescribing']),
+    ('clinical_skills', ['examination', 'slit lamp', 'fundoscopy', 'tonometry', 'gonioscopy', 'visual acuity', 'ophthalmoscopy', 'clinical assessment', 'history taking', 'osc', 'station']),
+    ('investigations', ['investigation', 'imaging', 'angiography', 'oct', 'ffa', 'icg', 'visual field test', 'perimetry', 'ultrasound eye', 'b-scan', 'topography', 'electrophysiology', 'erg', 'vep']),
+    ('evidence', ['trial', 'study', 'evidence', 'guideline', 'areds', 'drcr', 'rct', 'meta-analysis', 'review']),
+]
+
+
+def _compile_rules(rules):
+    # One alternation per rule keeps the JS priority (rule order), not the position in the title
+    return [(chapter, re.compile('|'.join(map(re.escape, keywords)))) for chapter, keywords in rules]
+
+
+def _compile_schema(schema):
+    """Turn {field: (types, required)} into a function returning the list of problems."""
+    checks = []
+    for field, (types, required) in schema.items():
+        # bool is an int subclass, but True is not a valid id or seqId
+        rejects_bool = int in types and bool not in types
+        checks.append((field, types, required, rejects_bool, ' or '.join(t.__name__ for t in types)))
+
+    def problems(value, prefix=''):
+        found = []
+        for field, types, required, rejects_bool, expected in checks:
+            if field not in value:
+                if required:
+                    found.append(f"{prefix}{field} is required")
+                continue
+            v = value[field]
+            if v is None and not required:
+                continue
+            if not isinstance(v, types) or (rejects_bool and isinstance(v, bool)):
+                found.append(f"{prefix}{field} must be {expected}, not {type(v).__name__}")
+        return found
+    return problems
+
+
+_CHAPTER_RULES = _compile_rules(CHAPTER_RULES)
+_item_problems = _compile_schema(ITEM_SCHEMA)
+_data_problems = _compile_schema(DATA_SCHEMA)
+
+
+def detect_chapter(title):
+    """Chapter id for a title, as autoDetectChapterFromTitle() in community-submissions.js."""
+    if not title:
+        return UNCATEGORIZED
+    lowered = title.lower()
+    for chapter, pattern in _CHAPTER_RULES:
+        if pattern.search(lowered):
+            return chapter
+    return UNCATEGORIZED
+
+
+def validate(item):
+    """Raise ItemSchemaError if item does not match ITEM_SCHEMA (and DATA_SCHEMA for item['data'])."""
+    if not isinstance(item, dict):
+        raise ItemSchemaError(f"item must be an object, not {type(item).__name__}")
+    problems = _item_problems(item)
+    if isinstance(item.get('data'), dict):
+        problems += _data_problems(item['data'], 'data.')
+        sections = item['data'].get('sections')
+        if isinstance(sections, list) and not all(isinstance(s, dict) for s in sections):
+            problems.append("data.sections must only contain objects")
+    if problems:
+        raise ItemSchemaError("; ".join(problems))
+
+
+def id_from_name(stem):
+    """Item id for a file name without one: its numeric prefix, else a stable number from the name."""
+    prefix = stem.split('_')[0]
+    if prefix.isdigit():
+        return int(prefix)
+    return int(hashlib.sha256(stem.encode('utf-8')).hexdigest()[:12], 16)
+
+
+def canonicalize(item, default_id=None, default_title=None, default_date=None, next_seq_id=None):
+    """Validate item and fill its missing fields (see module docstring).
+
+    The defaults are values or zero-argument callables (called only when the
+    field is missing). Returns (item, changed); the input is not modified.
+    """
+    validate(item)
+    missing = {}
+    if item.get('id') is None and default_id is not None:
+        missing['id'] = default_id() if callable(default_id) else default_id
+    if item.get('title') is None and default_title is not None:
+        missing['title'] = default_title() if callable(default_title) else default_title
+    if item.get('date') is None and default_date is not None:
+        missing['date'] = default_date() if callable(default_date) else default_date
+    if not item.get('chapterId'):
+        nested = item['data'].get('chapterId')
+        chapter = nested if nested and nested != UNCATEGORIZED else detect_chapter(item.get('title') or missing.get('title'))
+        if item.get('chapterId') != chapter:
+            missing['chapterId'] = chapter
+    if not item.get('seqId') and next_seq_id is not None:
+        missing['seqId'] = next_seq_id()
+    if not missing:
+        return item, False
+    canonical = dict(item)
+    canonical.update(missing)
+    return canonical, True
@@ -0,0 +1,219 @@
+"""
+Offset table for library-index.json, for reading single items without parsing the index.
+
+sync_to_github.py writes the index with encode_index(), which also returns
+where each item's JSON starts and ends in the file, and saves that next to
+the index as library-index.offsets.json:
+    {"format": 2, "size": <index bytes>, "digest": <SHA-256 of the index>,
+     "sections": [offset, length] | null,
+     "items": [[id, offset, length, title, chapterId, date], ...]}
+
+LibraryIndex memory-maps the index and keeps only one small ItemRecord per
+item; an item's body is sliced out of the map (and decoded) when asked for.
+Lookups by id are a dict access, however large the library grows. When
+either file is replaced (the sync script writes both atomically, the index
+first), the next access reopens them. A table is used only with the index
+whose size and digest it records, so a reader that catches the index
+replaced but not yet the table has no lookups until the table follows.
+
+Usage:
+    index = LibraryIndex("library-index.json")
+    record = index.record("1767369068351")   # ItemRecord or None
+    item = index.get("1767369068351")        # parsed item or None
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+
+from json_codec import dumps as json_dumps, loads as json_loads
+
+OFFSETS_SUFFIX = ".offsets.json"   # library-index.json -> library-index.offsets.json
+OFFSETS_FORMAT = 2
+SECTION_REF_KEY = "$ref"
+
+
+def offsets_path(index_path):
+    root, _ = os.path.splitext(os.fspath(index_path))
+    return root + OFFSETS_SUFFIX
+
+
+def encode_index(items, sections=None):
+    """Encode the index and locate every item in it.
+
+    Without sections the bytes equal json_codec.dumps(items, indent=2); with a
+    shared section table they equal json_codec.dumps({"items": items,
+    "sections": sections}). Returns (bytes, offsets document).
+    """
+    if sections is None:
+        # Items one level deep in an indent=2 list: every line gains two spaces
+        # (JSON strings never contain a raw newline)
+        pieces = [json_dumps(item, indent=2).replace(b'\n', b'\n  ') for item in items]
+        head, separator, tail = (b'[\n  ', b',\n  ', b'\n]') if items else (b'[', b'', b']')
+    else:
+        pieces = [json_dumps(item) for item in items]
+        encoded_sections = json_dumps(sections)
+        head, separator, tail = b'{"items":[', b',', b'],"sections":' + encoded_sections + b'}'
+
+    records = []
+    offset = len(head)
+    for item, piece in zip(items, pieces):
+        records.append([item.get('id'), offset, len(piece),
+                        item.get('title', ''), item.get('chapterId', ''), item.get('date', '')])
+        offset += len(piece) + len(separator)
+    data = head + separator.join(pieces) + tail
+
+    section_span = None
+    if sections is not None:
+        section_span = [len(data) - 1 - len(encoded_sections), len(encoded_sections)]
+    return data, {"format": OFFSETS_FORMAT, "size": len(data), "digest": hashlib.sha256(data).hexdigest(),
+                  "sections": section_span, "items": records}
+
+
+class ItemRecord:
+    """Where one item lives in the index, plus the metadata needed to list it."""
+
+    __slots__ = ('id', 'offset', 'length', 'title', 'chapter_id', 'date')
+
+    def __init__(self, item_id, offset, length, title, chapter_id, date):
+        self.id = item_id
+        self.offset = offset
+        self.length = length
+        self.title = title
+        self.chapter_id = chapter_id
+        self.date = date
+
+    def __repr__(self):
+        return f"ItemRecord({self.id!r}, offset={self.offset}, length={self.length})"
+
+
+class _Mapped:
+    """One opened generation of the index: the map, the records and the section table."""
+
+    __slots__ = ('token', 'map', 'records', 'section_span', 'sections')
+
+    def __init__(self, token, mapped, records, section_span):
+        self.token = token
+        self.map = mapped
+        self.records = records
+        self.section_span = section_span
+        self.sections = None   # decoded on first use
+
+
+class LibraryIndex:
+    """Memory-mapped library-index.json with O(1) item lookup (see module docstring)."""
+
+    def __init__(self, index_path, offsets_file=None):
+        self.index_path = os.fspath(index_path)
+        self.offsets_path = os.fspath(offsets_file) if offsets_file else offsets_path(index_path)
+        self._lock = threading.Lock()
+        self._current = None
+        self._unusable = None   # token of files that did not open, so they are not retried
+
+    def _token(self):
+        try:
+            index_st = os.stat(self.index_path)
+            offsets_st = os.stat(self.offsets_path)
+        except OSError:
+            return None
+        return (index_st.st_ino, index_st.st_mtime_ns, index_st.st_size,
+                offsets_st.st_ino, offsets_st.st_mtime_ns)
+
+    def _open(self, token):
+        with open(self.offsets_path, "rb") as f:
+            table = json_loads(f.read())
+        mapped = None
+        if table.get("format") == OFFSETS_FORMAT and table.get("size") == token[2] and token[2]:
+            with open(self.index_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Same size is not enough: the index may have been replaced with the table still to follow
+        if (table.get("format") != OFFSETS_FORMAT or table.get("size") != token[2]
+                or hashlib.sha256(mapped if mapped is not None else b"").hexdigest() != table.get("digest")):
+            if mapped is not None:
+                mapped.close()
+            print(f"[!] {os.path.basename(self.offsets_path)} does not match the index; item lookups are off until it is rewritten")
+            return None
+        records = {}
+        for item_id, offset, length, title, chapter_id, date in table["items"]:
+            # The index is newest first: on a duplicated id the newest item wins
+            records.setdefault(str(item_id), ItemRecord(item_id, offset, length, title, chapter_id, date))
+        return _Mapped(token, mapped, records, table.get("sections"))
+
+    def _state(self):
+        """The current generation, reopened if either file changed (None if unavailable)."""
+        token = self._token()
+        current = self._current
+        if current is not None and current.token == token:
+            return current
+        with self._lock:
+            current = self._current
+            if (current is None or current.token != token) and token != self._unusable:
+                # The previous map is released once no reader holds it any more
+                current = None
+                if token is not None:
+                    try:
+                        current = self._open(token)
+                    except (OSError, ValueError, KeyError, TypeError) as e:
+                        print(f"[!] Could not open the library offset table: {e}")
+                self._current = current
+                self._unusable = token if current is None else None
+            return current if current is not None and current.token == token else None
+
+    @property
+    def available(self):
+        return self._state() is not None
+
+    def __len__(self):
+        state = self._state()
+        return len(state.records) if state else 0
+
+    def __contains__(self, item_id):
+        state = self._state()
+        return state is not None and str(item_id) in state.records
+
+    def records(self):
+        """All ItemRecords, in index order (newest first)."""
+        state = self._state()
+        return list(state.records.values()) if state else []
+
+    def record(self, item_id):
+        state = self._state()
+        return state.records.get(str(item_id)) if state else None
+
+    def raw(self, item_id):
+        """The item's JSON exactly as stored in the index (bytes), or None."""
+        state = self._state()
+        record = state.records.get(str(item_id)) if state else None
+        if record is None:
+            return None
+        return state.map[record.offset:record.offset + record.length]
+
+    def _sections(self, state):
+        if state.sections is None and state.section_span:
+            offset, length = state.section_span
+            state.sections = json_loads(state.map[offset:offset + length])
+        return state.sections or {}
+
+    def get(self, item_id):
+        """The parsed item with shared sections resolved, or None."""
+        state = self._state()
+        record = state.records.get(str(item_id)) if state else None
+        if record is None:
+            return None
+        item = json_loads(state.map[record.offset:record.offset + record.length])
+        if state.section_span:
+            shared = self._sections(state)
+            sections = (item.get('data') or {}).get('sections') or []
+            for pos, section in enumerate(sections):
+                if isinstance(section, dict) and SECTION_REF_KEY in section:
+                    sections[pos] = shared.get(section[SECTION_REF_KEY], section)
+        return item
+
+    def encoded(self, item_id):
+        """A self-contained JSON encoding of the item (bytes), or None."""
+        state = self._state()
+        if state is not None and not state.section_span:
+            return self.raw(item_id)
+        item = self.get(item_id)
+        return None if item is None else json_dumps(item)
@@ -7,7 +7,29 @@ import http.server
 import shutil
 import json
 import re
+import time
+import threading
+import atexit
+import struct
+import itertools
+from datetime import datetime, timezone
 from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+from access_log import AccessLog, AccessLogMixin
+from admission import Admission, AdmissionMixin, BodyTooSlow, ConnectionLimitMixin
+from asset_cache import IMMUTABLE, AssetCacheMixin
+from asset_store import AssetError, AssetStore, parse_range
+from community_store import CommunityError, CommunityStore
+from json_codec import dumps as json_dumps, loads as json_loads
+from library_changes import ChangeLog, digest_encoded
+from library_facets import build_facets, item_analytics
+from library_ingest import ItemSchemaError, canonicalize
+from library_offsets import LibraryIndex
+from prefork import VersionStamp, adopt_socket, bind_listeners, parse_workers, serve_prefork, temp_path
+from prerender import inject_fragment, read_fragment
+from profiling import DEBUG_PATH, Profiler, ProfilingMixin
+from routing import Response, Router
 
 # Configuration
 import urllib.request
@@ -29,6 +51,60 @@ URL_PATH = "/ophthalmics"
 
 CERT_FILE = "server.crt"
 KEY_FILE = "server.key"
+CERT_KEY_TYPE = "ecdsa"  # "ecdsa" (P-256) or "rsa"
+
+# TLS tuning
+TLS_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20:!aNULL:!eNULL:!MD5:!DSS"
+TLS13_TICKETS = 2          # session tickets issued per TLS 1.3 handshake
+TLS_RELOAD_INTERVAL = 5    # seconds between certificate change checks
+
+# Access logging (background writer; see access_log.py)
+ACCESS_LOG_FILE = None      # e.g. "logs/access.log" (rotated by size); None logs to stdout
+ACCESS_LOG_FORMAT = "text"  # "text" or "json"
+ACCESS_LOG_SAMPLE_RATES = {"OPTIONS": 0.1}
+
+# Admission control (per process; see admission.py)
+REQUEST_READ_TIMEOUT = 30          # seconds a client may idle while sending headers or body
+REQUEST_HEADER_TIMEOUT = 20        # seconds for a whole request line and headers (slowloris)
+MAX_CONNECTIONS = 256              # open connections per server (each holds a thread)
+MAX_IN_FLIGHT = 64                 # concurrent requests before answering 503
+RATE_LIMIT_PER_SECOND = 50         # per client IP (a classroom may share one NAT address)
+RATE_LIMIT_BURST = 300
+MAX_BODY_BYTES = 1 * 1024 * 1024   # default request body limit
+BODY_LIMITS = {                    # larger limits for specific endpoints (path suffix)
+    "/api/library/upload": 64 * 1024 * 1024,
+    "/api/community/submit": 16 * 1024 * 1024,
+    "/api/assets": 256 * 1024 * 1024,
+}
+
+# Profiling (off by default; /debug/profile from localhost can switch it on at runtime)
+PROFILE_SAMPLE_RATE = 0.0   # fraction of requests run under cProfile
+PROFILE_SLOW_MS = None      # e.g. 500 to record requests slower than 500 ms
+PROFILE_DUMP_DIR = None     # e.g. "logs/profiles" for per-request .prof files of slow requests
+
+# Library cache: bumped by any worker after an upload (see LibraryCache)
+LIBRARY_VERSION_FILE = ".version"
+LIBRARY_STREAM_CHUNK = 16 * 1024  # bytes per chunk written by /api/library/stream
+LIBRARY_INDEX_FILE = "library-index.json"  # published index; /api/library/item reads it via its offset table
+RENDER_DIR = "rendered"            # pre-rendered posters (prerender.py), put into index.html?item=<id>
+
+# Warm restart: parsed library cache saved under APP_PATH (see LibraryCache)
+LIBRARY_SNAPSHOT_FILE = ".library-cache.bin"
+LIBRARY_SNAPSHOT_INTERVAL = 300   # seconds between snapshot saves (only when changed)
+LIBRARY_SNAPSHOT_MAGIC = b"OPHLIBC"
+LIBRARY_SNAPSHOT_VERSION = 2      # bump when the record layout or item encoding changes
+_SNAPSHOT_HEADER = struct.Struct(">7sHI")  # magic, version, record count
+_SNAPSHOT_RECORD = struct.Struct(">HqqI")  # name length, mtime_ns, size, encoded length
+
+# Community submissions (event log + snapshots under APP_PATH; see community_store.py)
+COMMUNITY_DIR = "community"
+COMMUNITY_SEED_FILE = "community_data.json"  # imported once when the store is first created
+COMMUNITY_ADMIN_PIN = "309030"               # same PIN as community-submissions.js
+COMMUNITY_PAGE_SIZE = 20
+
+# Clinical images and other binaries, stored by SHA-256 under APP_PATH (see asset_store.py)
+ASSET_DIR = "assets"
+ASSET_SEND_CHUNK = 256 * 1024  # bytes per write when serving an asset
 
 
 def ensure_root():
@@ -71,15 +147,25 @@ def configure_network_interface():
         sys.exit(1)
 
 
-def generate_self_signed_cert():
-    """Generate self-signed SSL certificate if missing."""
+def generate_self_signed_cert(key_type=None):
+    """Generate self-signed SSL certificate if missing.
+
+    key_type is "ecdsa" (P-256, default: much cheaper handshakes) or "rsa".
+    """
     if os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE):
         return
 
-    print("[*] Generating self-signed SSL certificate...")
+    key_type = key_type or CERT_KEY_TYPE
+    if key_type == "rsa":
+        newkey = "-newkey rsa:2048"
+    else:
+        newkey = "-newkey ec -pkeyopt ec_paramgen_curve:prime256v1"
+
+    print(f"[*] Generating self-signed SSL certificate ({key_type.upper()})...")
     cmd = (
-        f'openssl req -x509 -newkey rsa:4096 -nodes -out {CERT_FILE} '
-        f'-keyout {KEY_FILE} -days 365 -subj "/CN={PUBLIC_IP}"'
+        f'openssl req -x509 {newkey} -nodes -out {CERT_FILE} '
+        f'-keyout {KEY_FILE} -days 365 -subj "/CN={PUBLIC_IP}" '
+        f'-addext "subjectAltName=IP:{PUBLIC_IP}"'
     )
     try:
         subprocess.check_call(cmd, shell=True, stderr=subprocess.DEVNULL)
@@ -89,149 +175,972 @@ def generate_self_signed_cert():
         print("    [!] Continuing with HTTP only if possible...")
 
 
-class RequestHandler(http.server.SimpleHTTPRequestHandler):
+class TLSConfig:
+    """Server SSLContext tuned for many short-lived clients.
+
+    - TLS 1.2+ with forward-secret AEAD ciphers only (server order preferred)
+    - session resumption: tickets enabled, TLS 1.3 tickets issued per handshake
+    - ALPN advertises http/1.1
+    - certificate/key changes on disk are picked up without a restart
+    """
+
+    def __init__(self, certfile=CERT_FILE, keyfile=KEY_FILE):
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self._mtimes = self._cert_mtimes()
+        self._next_check = time.monotonic() + TLS_RELOAD_INTERVAL
+        self.context = self._create_context()
+
+    def _create_context(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.set_ciphers(TLS_CIPHERS)
+        context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+        context.options &= ~ssl.OP_NO_TICKET
+        if hasattr(context, "num_tickets"):
+            context.num_tickets = TLS13_TICKETS
+        context.set_ecdh_curve("prime256v1")
+        try:
+            context.set_alpn_protocols(["http/1.1"])
+        except NotImplementedError:
+            pass
+        context.load_cert_chain(certfile=self.certfile, keyfile=self.keyfile)
+        return context
+
+    def _cert_mtimes(self):
+        try:
+            return (os.stat(self.certfile).st_mtime_ns, os.stat(self.keyfile).st_mtime_ns)
+        except OSError:
+            return None
+
+    def reload_if_changed(self):
+        """Swap in a fresh context if the certificate files changed.
+
+        Checked at most every TLS_RELOAD_INTERVAL seconds. A new context is
+        built rather than reloading in place, because OpenSSL keeps one
+        certificate per key type and would otherwise keep serving the old one.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + TLS_RELOAD_INTERVAL
+
+        mtimes = self._cert_mtimes()
+        if mtimes is None or mtimes == self._mtimes:
+            return False
+        try:
+            self.context = self._create_context()
+        except (OSError, ssl.SSLError) as e:
+            # Keep serving the old certificate (e.g. files caught mid-write)
+            print(f"[!] Certificate reload failed, keeping current certificate: {e}")
+            return False
+        self._mtimes = mtimes
+        print("[HTTPS] Reloaded certificate.")
+        return True
+
+
+class HTTPServer(ConnectionLimitMixin, http.server.ThreadingHTTPServer):
+    """Threaded HTTPServer serving at most MAX_CONNECTIONS connections at once."""
+
+    max_connections = MAX_CONNECTIONS
+
+
+class TLSHTTPServer(HTTPServer):
+    """Threaded HTTPServer that wraps each accepted connection with the current TLSConfig context.
+
+    The handshake is deferred to the request thread (first read), where the
+    handler's socket timeout applies, so a stalled client cannot block accept().
+    """
+
+    def __init__(self, server_address, handler_class, tls, **kwargs):
+        self.tls = tls
+        super().__init__(server_address, handler_class, **kwargs)
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        return self.tls.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), addr
+
+    def service_actions(self):
+        # Runs on the accept loop; connections already accepted keep their old context
+        self.tls.reload_if_changed()
+
+    def handle_error(self, request, client_address):
+        # Failed handshakes and clients dropped by the read timeout are routine
+        if isinstance(sys.exc_info()[1], (ssl.SSLError, ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class LibraryCache:
+    """Encoded library items, rebuilt only when the library changes.
+
+    Holds each file's JSON encoding keyed by filename with its mtime and size
+    (walked by the NDJSON stream) and the joined /api/library/list body. Each
+    process (and prefork worker) keeps its own copy. It is revalidated when
+    the library folder's mtime changes (files added or removed) or when any
+    process bumps the shared version stamp after an upload; revalidation is
+    one directory scan that re-reads only files whose mtime or size changed.
+
+    The per-file records are saved to LIBRARY_SNAPSHOT_FILE periodically and
+    at exit, so a restarted server revalidates instead of re-parsing everything.
+
+    Whenever a revalidation finds different files, the difference is recorded
+    in the library change log (library_changes.py), which assigns the next
+    library version; /api/library/changes serves the entries after a version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._files = {}      # filename -> (mtime_ns, size, encoded item)
+        self._entries = None  # encoded items in directory order, valid for _key
+        self._body = None
+        self._dirty = False   # records changed since the last snapshot
+        self.reparsed = 0     # files parsed by the last scan
+        self._logged = None   # files last recorded in the change log
+        self._ids = {}        # filename -> (mtime_ns, size, item id, digest)
+        self._change_log = None
+        self.version = 0      # library version after the last recorded change
+        self._analytics = {}  # filename -> (mtime_ns, size, item id, analytics)
+        self._facets = None   # (key, encoded facets document)
+        self._by_id = None    # (key, {str(item id): encoded item})
+
+    def library_dir(self):
+        return os.path.join(APP_PATH, "library")
+
+    def snapshot_path(self):
+        return os.path.join(APP_PATH, LIBRARY_SNAPSHOT_FILE)
+
+    def stamp(self):
+        return VersionStamp(os.path.join(self.library_dir(), LIBRARY_VERSION_FILE))
+
+    def change_log(self):
+        if self._change_log is None:
+            self._change_log = ChangeLog(self.library_dir())
+        return self._change_log
+
+    def _current_key(self):
+        try:
+            dir_mtime = os.stat(self.library_dir()).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        return (dir_mtime, self.stamp().token())
+
+    def _scan(self, previous):
+        """Yield (filename, record) per library file, re-reading only changed files."""
+        self.reparsed = 0
+        try:
+            listing = os.scandir(self.library_dir())
+        except OSError:
+            return
+        with listing:
+            for entry in listing:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                record = previous.get(entry.name)
+                if record is None or record[0] != st.st_mtime_ns or record[1] != st.st_size:
+                    try:
+                        with open(entry.path, "rb") as f:
+                            record = (st.st_mtime_ns, st.st_size, json_dumps(json_loads(f.read())))
+                    except (OSError, ValueError):
+                        continue
+                    self.reparsed += 1
+                yield entry.name, record
+
+    def _cached_entries(self, key):
+        with self._lock:
+            if self._entries is not None and key == self._key:
+                return self._entries
+        return None
+
+    def _store(self, key, files):
+        with self._lock:
+            if files != self._files:
+                self._dirty = True
+            self._files = files
+            self._entries = [record[2] for record in files.values()]
+            self._body = None
+            self._key = key
+        if files != self._logged:
+            self._record_changes(files)
+
+    def _record_changes(self, files):
+        """Record the current files in the change log (ids and digests cached by mtime/size)."""
+        current, ids = {}, {}
+        for name, (mtime_ns, size, encoded) in files.items():
+            known = self._ids.get(name)
+            if known is None or known[:2] != (mtime_ns, size):
+                try:
+                    item_id = json_loads(encoded).get('id')
+                except (ValueError, AttributeError):
+                    item_id = None
+                known = (mtime_ns, size, item_id, digest_encoded(encoded))
+            ids[name] = known
+            current[name] = (known[3], known[2])
+        try:
+            self.version = self.change_log().update(current)
+        except OSError as e:
+            print(f"[!] Could not update the library change log: {e}")
+            return
+        self._ids = ids
+        self._logged = files
+
+    def facets_body(self):
+        """Return the JSON facets document (library_facets.py), recomputed only for changed files."""
+        self.list_body()
+        with self._lock:
+            key, files = self._key, self._files
+            if self._facets is not None and self._facets[0] == key:
+                return self._facets[1]
+        analytics, by_id = {}, {}
+        for name, (mtime_ns, size, encoded) in files.items():
+            known = self._analytics.get(name)
+            if known is None or known[:2] != (mtime_ns, size):
+                try:
+                    item = json_loads(encoded)
+                except ValueError:
+                    continue
+                if not isinstance(item, dict):
+                    continue
+                known = (mtime_ns, size, item.get('id', name), item_analytics(item))
+            analytics[name] = known
+            by_id[known[2]] = known[3]
+        body = json_dumps(build_facets(by_id))
+        with self._lock:
+            self._analytics = analytics
+            self._facets = (key, body)
+        return body
+
+    def item_body(self, item_id):
+        """Return the encoded item with this id from the library folder, or None."""
+        self.list_body()
+        with self._lock:
+            key, files, ids = self._key, self._files, self._ids
+            if self._by_id is not None and self._by_id[0] == key:
+                return self._by_id[1].get(str(item_id))
+        by_id = {}
+        for name, (mtime_ns, size, encoded) in files.items():
+            known = ids.get(name)
+            if known is not None and known[:2] == (mtime_ns, size):
+                found = known[2]
+            else:
+                try:
+                    found = json_loads(encoded).get('id')
+                except (ValueError, AttributeError):
+                    continue
+            by_id[str(found)] = encoded
+        with self._lock:
+            self._by_id = (key, by_id)
+        return by_id.get(str(item_id))
+
+    def changes_body(self, since):
+        """Return the JSON body of /api/library/changes: entries after `since`, with items inline."""
+        self.list_body()  # revalidate first, so the log includes any edit made since the last request
+        version, entries = self.change_log().since(since)
+        if entries is None:
+            return json_dumps({"version": version, "reset": True, "changes": []})
+        with self._lock:
+            files = self._files
+        parts = []
+        for entry in entries:
+            encoded = json_dumps(entry)
+            if entry["op"] == "upsert":
+                record = files.get(entry["file"])
+                if record is None:
+                    continue  # removed again after this entry; its delete is logged next
+                encoded = encoded[:-1] + b',"item":' + record[2] + b'}'
+            parts.append(encoded)
+        return b'{"version":%d,"reset":false,"changes":[%s]}' % (version, b','.join(parts))
+
+    def list_body(self):
+        """Return the JSON list of all library items as bytes."""
+        key = self._current_key()
+        with self._lock:
+            if self._body is not None and key == self._key:
+                return self._body
+        entries = self._cached_entries(key)
+        if entries is None:
+            entries = list(self.iter_entries())
+        # Same bytes as json_dumps(items): compact elements joined with ","
+        body = b'[' + b','.join(entries) + b']'
+        with self._lock:
+            if self._entries is entries:
+                self._body = body
+        return body
+
+    def iter_entries(self):
+        """Yield encoded items: from the cache when current, else while scanning the folder.
+
+        A scan fills the per-process cache as it goes, so the next request is
+        served from memory; nothing per-request is buffered.
+        """
+        key = self._current_key()
+        entries = self._cached_entries(key)
+        if entries is not None:
+            yield from entries
+            return
+        files = {}
+        for name, record in self._scan(self._files):
+            files[name] = record
+            yield record[2]
+        self._store(key, files)
+
+    def invalidate(self):
+        """Drop this cache and signal every other worker to drop theirs."""
+        with self._lock:
+            self._entries = None
+            self._body = None
+        self.stamp().bump()
+
+    # -- warm restart --------------------------------------------------------
+
+    def save_snapshot(self):
+        """Write the per-file records to disk if they changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            files = self._files
+            self._dirty = False
+        path = self.snapshot_path()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_SNAPSHOT_HEADER.pack(LIBRARY_SNAPSHOT_MAGIC, LIBRARY_SNAPSHOT_VERSION, len(files)))
+                for name, (mtime_ns, size, encoded) in files.items():
+                    name_bytes = name.encode('utf-8')
+                    f.write(_SNAPSHOT_RECORD.pack(len(name_bytes), mtime_ns, size, len(encoded)))
+                    f.write(name_bytes)
+                    f.write(encoded)
+            os.replace(tmp, path)
+            return True
+        except OSError as e:
+            print(f"[!] Could not write library snapshot: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def load_snapshot(self):
+        """Load per-file records saved by save_snapshot(); returns the record count."""
+        try:
+            with open(self.snapshot_path(), "rb") as f:
+                data = f.read()
+            magic, version, count = _SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != LIBRARY_SNAPSHOT_MAGIC or version != LIBRARY_SNAPSHOT_VERSION:
+                return 0
+            view = memoryview(data)
+            offset = _SNAPSHOT_HEADER.size
+            files = {}
+            for _ in range(count):
+                name_len, mtime_ns, size, encoded_len = _SNAPSHOT_RECORD.unpack_from(data, offset)
+                offset += _SNAPSHOT_RECORD.size
+                name = bytes(view[offset:offset + name_len]).decode('utf-8')
+                offset += name_len
+                files[name] = (mtime_ns, size, bytes(view[offset:offset + encoded_len]))
+                offset += encoded_len
+        except (OSError, struct.error, UnicodeDecodeError):
+            return 0
+        with self._lock:
+            self._files = files
+            self._entries = None
+            self._body = None
+        return len(files)
+
+    def warm_start(self):
+        """Load the snapshot and revalidate it against the folder (one directory scan)."""
+        started = time.perf_counter()
+        loaded = self.load_snapshot()
+        self.list_body()
+        count = len(self._entries or ())
+        print(f"    [+] Library cache: {count} items ready in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"({loaded} from snapshot, {self.reparsed} parsed), library version {self.version}")
+
+    def start_snapshots(self, interval=None):
+        """Save the snapshot every `interval` seconds (when changed) and at exit."""
+        interval = LIBRARY_SNAPSHOT_INTERVAL if interval is None else interval
+        atexit.register(self.save_snapshot)
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.save_snapshot()
+
+        threading.Thread(target=loop, name="library-snapshot", daemon=True).start()
+
+
+LIBRARY_CACHE = LibraryCache()
+
+_published_index = None
+
+
+def published_index():
+    """The memory-mapped published index under APP_PATH (see library_offsets.py)."""
+    global _published_index
+    path = os.path.join(APP_PATH, LIBRARY_INDEX_FILE)
+    index = _published_index
+    if index is None or index.index_path != path:
+        index = _published_index = LibraryIndex(path)
+    return index
+
+
+_asset_store = None
+_asset_lock = threading.Lock()
+
+
+def asset_store():
+    """The asset store under APP_PATH, opened on first use."""
+    global _asset_store
+    path = os.path.join(APP_PATH, ASSET_DIR)
+    with _asset_lock:
+        if _asset_store is None or _asset_store.root != path:
+            _asset_store = AssetStore(path, max_size=BODY_LIMITS["/api/assets"])
+        return _asset_store
+
+
+_community_store = None
+_community_lock = threading.Lock()
+
+
+def community_store():
+    """Open the community store on first use (after fork, in prefork mode)."""
+    global _community_store
+    with _community_lock:
+        if _community_store is None:
+            seed = None
+            seed_path = os.path.join(APP_PATH, COMMUNITY_SEED_FILE)
+            if os.path.exists(seed_path):
+                try:
+                    with open(seed_path, "r") as f:
+                        seed = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    seed = None
+            _community_store = CommunityStore(os.path.join(APP_PATH, COMMUNITY_DIR), seed_document=seed)
+        return _community_store
+
+
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Range, If-None-Match'),
+]
+
+
+def api_paths(path):
+    """Return an API path both bare and under URL_PATH (the app calls it relatively)."""
+    return [path, URL_PATH + path]
+
+
+class RequestHandler(AccessLogMixin, AdmissionMixin, ProfilingMixin, AssetCacheMixin, http.server.SimpleHTTPRequestHandler):
+    # Route table, built once by build_routes() below
+    routes = None
+
+    # Socket timeout for every single read; the admission deadlines below bound the whole transfer
+    timeout = REQUEST_READ_TIMEOUT
+
+    admission = Admission(
+        rate=RATE_LIMIT_PER_SECOND,
+        burst=RATE_LIMIT_BURST,
+        max_in_flight=MAX_IN_FLIGHT,
+        max_body=MAX_BODY_BYTES,
+        body_limits=BODY_LIMITS,
+        header_timeout=REQUEST_HEADER_TIMEOUT,
+    )
+    admission_headers = CORS_HEADERS
+
+    access_log = AccessLog(
+        path=ACCESS_LOG_FILE,
+        fmt=ACCESS_LOG_FORMAT,
+        sample_rates=ACCESS_LOG_SAMPLE_RATES,
+    )
+
+    profiler = Profiler(
+        sample_rate=PROFILE_SAMPLE_RATE,
+        slow_ms=PROFILE_SLOW_MS,
+        dump_dir=PROFILE_DUMP_DIR,
+    )
+
     def __init__(self, *args, directory=None, **kwargs):
         super().__init__(*args, directory=APP_PATH, **kwargs)
 
     def _send_cors_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
 
     def do_OPTIONS(self):
-        self.send_response(200)
-        self._send_cors_headers()
-        self.end_headers()
+        PREFLIGHT_RESPONSE.send(self)
 
     def do_GET(self):
-        # 0. Log request
-        # print(f"DEBUG: GET {self.path}")
+        # API endpoints, redirects and static files under URL_PATH
+        if self.routes.dispatch(self, 'GET'):
+            return
+
+        # Fallback/404
+        self.send_error(404, f"Not Found: {self.path}")
+
+    def do_POST(self):
+        if self.routes.dispatch(self, 'POST'):
+            return
+
+        self.send_error(404, f"API Endpoint Not Found: {self.path}")
 
-        # 1. Handle API: /api/ftp/status
-        if self.path == "/api/ftp/status" or self.path.endswith("/api/ftp/status"):
+    def serve_library_list(self):
+        """Handle API: /api/library/list"""
+        try:
+            body = LIBRARY_CACHE.list_body()
             self.send_response(200)
             self._send_cors_headers()
+            self._send_version_headers()
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            # Return dummy status to silence errors
-            self.wfile.write(b'{"running": false, "port": 2121, "host": "127.0.0.1"}')
-            return
+            self.wfile.write(body)
+        except Exception as e:
+            print(f"[!] Error listing library: {e}")
+            self.send_error(500, str(e))
 
-        # 1.5 Handle API: /api/library/list
-        if self.path.endswith("/api/library/list"):
-            try:
-                lib_dir = os.path.join(APP_PATH, "library")
-                items = []
-                if os.path.exists(lib_dir):
-                    for filename in os.listdir(lib_dir):
-                        if filename.endswith(".json"):
-                            try:
-                                with open(os.path.join(lib_dir, filename), "r") as f:
-                                    items.append(json.load(f))
-                            except json.JSONDecodeError:
-                                pass
-                
-                self.send_response(200)
-                self._send_cors_headers()
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(items).encode('utf-8'))
-            except Exception as e:
-                print(f"[!] Error listing library: {e}")
-                self.send_error(500, str(e))
-            return
+    def _send_version_headers(self):
+        # Clients keep this and later ask /api/library/changes?since=<version>
+        self.send_header('X-Library-Version', str(LIBRARY_CACHE.version))
+        self.send_header('Access-Control-Expose-Headers', 'X-Library-Version')
 
-        # 2. Redirect root to /ophthalmics/
-        if self.path == "/" or self.path == "":
-            self.send_response(302)
-            self.send_header('Location', URL_PATH + '/')
+    def serve_library_facets(self):
+        """Handle API: /api/library/facets"""
+        try:
+            body = LIBRARY_CACHE.facets_body()
+            self.send_response(200)
+            self._send_cors_headers()
+            self._send_version_headers()
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
+            self.wfile.write(body)
+        except Exception as e:
+            print(f"[!] Error computing library facets: {e}")
+            self.send_error(500, str(e))
+
+    def serve_library_item(self):
+        """Handle API: /api/library/item?id=<id>
+
+        From the published index, or from the library folder for items
+        uploaded since the last sync.
+        """
+        item_id = self._query().get('id')
+        if not item_id:
+            self._send_json({'success': False, 'error': 'id is required'}, 400)
             return
-            
-        # 3. Serve Static Files under /ophthalmics
-        if self.path == URL_PATH:
-            self.send_response(302)
-            self.send_header('Location', URL_PATH + '/')
+        try:
+            body = published_index().encoded(item_id)
+            if body is None:
+                body = LIBRARY_CACHE.item_body(item_id)
+        except Exception as e:
+            print(f"[!] Error reading library item {item_id}: {e}")
+            self.send_error(500, str(e))
+            return
+        if body is None:
+            self._send_json({'success': False, 'error': f'No library item {item_id}'}, 404)
+            return
+        self.send_response(200)
+        self._send_cors_headers()
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_library_changes(self):
+        """Handle API: /api/library/changes?since=<version>"""
+        try:
+            since = int(self._query().get('since', '0'))
+        except ValueError:
+            self._send_json({'success': False, 'error': 'since must be an integer library version'}, 400)
+            return
+        try:
+            body = LIBRARY_CACHE.changes_body(since)
+            self.send_response(200)
+            self._send_cors_headers()
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
+            self.wfile.write(body)
+        except Exception as e:
+            print(f"[!] Error listing library changes: {e}")
+            self.send_error(500, str(e))
+
+    def _send_json(self, payload, status=200):
+        body = json_dumps(payload)
+        self.send_response(status)
+        self._send_cors_headers()
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query(self):
+        return {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+    def serve_community_submissions(self):
+        """Handle API: /api/community/submissions?status=pending|approved&offset=&limit="""
+        query = self._query()
+        try:
+            page = community_store().page(
+                query.get('status', 'pending'),
+                offset=query.get('offset', 0),
+                limit=query.get('limit', COMMUNITY_PAGE_SIZE),
+            )
+        except ValueError:
+            self._send_json({"success": False, "message": "Invalid offset or limit."}, 400)
             return
+        self._send_json(page)
 
-        if self.path.startswith(URL_PATH):
-            original_path = self.path
-            # Strip prefix to map to filesystem root
-            self.path = self.path[len(URL_PATH):]
-            if self.path == "":
-                self.path = "/"
-            
-            try:
-                super().do_GET()
-            finally:
-                # Restore path (good practice)
-                self.path = original_path
+    def serve_community_stats(self):
+        """Handle API: /api/community/stats"""
+        self._send_json(community_store().stats())
+
+    def serve_community_document(self):
+        """Handle API: /api/community/all (full state, for library sync)"""
+        self._send_json(community_store().document())
+
+    def serve_community_deleted(self):
+        """Handle API: /api/community/deleted"""
+        self._send_json(community_store().deleted_items())
+
+    def handle_community_action(self):
+        """Handle API: POST /api/community/<action>"""
+        action = urlsplit(self.path).path.rstrip('/').rsplit('/', 1)[-1]
+        try:
+            payload = json.loads(self.read_body() or b'{}')
+            if not isinstance(payload, dict):
+                raise CommunityError('Expected a JSON object.')
+
+            store = community_store()
+            client_ip = self.client_address[0]
+            if action in ('approve', 'reject', 'dedupe') and payload.get('pin') != COMMUNITY_ADMIN_PIN:
+                raise CommunityError('Invalid admin PIN.', 403)
+
+            if action == 'submit':
+                ids = store.submit(payload.get('items') or [], payload.get('userName'), client_ip)
+                result = {"success": True, "count": len(ids), "submissionIds": ids}
+            elif action == 'like':
+                result = {"success": True, "likes": store.like(payload.get('id'), client_ip)}
+            elif action == 'approve':
+                store.approve(payload.get('id'))
+                result = {"success": True, "message": "Submission approved!"}
+            elif action == 'reject':
+                store.reject(payload.get('id'))
+                result = {"success": True, "message": "Submission rejected and removed."}
+            elif action == 'dedupe':
+                count = store.dedupe_approved()
+                message = f"Removed {count} duplicate(s)." if count else "No duplicates found."
+                result = {"success": True, "message": message}
+            elif action == 'remove':
+                result = {"success": True, "removed": store.remove_from_all_pools(payload.get('title'))}
+            elif action == 'track-deletion':
+                store.track_deletion(payload.get('title'))
+                result = {"success": True}
+            else:
+                raise CommunityError(f"Unknown action: {action}", 404)
+            self._send_json(result)
+
+        except CommunityError as e:
+            self._send_json({"success": False, "message": str(e)}, e.status)
+        except (BodyTooSlow, TimeoutError) as e:
+            self.reject_request(408, f"Request body timed out: {e}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json({"success": False, "message": "Invalid JSON"}, 400)
+        except Exception as e:
+            print(f"[!] Error processing community action: {e}")
+            self._send_json({"success": False, "message": "Server Error"}, 500)
+
+    def handle_asset_upload(self):
+        """Handle API: POST /api/assets[?sha256=<expected>] (raw bytes, streamed to disk)"""
+        try:
+            asset, created = asset_store().put(self.iter_body(), self.headers.get('Content-Type'),
+                                               expected=self._query().get('sha256'))
+        except AssetError as e:
+            self._send_json({'success': False, 'error': str(e)}, e.status)
             return
-            
-        # 4. Fallback/404
-        self.send_error(404, f"Not Found: {self.path}")
+        except (BodyTooSlow, TimeoutError) as e:
+            self.reject_request(408, f"Request body timed out: {e}")
+            return
+        except Exception as e:
+            print(f"[!] Error storing asset: {e}")
+            self._send_json({'success': False, 'error': 'Server Error'}, 500)
+            return
+        if created:
+            print(f"    [+] Stored asset {asset.digest[:12]} ({asset.size} bytes, {asset.content_type})")
+        self._send_json({
+            'success': True,
+            'hash': asset.digest,
+            'size': asset.size,
+            'type': asset.content_type,
+            'url': f"{URL_PATH}/api/assets/{asset.digest}",
+        }, 201 if created else 200)
 
-    def do_POST(self):
-        # print(f"DEBUG: POST {self.path}")
+    def serve_asset(self):
+        """Handle API: GET /api/assets/<sha256> (ETag, Range, cached as immutable)"""
+        digest = urlsplit(self.path).path.rstrip('/').rsplit('/', 1)[-1]
+        try:
+            f, asset = asset_store().open(digest)
+        except AssetError as e:
+            self._send_json({'success': False, 'error': str(e)}, e.status)
+            return
+        with f:
+            etag = f'"{asset.digest}"'
+            if etag in self.headers.get('If-None-Match', ''):
+                self.send_response(304)
+                self._send_asset_headers(etag)
+                self.end_headers()
+                return
 
-        # 1. Handle API: /api/library/upload (Additive)
-        if self.path.endswith("/api/library/upload"):
-            try:
-                content_length = int(self.headers.get('Content-Length', 0))
-                post_data = self.rfile.read(content_length)
-                
-                # Ensure library dir exists
-                lib_dir = os.path.join(APP_PATH, "library")
-                os.makedirs(lib_dir, exist_ok=True)
-                
-                # Parse JSON
+            span = None
+            if_range = self.headers.get('If-Range')
+            if if_range is None or if_range.strip() == etag:
                 try:
-                    library_items = json.loads(post_data)
-                except json.JSONDecodeError:
-                    print("[!] Invalid JSON payload")
-                    self.send_error(400, "Invalid JSON")
+                    span = parse_range(self.headers.get('Range'), asset.size)
+                except AssetError:
+                    self.send_response(416)
+                    self._send_asset_headers(etag)
+                    self.send_header('Content-Range', f'bytes */{asset.size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
                     return
-                
-                # Write new files (Additive, overwrite if specific ID exists)
-                if isinstance(library_items, list):
-                    count = 0
-                    for item in library_items:
-                        safe_title = re.sub(r'[^a-zA-Z0-9]', '_', item.get('title', 'untitled'))[:50]
-                        filename = f"{item.get('id', '0')}_{safe_title}.json"
-                        with open(os.path.join(lib_dir, filename), "w") as f:
-                            json.dump(item, f, indent=2)
-                        count += 1
-                    print(f"    [+] Uploaded {count} items to library.")
-                
-                self.send_response(200)
-                self._send_cors_headers()
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"success": true}')
-                
-            except Exception as e:
-                print(f"[!] Error processing POST: {e}")
-                self.send_error(500, f"Server Error: {str(e)}")
-            return
-            
-        # 2. Handle API: /api/ftp/start or stop (Dummy)
-        if "/api/ftp/" in self.path:
+            start, end = span or (0, asset.size - 1)
+
+            self.send_response(206 if span else 200)
+            self._send_asset_headers(etag)
+            self.send_header('Content-type', asset.content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            if span:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{asset.size}')
+            self.end_headers()
+            try:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(remaining, ASSET_SEND_CHUNK))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    def _send_asset_headers(self, etag):
+        self._send_cors_headers()
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', IMMUTABLE)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Content-Range, Accept-Ranges')
+
+    def serve_library_stream(self):
+        """Handle API: /api/library/stream (NDJSON, one item per line, chunked)"""
+        # HTTP/1.1 clients get chunked encoding; HTTP/1.0 clients a close-delimited body
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        try:
             self.send_response(200)
             self._send_cors_headers()
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self._send_version_headers()
+            self.send_header('Connection', 'close')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
             self.end_headers()
-            self.wfile.write(b'{"success": false, "error": "Not supported in this server mode"}')
+            write = self.wfile.write
+
+            def flush(lines):
+                data = b''.join(lines)
+                write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+
+            # Coalesce small items into chunks of about LIBRARY_STREAM_CHUNK bytes
+            pending, size = [], 0
+            for entry in LIBRARY_CACHE.iter_entries():
+                pending.append(entry + b'\n')
+                size += len(entry) + 1
+                if size >= LIBRARY_STREAM_CHUNK:
+                    flush(pending)
+                    pending, size = [], 0
+            if pending:
+                flush(pending)
+            if chunked:
+                write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.close_connection = True
+            self.protocol_version = RequestHandler.protocol_version
+
+    def serve_static(self):
+        """Serve static files under /ophthalmics"""
+        original_path = self.path
+        # Strip prefix to map to filesystem root
+        self.path = self.path[len(URL_PATH):]
+        if self.path == "":
+            self.path = "/"
+
+        # Server-side state (community event log, dot files) is never served;
+        # assets only through /api/assets
+        parts = os.path.relpath(self.translate_path(self.path), APP_PATH).split(os.sep)
+        if parts[0] in (COMMUNITY_DIR, ASSET_DIR) or any(p.startswith('.') and p != '.' for p in parts):
+            self.path = original_path
+            self.send_error(404, f"Not Found: {self.path}")
             return
+        
+        try:
+            if not self._serve_prerendered_app():
+                super().do_GET()
+        finally:
+            # Restore path (good practice)
+            self.path = original_path
 
-        self.send_error(404, f"API Endpoint Not Found: {self.path}")
+    def _serve_prerendered_app(self):
+        """index.html?item=<id> with the item's pre-rendered poster already in place (see prerender.py)."""
+        path, _, query = self.path.partition('?')
+        if path not in ('/', '/index.html') or 'item=' not in query:
+            return False
+        item_id = parse_qs(query).get('item', [''])[-1]
+        fragment = read_fragment(os.path.join(APP_PATH, RENDER_DIR), item_id) if item_id else None
+        if fragment is None:
+            return False
+        try:
+            with open(os.path.join(APP_PATH, 'index.html'), encoding='utf-8') as f:
+                page = inject_fragment(f.read(), fragment)
+        except OSError:
+            return False
+        if page is None:
+            return False
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def handle_library_upload(self):
+        """Handle API: /api/library/upload (Additive)"""
+        try:
+            post_data = self.read_body()
+            
+            # Ensure library dir exists
+            lib_dir = os.path.join(APP_PATH, "library")
+            os.makedirs(lib_dir, exist_ok=True)
+            
+            # Parse JSON
+            try:
+                library_items = json_loads(post_data)
+            except ValueError:
+                print("[!] Invalid JSON payload")
+                self.send_error(400, "Invalid JSON")
+                return
+            
+            # Write new files (Additive, overwrite if specific ID exists)
+            if isinstance(library_items, list):
+                # Validate and complete every item before writing any (library_ingest.py)
+                now = datetime.now(timezone.utc)
+                new_ids = itertools.count(int(now.timestamp() * 1000))  # like Date.now(), unique per item
+                uploaded_at = now.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+                # An invalid item is reported and skipped; the others are still written
+                canonical, rejected = [], []
+                for position, item in enumerate(library_items):
+                    try:
+                        canonical.append(canonicalize(item, default_id=lambda: next(new_ids),
+                                                      default_title='Untitled', default_date=uploaded_at)[0])
+                    except ItemSchemaError as e:
+                        rejected.append({'index': position, 'error': str(e)})
+                if rejected:
+                    print(f"[!] Rejected {len(rejected)} of {len(library_items)} uploaded items "
+                          f"(first: item {rejected[0]['index']}: {rejected[0]['error']})")
+                library_items = canonical
+
+                count = 0
+                for item in library_items:
+                    safe_title = re.sub(r'[^a-zA-Z0-9]', '_', item['title'])[:50]
+                    filename = f"{item['id']}_{safe_title}.json"
+                    # Write to a temp file and rename, so other workers never read a partial file
+                    # (two requests may upload the same item at once)
+                    path = os.path.join(lib_dir, filename)
+                    tmp_path = temp_path(path)
+                    with open(tmp_path, "wb") as f:
+                        f.write(json_dumps(item, indent=2))
+                    os.replace(tmp_path, path)
+                    count += 1
+                if count:
+                    LIBRARY_CACHE.invalidate()
+                print(f"    [+] Uploaded {count} items to library.")
+                if rejected:
+                    # Nothing written: the request failed; otherwise it succeeded in part
+                    status = 400 if not count else 200
+                    self._send_json({'success': bool(count), 'count': count, 'rejected': rejected,
+                                     'error': f"{len(rejected)} item(s) rejected"}, status)
+                    return
+
+            UPLOAD_OK_RESPONSE.send(self)
+
+        except (BodyTooSlow, TimeoutError) as e:
+            self.reject_request(408, f"Request body timed out: {e}")
+        except Exception as e:
+            print(f"[!] Error processing POST: {e}")
+            self.send_error(500, f"Server Error: {str(e)}")
+
+
+# Constant responses, encoded once at startup
+PREFLIGHT_RESPONSE = Response(200, headers=CORS_HEADERS)
+UPLOAD_OK_RESPONSE = Response(200, b'{"success": true}', 'application/json', CORS_HEADERS)
+
+
+def build_routes():
+    """Build the route table and pre-encode the constant responses."""
+    routes = Router()
+    handler = RequestHandler
+
+    # Dummy FTP status/start/stop to silence errors
+    routes.add('GET', api_paths("/api/ftp/status"), Response(
+        200, b'{"running": false, "port": 2121, "host": "127.0.0.1"}', 'application/json', CORS_HEADERS))
+    routes.add_prefix('POST', api_paths("/api/ftp/"), Response(
+        200, b'{"success": false, "error": "Not supported in this server mode"}', 'application/json', CORS_HEADERS))
+
+    routes.add('GET', api_paths("/api/library/list"), handler.serve_library_list)
+    routes.add('GET', api_paths("/api/library/stream"), handler.serve_library_stream)
+    routes.add('GET', api_paths("/api/library/changes"), handler.serve_library_changes)
+    routes.add('GET', api_paths("/api/library/facets"), handler.serve_library_facets)
+    routes.add('GET', api_paths("/api/library/item"), handler.serve_library_item)
+    routes.add('POST', api_paths("/api/library/upload"), handler.handle_library_upload)
+
+    routes.add('POST', api_paths("/api/assets"), handler.handle_asset_upload)
+    routes.add_prefix('GET', api_paths("/api/assets/"), handler.serve_asset)
+
+    routes.add('GET', api_paths(DEBUG_PATH), handler.serve_profile)
+
+    routes.add('GET', api_paths("/api/community/submissions"), handler.serve_community_submissions)
+    routes.add('GET', api_paths("/api/community/stats"), handler.serve_community_stats)
+    routes.add('GET', api_paths("/api/community/all"), handler.serve_community_document)
+    routes.add('GET', api_paths("/api/community/deleted"), handler.serve_community_deleted)
+    routes.add_prefix('POST', api_paths("/api/community/"), handler.handle_community_action)
+
+    # Redirect root and bare URL_PATH to URL_PATH/, serve static files below it
+    redirect = Response(302, headers=[('Location', URL_PATH + '/')])
+    routes.add('GET', ["/", "", URL_PATH], redirect)
+    routes.add_prefix('GET', URL_PATH, handler.serve_static)
+    return routes
+
+
+RequestHandler.routes = build_routes()
 
 
 def run_http_server():
     """Run server on HTTP port 80."""
     server_address = (BIND_IP, HTTP_PORT)
     try:
-        httpd = http.server.HTTPServer(server_address, RequestHandler)
+        httpd = HTTPServer(server_address, RequestHandler)
         print(f"\n[HTTP] Serving at http://{PUBLIC_IP}{URL_PATH}")
         print(f"[HTTP] (Bound to {BIND_IP}:{HTTP_PORT})")
         httpd.serve_forever()
@@ -247,45 +1156,78 @@ def run_https_server():
 
     server_address = (BIND_IP, HTTPS_PORT)
     try:
-        httpd = http.server.HTTPServer(server_address, RequestHandler)
-        
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        context.load_cert_chain(certfile=CERT_FILE, keyfile=KEY_FILE)
-        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-        
+        httpd = TLSHTTPServer(server_address, RequestHandler, TLSConfig())
         
         print(f"[HTTPS] Serving at https://{PUBLIC_IP}{URL_PATH}")
         print(f"[HTTPS] (Bound to {BIND_IP}:{HTTPS_PORT})")
         httpd.serve_forever()
-    except OSError as e:
+    except (OSError, ssl.SSLError) as e:
         print(f"[!] Error starting HTTPS server: {e}")
 
 
+def run_prefork_servers(workers, with_https=True):
+    """Run HTTP (and HTTPS) in `workers` processes sharing the listening sockets."""
+    addresses = [(BIND_IP, HTTP_PORT)]
+    if with_https:
+        if os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE):
+            addresses.append((BIND_IP, HTTPS_PORT))
+        else:
+            print("[!] Missing certificates. Skipping HTTPS.")
+
+    try:
+        listeners = bind_listeners(addresses)
+    except OSError as e:
+        print(f"[!] Error binding server sockets: {e}")
+        return
+
+    def make_servers(sockets):
+        # Runs in each worker: workers inherit the warm cache and keep its snapshot current
+        LIBRARY_CACHE.start_snapshots()
+        servers = [adopt_socket(HTTPServer, sockets[0], RequestHandler)]
+        if len(sockets) > 1:
+            servers.append(adopt_socket(TLSHTTPServer, sockets[1], RequestHandler, TLSConfig()))
+        return servers
+
+    print(f"\n[HTTP] Serving at http://{PUBLIC_IP}{URL_PATH}")
+    if len(addresses) > 1:
+        print(f"[HTTPS] Serving at https://{PUBLIC_IP}{URL_PATH}")
+    print(f"[*] {workers} worker processes (kill -HUP {os.getpid()} to reload)")
+    serve_prefork(listeners, make_servers, workers)
+
+
 def main():
     print("=== Ophthalmic Infographic Server Launcher ===")
     
     # 1. Privileges
     ensure_root()
+    workers = parse_workers(sys.argv)
     
     # 2. Network Config
     configure_network_interface()
     
     # 3. Certificates
     generate_self_signed_cert()
+
+    # 4. Library cache (warm restart from the last snapshot)
+    print("[*] Loading library cache...")
+    LIBRARY_CACHE.warm_start()
     
-    # 4. Mode Selection
+    # 5. Mode Selection
     print("\nSelect Mode:")
     print(f"1. HTTP (http://{PUBLIC_IP}/ophthalmics)")
     print(f"2. HTTPS (https://{PUBLIC_IP}/ophthalmics)")
     
     # Simple default to HTTP if args provided, else HTTPS
-    if len(sys.argv) > 1 and sys.argv[1].lower() == "http":
+    http_only = len(sys.argv) > 1 and sys.argv[1].lower() == "http"
+    if workers > 1:
+        run_prefork_servers(workers, with_https=not http_only)
+        return
+    LIBRARY_CACHE.start_snapshots()
+    if http_only:
          run_http_server()
     else:
         # Fork logic to run both? For simplicity in this script, let's just pick one or run thread.
         # Running both in threads is better for the user experience.
-        import threading
-        
         print("\n[*] Starting servers...")
         
         t1 = threading.Thread(target=run_http_server)
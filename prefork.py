@@ -0,0 +1,378 @@
+"""
+Multi-process (prefork) mode for server.py and ophthalmics.py.
+
+The master process binds the listening sockets once and forks N workers
+that inherit them (or, with reuse_port=True on Linux, each worker binds its
+own SO_REUSEPORT socket and the kernel balances connections). Each worker runs
+an ordinary http.server/socketserver server on the shared socket, so every
+worker has its own GIL.
+
+The master supervises the workers:
+    - a worker that exits or crashes is respawned (with a short backoff)
+    - a worker whose heartbeat stops for WORKER_STALL_TIMEOUT seconds is killed;
+      the heartbeat comes from the accept loop, so it detects a worker that
+      no longer accepts connections (hung, or stuck in a blocking call on
+      the main thread), not a single stuck request: requests run on their
+      own threads, bounded by the socket timeout and the admission
+      deadlines (admission.py), and other requests keep being served
+    - SIGHUP performs a graceful reload: new workers are started, then the
+      old ones stop accepting, finish their in-flight requests (for up to
+      SHUTDOWN_GRACE seconds) and exit. The new workers are forked from the
+      master, which imported the code and read its configuration at start,
+      so a reload picks up neither code nor config changes; restart the
+      master for those
+    - SIGTERM / SIGINT stop all workers gracefully, in the same way
+
+Workers share state through the filesystem only. VersionStamp is a tiny
+cross-process signal: one worker bumps it after a write, and the others
+see the change on their next check and drop their caches.
+
+Usage:
+    listeners = bind_listeners([('0.0.0.0', 8000)])
+    def make_servers(sockets):
+        return [adopt_socket(http.server.HTTPServer, sockets[0], Handler)]
+    serve_prefork(listeners, make_servers, workers=4)
+
+    # or, on Linux, one SO_REUSEPORT socket per worker:
+    serve_prefork([], make_servers, workers=4, reuse_port=True,
+                  addresses=[('0.0.0.0', 8000)])
+"""
+
+import mmap
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+WORKER_STALL_TIMEOUT = 60   # seconds without a heartbeat before a worker is killed
+RESPAWN_BACKOFF = 1.0       # seconds to wait before respawning a crashed worker
+SHUTDOWN_GRACE = 10         # seconds old workers get to finish before SIGKILL
+SUPERVISE_INTERVAL = 1.0    # seconds between master supervision passes
+LISTEN_BACKLOG = 128
+
+_SLOT = struct.Struct('d')
+
+
+def temp_path(path):
+    """Name for a temp file that is renamed over path when complete.
+
+    Unique per process and thread: prefork workers share the folder, and
+    each worker handles requests on several threads, so the pid alone is not
+    enough (two threads would write the same temp file and one rename would
+    publish a mix of both, or fail).
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _drain_requests(deadline):
+    """Wait until deadline (a time.monotonic() value) for the request threads to finish.
+
+    os._exit() would kill them mid-response. Workers run requests on
+    non-daemon threads; their own helper threads are daemons.
+    """
+    current = threading.current_thread()
+    for thread in threading.enumerate():
+        if thread is not current and not thread.daemon:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+class VersionStamp:
+    """A file whose identity changes whenever any process calls bump().
+
+    token() is a single stat() call; compare it with the value seen when a
+    cache was filled to know whether another process invalidated it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def token(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def bump(self):
+        """Atomically replace the stamp file (new inode, new mtime)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = temp_path(self.path)  # concurrent uploads bump at once
+        with open(tmp, 'w') as f:
+            f.write(f"{time.time_ns()} {os.getpid()}\n")
+        os.replace(tmp, self.path)
+
+
+def bind_listeners(addresses, reuse_port=False):
+    """Create, bind and listen on one TCP socket per (host, port) address."""
+    sockets = []
+    for host, port in addresses:
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(LISTEN_BACKLOG)
+        sock.set_inheritable(True)
+        sockets.append(sock)
+    return sockets
+
+
+def adopt_socket(server_class, sock, handler_class, *args, **kwargs):
+    """Build a socketserver-style server around an already listening socket."""
+    server = server_class(sock.getsockname()[:2], handler_class, *args,
+                          bind_and_activate=False, **kwargs)
+    server.socket.close()
+    server.socket = sock
+    server.server_address = sock.getsockname()
+    return server
+
+
+class _Heartbeats:
+    """One float per worker slot in anonymous shared memory (inherited by fork)."""
+
+    def __init__(self, slots):
+        self._map = mmap.mmap(-1, _SLOT.size * slots)
+
+    def beat(self, slot):
+        _SLOT.pack_into(self._map, slot * _SLOT.size, time.monotonic())
+
+    def last(self, slot):
+        return _SLOT.unpack_from(self._map, slot * _SLOT.size)[0]
+
+
+class PreforkMaster:
+    """Fork and supervise worker processes serving the given listeners."""
+
+    def __init__(self, listeners, make_servers, workers, reuse_port=False, addresses=None):
+        self.listeners = listeners
+        self.make_servers = make_servers
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.addresses = addresses
+        self.heartbeats = _Heartbeats(workers * 2)  # room for old+new generation during reload
+        self.children = {}  # pid -> slot
+        self._stopping = False
+        self._reload = False
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_w, False)
+
+    # -- worker --------------------------------------------------------------
+
+    def _run_worker(self, slot):
+        """Worker process body. Never returns."""
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the master
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+        if self.reuse_port and self.addresses:
+            sockets = bind_listeners(self.addresses, reuse_port=True)
+        else:
+            sockets = self.listeners
+        servers = self.make_servers(sockets)
+
+        # Heartbeat from the main serving loop (runs every poll interval and after
+        # each accepted connection), so a worker that stops accepting stops beating.
+        # Requests run on their own threads and do not hold it up.
+        heartbeats = self.heartbeats
+        main_server = servers[-1]
+        service_actions = main_server.service_actions
+
+        def beat_and_service():
+            heartbeats.beat(slot)
+            service_actions()
+
+        main_server.service_actions = beat_and_service
+        heartbeats.beat(slot)
+
+        # Request threads are joined before the process exits (see _drain_requests)
+        for server in servers:
+            server.daemon_threads = False
+            server.block_on_close = False
+        stopped = []
+
+        def stop(signum, frame):
+            stopped.append(time.monotonic())
+            for server in servers:
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+
+        for server in servers[:-1]:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        code = 0
+        try:
+            servers[-1].serve_forever()
+        except Exception as e:
+            print(f"[!] Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            for server in servers:
+                server.server_close()
+        # The master sends SIGKILL SHUTDOWN_GRACE seconds after SIGTERM; exit just before
+        started = stopped[0] if stopped else time.monotonic()
+        _drain_requests(started + SHUTDOWN_GRACE - 1)
+        os._exit(code)
+
+    # -- master --------------------------------------------------------------
+
+    def _free_slot(self):
+        used = set(self.children.values())
+        for slot in range(self.workers * 2):
+            if slot not in used:
+                return slot
+        return None
+
+    def _spawn(self):
+        slot = self._free_slot()
+        if slot is None:
+            return None
+        self.heartbeats.beat(slot)
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)
+        self.children[pid] = slot
+        return pid
+
+    def _signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        elif signum in (signal.SIGTERM, signal.SIGINT):
+            self._stopping = True
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
+
+    def _reap(self):
+        """Collect exited workers; returns the pids that exited."""
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.children.pop(pid, None) is not None:
+                exited.append((pid, status))
+        return exited
+
+    def _terminate(self, pids, grace=SHUTDOWN_GRACE):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + grace
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid, _ in self._reap():
+                remaining.discard(pid)
+            remaining &= set(self.children)
+            time.sleep(0.05)
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _graceful_reload(self):
+        print(f"[*] Reloading {self.workers} worker(s)...")
+        old = list(self.children)
+        for _ in range(self.workers):
+            self._spawn()
+        self._terminate(old)
+        print("    [+] Reload complete.")
+
+    def _check_health(self):
+        now = time.monotonic()
+        for pid, slot in list(self.children.items()):
+            if now - self.heartbeats.last(slot) > WORKER_STALL_TIMEOUT:
+                print(f"[!] Worker {pid} stopped responding; killing it.")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def run(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, self._signal)
+
+        for _ in range(self.workers):
+            self._spawn()
+        print(f"[*] Prefork master {os.getpid()} started {self.workers} worker(s).")
+
+        while not self._stopping:
+            if _readable(self._wake_r, SUPERVISE_INTERVAL):
+                os.read(self._wake_r, 64)
+            if self._stopping:
+                break
+            if self._reload:
+                self._reload = False
+                self._graceful_reload()
+            for pid, status in self._reap():
+                print(f"[!] Worker {pid} exited (status {status}); respawning.")
+                time.sleep(RESPAWN_BACKOFF)
+            while len(self.children) < self.workers and not self._stopping:
+                if self._spawn() is None:
+                    break
+            self._check_health()
+
+        print("\n[*] Stopping workers...")
+        self._terminate(list(self.children))
+        for sock in self.listeners:
+            sock.close()
+
+
+def _readable(fd, timeout):
+    try:
+        ready, _, _ = select.select([fd], [], [], timeout)
+    except InterruptedError:
+        return False
+    return bool(ready)
+
+
+def serve_prefork(listeners, make_servers, workers, reuse_port=False, addresses=None):
+    """Run make_servers(sockets) in `workers` forked processes until stopped.
+
+    With reuse_port=True (Linux), pass `addresses` and no listeners: each
+    worker binds its own SO_REUSEPORT socket and the kernel spreads connections
+    across them. Otherwise workers share the inherited listeners.
+    """
+    if not hasattr(os, 'fork'):
+        print("[!] Prefork mode needs os.fork(); running a single process instead.")
+        servers = make_servers(listeners or bind_listeners(addresses))
+        for server in servers[:-1]:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[-1].serve_forever()
+        return
+    PreforkMaster(listeners, make_servers, workers, reuse_port, addresses).run()
+
+
+def parse_workers(argv, default=1):
+    """Remove --workers N / --workers=N from argv and return N."""
+    workers = default
+    for i, arg in enumerate(list(argv)):
+        if arg == '--workers' and i + 1 < len(argv):
+            value = argv[i + 1]
+            del argv[i:i + 2]
+        elif arg.startswith('--workers='):
+            value = arg.split('=', 1)[1]
+            del argv[i]
+        else:
+            continue
+        try:
+            workers = max(1, int(value))
+        except ValueError:
+            print(f"[!] Invalid --workers value '{value}', using {default}.", file=sys.stderr)
+        break
+    return workers
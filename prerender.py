@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Static pre-rendering of library infographics.
+
+Turns each library item into the same poster markup that renderInfographic()
+in script.js builds in the browser, so a page shows a readable infographic on
+first paint without downloading the index or running any JavaScript.
+
+Pages are content addressed: each one is written as RENDER_DIR/<hash>.html,
+where the hash covers the item's rendered fields and RENDERER_VERSION. An
+unchanged item is never rendered twice, and MANIFEST_FILE maps item ids to
+their current page. Pages no longer referenced by the manifest are removed.
+RENDER_DIR/index.html lists every page, so the whole library can be read
+(and crawled) without JavaScript.
+
+The pages are used in two ways:
+    - each page links to index.html?item=<id>, where script.js opens the
+      item in the interactive view
+    - for index.html?item=<id>, ophthalmics.py puts the item's poster
+      (read_fragment) into the app page (inject_fragment), so the
+      infographic is on screen before script.js has loaded
+
+Differences from the browser renderer:
+    - all text is HTML-escaped (the browser inserts section text as markup)
+    - the summary illustration SVG, category badge and studio buttons are left
+      out; the page links back to the app for the interactive view
+
+Usage:
+    python prerender.py          # render every item in library-index.json
+
+    page = inject_fragment(app_html, read_fragment(RENDER_DIR, item_id))
+"""
+
+import json
+import hashlib
+import re
+from html import escape
+from pathlib import Path
+from urllib.parse import quote
+
+from library_offsets import LibraryIndex
+
+SCRIPT_DIR = Path(__file__).parent
+RENDER_DIR = SCRIPT_DIR / "rendered"
+MANIFEST_FILE = RENDER_DIR / "manifest.json"
+LISTING_FILE = "index.html"   # the library listing in RENDER_DIR (kept when pruning pages)
+RENDERER_VERSION = 2  # bump when the markup changes so every page is re-rendered
+
+# Around the poster in every page; read_fragment() returns what is between them
+FRAGMENT_START = "<!-- prerendered:start -->"
+FRAGMENT_END = "<!-- prerendered:end -->"
+# In index.html: the empty-state markup of #output-container ends at APP_SLOT_END
+APP_SLOT_START = '<div id="output-container" class="output-wrapper empty-state">'
+APP_SLOT_END = "<!-- Infographic content will be injected here -->"
+
+# Mirrors ICON_FALLBACK_MAP in script.js
+ICON_FALLBACK_MAP = {
+    'farsight': 'visibility',
+    'farsightedness_icon': 'visibility',
+    'far_sight': 'visibility',
+    'monitored_heart': 'monitor_heart',
+    'monitor_heart_beat': 'monitor_heart',
+    'heart_monitor': 'monitor_heart',
+    'monitoring_heart': 'monitor_heart',
+    'fluid_meditation': 'self_improvement',
+    'fluid_meditate': 'self_improvement',
+    'meditation_fluid': 'self_improvement',
+    'biomedical_extraction': 'biotech',
+    'biomed_extraction': 'biotech',
+    'bio_extraction': 'biotech',
+    'biomedical': 'biotech',
+    'red_flag': 'flag',
+    'red_flag_icon': 'flag',
+    'calculation': 'calculate',
+    'calculator': 'calculate',
+    'abacus': 'calculate',
+}
+ICON_NAME_RE = re.compile(r'^[a-z][a-z0-9_]*$')
+ICON_STRIP_RE = re.compile(r'[()\[\]{}"\']')
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title} | Ophthalmic Infographic Library</title>
+    <meta name="description" content="{summary}">
+    <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=Outfit:wght@300;400;500;600;700&display=swap">
+    <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Material+Symbols+Rounded:opsz,wght,FILL,GRAD@24,400,0,0">
+    <link rel="stylesheet" href="../style.css">
+</head>
+<body>
+    <main id="output-container" class="output-wrapper">
+{start}{fragment}{end}
+    </main>
+    <p style="text-align: center; margin: 2rem 0;"><a href="../index.html?item={item_id}">Open in the Infographic Creator</a></p>
+</body>
+</html>
+"""
+
+LISTING_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Ophthalmic Infographic Library</title>
+    <link rel="stylesheet" href="../style.css">
+</head>
+<body>
+    <main style="max-width: 48rem; margin: 2rem auto; padding: 0 1rem;">
+        <h1>Ophthalmic Infographic Library</h1>
+        <p><a href="../index.html">Open the Infographic Creator</a></p>
+        <ul>
+{entries}
+        </ul>
+    </main>
+</body>
+</html>
+"""
+
+
+def js_text(value):
+    """Return value as JavaScript's template interpolation would show it."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        return ','.join(js_text(v) for v in value)
+    if isinstance(value, dict):
+        return '[object Object]'
+    return str(value)
+
+
+def join_values(obj, sep):
+    """Object.values(obj).join(sep)"""
+    return sep.join(js_text(v) for v in obj.values())
+
+
+def entry_text(entry, keys, sep=': '):
+    """Text of a list entry: the first truthy key of an object, else its joined values."""
+    if isinstance(entry, dict):
+        for key in keys:
+            if entry.get(key):
+                return js_text(entry[key])
+        return join_values(entry, sep)
+    return js_text(entry)
+
+
+def sanitize_icon(name):
+    """Port of sanitizeMaterialIcon() in script.js."""
+    if not name or not isinstance(name, str):
+        return 'circle'
+    cleaned = ICON_STRIP_RE.sub('', name.strip().lower().replace('-', '_')).strip()
+    if ',' in cleaned:
+        cleaned = cleaned.split(',')[0].strip()
+    if cleaned in ICON_FALLBACK_MAP:
+        return ICON_FALLBACK_MAP[cleaned]
+    return cleaned if ICON_NAME_RE.match(cleaned) else 'circle'
+
+
+def render_content(section):
+    """Return the card-content markup for one section."""
+    kind = section.get('type')
+    content = section.get('content')
+    text_keys = ('title', 'text', 'description', 'content')
+
+    if kind == 'red_flag':
+        flags = content if isinstance(content, list) else [content]
+        items = ''.join(
+            '<li><span class="material-symbols-rounded warning-icon">warning</span>'
+            f'{escape(entry_text(flag, text_keys))}</li>'
+            for flag in flags)
+        return f'<ul class="warning-list">{items}</ul>'
+
+    if kind == 'chart':
+        rows = content.get('data') or [] if isinstance(content, dict) else []
+        html = []
+        for row in rows:
+            row = row if isinstance(row, dict) else {}
+            value = escape(js_text(row.get('value')))
+            html.append(
+                '<div class="chart-row">'
+                f'<div class="chart-label">{escape(js_text(row.get("label")))}</div>'
+                '<div class="chart-bar-container">'
+                f'<div class="chart-bar" style="width: {value}%"></div>'
+                f'<span class="chart-val">{value}%</span>'
+                '</div></div>')
+        return f'<div class="bar-chart">{"".join(html)}</div>'
+
+    if kind == 'remember':
+        mem = content if isinstance(content, dict) else {}
+        return ('<div class="mnemonic-box">'
+                f'<div class="mnemonic-title">{escape(js_text(mem.get("mnemonic") or "REMEMBER"))}</div>'
+                f'<div class="mnemonic-text">{escape(js_text(mem.get("explanation")))}</div>'
+                '</div>')
+
+    if kind == 'mindmap':
+        mind = content if isinstance(content, dict) else {}
+        center = mind.get('center')
+        if isinstance(center, dict):
+            center_text = entry_text(center, ('title', 'text'), ' ')
+        else:
+            center_text = js_text(center or 'Central Topic')
+        branches = ''.join(
+            f'<div class="mindmap-branch">{escape(entry_text(b, ("title", "text", "name", "branch")))}</div>'
+            for b in mind.get('branches') or [])
+        return ('<div class="mindmap-container">'
+                f'<div class="mindmap-center">{escape(center_text)}</div>'
+                f'<div class="mindmap-branches">{branches}</div>'
+                '</div>')
+
+    if kind in ('key_point', 'process'):
+        points = content if isinstance(content, list) else [content]
+        items = ''.join(f'<li>{escape(entry_text(p, text_keys))}</li>' for p in points)
+        return f'<ul class="card-list">{items}</ul>'
+
+    if kind == 'table':
+        if isinstance(content, dict) and content.get('headers') and content.get('rows'):
+            head = ''.join(f'<th>{escape(js_text(h))}</th>' for h in content['headers'])
+            body = ''.join(
+                '<tr>' + ''.join(f'<td>{escape(js_text(c))}</td>'
+                                 for c in (row if isinstance(row, list) else [row])) + '</tr>'
+                for row in content['rows'])
+            return ('<div class="table-wrapper"><table class="data-table">'
+                    f'<thead><tr>{head}</tr></thead><tbody>{body}</tbody>'
+                    '</table></div>')
+        return '<p class="plain-text">Invalid table data received.</p>'
+
+    # plain_text and anything unknown
+    if isinstance(content, list):
+        lines = [join_values(i, ': ') if isinstance(i, dict) else js_text(i) for i in content]
+        return '<p class="plain-text">' + '<br>'.join(escape(line) for line in lines) + '</p>'
+    if isinstance(content, dict):
+        return f'<p class="plain-text">{escape(join_values(content, ": "))}</p>'
+    return f'<p class="plain-text">{escape(js_text(content))}</p>'
+
+
+def render_section(section):
+    """Return the poster-card markup for one section."""
+    if not isinstance(section, dict):
+        section = {'content': section}
+    classes = ['poster-card', f'card-{js_text(section.get("type"))}']
+    if section.get('layout') == 'full_width':
+        classes.append('col-span-2')
+    classes.append(f'theme-{js_text(section.get("color_theme") or "blue")}')
+    icon = sanitize_icon(section.get('icon') or 'circle')
+    return (f'<div class="{escape(" ".join(classes))}">'
+            '<h3 class="card-title">'
+            f'<div class="icon-box"><span class="material-symbols-rounded">{icon}</span></div>'
+            f'{escape(js_text(section.get("title")))}</h3>'
+            f'<div class="card-content">{render_content(section)}</div>'
+            '</div>')
+
+
+def render_fields(item):
+    """Return the fields that make up an item's page (id, title, summary, sections)."""
+    data = item.get('data') if isinstance(item.get('data'), dict) else {}
+    sections = data.get('sections') or []
+    if isinstance(sections, dict):
+        sections = list(sections.values())
+    return {
+        'id': js_text(item.get('id')),
+        'title': data.get('title') or item.get('title') or 'Untitled Infographic',
+        'summary': data.get('summary') or item.get('summary') or '',
+        'sections': sections,
+    }
+
+
+def render_fragment(fields):
+    """Return the poster-sheet markup for an item's render fields."""
+    cards = ''.join(render_section(s) for s in fields['sections'])
+    return ('<div class="poster-sheet">'
+            '<header class="poster-header"><div class="header-decoration"></div>'
+            f'<h1 class="poster-title">{escape(js_text(fields["title"]))}</h1>'
+            f'<p class="poster-summary">{escape(js_text(fields["summary"]))}</p>'
+            '</header>'
+            f'<div class="poster-grid">{cards}</div>'
+            '</div>')
+
+
+def render_page(fields):
+    """Return a complete, standalone HTML page for an item."""
+    return PAGE_TEMPLATE.format(
+        title=escape(js_text(fields['title'])),
+        summary=escape(js_text(fields['summary'])),
+        item_id=quote(fields['id'], safe=''),
+        start=FRAGMENT_START, end=FRAGMENT_END,
+        fragment=render_fragment(fields))
+
+
+def render_listing(entries):
+    """Return the library listing page for (page name, title) pairs."""
+    lines = [f'            <li><a href="{escape(name)}">{escape(js_text(title))}</a></li>'
+             for name, title in entries]
+    return LISTING_TEMPLATE.format(entries='\n'.join(lines))
+
+
+def content_hash(fields):
+    """Return the cache key of an item's page."""
+    canonical = json.dumps([RENDERER_VERSION, fields], sort_keys=True,
+                           ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:20]
+
+
+def render_library(items, out_dir=None):
+    """Render every item into out_dir, reusing pages whose content hash is unchanged.
+
+    Returns (rendered, reused). Writes manifest.json ({id: page file name})
+    and the listing page, and removes pages that no item references any more.
+    """
+    out_dir = Path(out_dir or RENDER_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    listing = []
+    rendered = reused = 0
+
+    for item in items:
+        fields = render_fields(item)
+        name = f"{content_hash(fields)}.html"
+        manifest[str(item.get('id'))] = name
+        listing.append((name, fields['title']))
+        page = out_dir / name
+        if page.exists():
+            reused += 1
+            continue
+        tmp = page.with_suffix('.tmp')
+        tmp.write_text(render_page(fields), encoding='utf-8')
+        tmp.replace(page)
+        rendered += 1
+
+    live = set(manifest.values()) | {LISTING_FILE}
+    for stale in out_dir.glob('*.html'):
+        if stale.name not in live:
+            stale.unlink()
+
+    tmp = out_dir / f'{LISTING_FILE}.tmp'
+    tmp.write_text(render_listing(listing), encoding='utf-8')
+    tmp.replace(out_dir / LISTING_FILE)
+
+    tmp = out_dir / 'manifest.json.tmp'
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+    tmp.replace(out_dir / 'manifest.json')
+    return rendered, reused
+
+
+def read_fragment(render_dir, item_id):
+    """The pre-rendered poster markup of an item (str), or None if it has no page."""
+    render_dir = Path(render_dir)
+    try:
+        manifest = json.loads((render_dir / 'manifest.json').read_text(encoding='utf-8'))
+        name = manifest.get(str(item_id))
+        if not name:
+            return None
+        page = (render_dir / name).read_text(encoding='utf-8')
+    except (OSError, ValueError):
+        return None
+    start = page.find(FRAGMENT_START)
+    end = page.find(FRAGMENT_END, start)
+    if start < 0 or end < 0:
+        return None  # rendered before RENDERER_VERSION 2
+    return page[start + len(FRAGMENT_START):end]
+
+
+def inject_fragment(app_html, fragment):
+    """Put a poster into the app page's #output-container in place of the empty state.
+
+    The empty-state markup is kept (hidden) because script.js binds its
+    button; renderInfographic() replaces the container's content anyway.
+    Returns None if the page has no output container to fill.
+    """
+    start = app_html.find(APP_SLOT_START)
+    end = app_html.find(APP_SLOT_END, start)
+    if start < 0 or end < 0:
+        return None
+    empty_state = app_html[start + len(APP_SLOT_START):end]
+    return (app_html[:start]
+            + '<div id="output-container" class="output-wrapper">'
+            + f'<div hidden>{empty_state}</div>{fragment}'
+            + app_html[end:])
+
+
+def main():
+    published = LibraryIndex(SCRIPT_DIR / "library-index.json")
+    if published.available:
+        # One item decoded at a time from the memory-mapped index
+        rendered, reused = render_library(published.get(record.id) for record in published.records())
+        print(f"[+] Rendered {rendered} page(s), reused {reused} unchanged page(s) in {RENDER_DIR}")
+        return
+
+    index = json.loads((SCRIPT_DIR / "library-index.json").read_text(encoding='utf-8'))
+    items = index
+    if isinstance(index, dict):
+        # Shared-sections index: swap {"$ref": hash} pointers back for their sections
+        shared = index.get('sections') or {}
+        items = index['items']
+        for item in items:
+            sections = (item.get('data') or {}).get('sections') or []
+            for pos, section in enumerate(sections):
+                if isinstance(section, dict) and '$ref' in section:
+                    sections[pos] = shared.get(section['$ref'], section)
+    rendered, reused = render_library(items)
+    print(f"[+] Rendered {rendered} page(s), reused {reused} unchanged page(s) in {RENDER_DIR}")
+
+
+if __name__ == "__main__":
+    main()
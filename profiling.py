@@ -0,0 +1,345 @@
+"""
+Opt-in request profiling for server.py and ophthalmics.py.
+
+Everything is off by default and costs one attribute check per request.
+It can be switched on from the config constants or at runtime through the
+localhost-only /debug/profile endpoint, without restarting the server:
+
+    /debug/profile                          text report (slow requests, hot functions, memory)
+    /debug/profile?rate=0.1                 cProfile 10% of requests (aggregated)
+    /debug/profile?slow_ms=250              log requests slower than 250 ms
+    /debug/profile?tracemalloc=start|stop   allocation tracking (report shows top lines and growth)
+    /debug/profile?sampler=start|stop       wall-clock stack sampler for flame graphs
+    /debug/profile?reset=1                  clear collected data
+    /debug/profile?format=json              summary as JSON
+    /debug/profile?format=pstats            aggregated stats (pstats.Stats / snakeviz / flameprof)
+    /debug/profile?format=collapsed         folded stacks (flamegraph.pl / speedscope)
+
+Slow requests that were profiled are also written to PROFILE_DUMP_DIR as
+individual .prof files. In prefork mode every worker has its own profiler;
+the report says which pid answered.
+
+Usage:
+    class Handler(AccessLogMixin, ProfilingMixin, http.server.SimpleHTTPRequestHandler):
+        profiler = Profiler(sample_rate=0.0, slow_ms=500, dump_dir='logs/profiles')
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+DEBUG_PATH = '/debug/profile'
+LOOPBACK_CLIENTS = ('127.0.0.1', '::1')
+SLOW_HISTORY = 50             # slow requests kept for the report
+REPORT_LIMIT = 30             # functions / allocation sites listed in the text report
+SAMPLER_INTERVAL = 0.005      # seconds between stack samples
+TRACEMALLOC_FRAMES = 10
+
+
+class Profiler:
+    """Per-process profiling state shared by all request threads."""
+
+    def __init__(self, sample_rate=0.0, slow_ms=None, dump_dir=None):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.dump_dir = dump_dir
+        self.started = time.time()
+        self.requests = 0
+        self.profiled = 0
+        self.slow = deque(maxlen=SLOW_HISTORY)
+        self._stats = None
+        self._lock = threading.Lock()
+        # cProfile allows one active profiler per process (3.12+), so sample one request at a time
+        self._profiling = threading.Lock()
+        self._malloc_baseline = None
+        self._active_threads = set()
+        self._stacks = {}             # guarded by _lock (written by the sampler thread)
+        self._sampler = None
+        self._dump_ids = itertools.count(1)
+
+    @property
+    def enabled(self):
+        return bool(self.sample_rate or self.slow_ms or self._sampler)
+
+    # -- request side --------------------------------------------------------
+
+    def run(self, handler, handle):
+        """Run handle() for one request, profiling and timing it as configured."""
+        profile = None
+        if self.sample_rate and random.random() < self.sample_rate and self._profiling.acquire(blocking=False):
+            profile = cProfile.Profile()
+        thread_id = threading.get_ident()
+        self._active_threads.add(thread_id)
+        started = time.perf_counter()
+        try:
+            if profile is not None:
+                profile.runcall(handle)
+            else:
+                handle()
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._active_threads.discard(thread_id)
+            if profile is not None:
+                self._profiling.release()
+            if getattr(handler, 'raw_requestline', b''):
+                self._record(handler, elapsed_ms, profile)
+
+    def _record(self, handler, elapsed_ms, profile):
+        path = getattr(handler, 'path', '') or ''
+        if path.startswith(DEBUG_PATH):
+            return
+        with self._lock:
+            self.requests += 1
+            if profile is not None:
+                self.profiled += 1
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            entry = {
+                'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'method': getattr(handler, 'command', None),
+                'path': path,
+                'ms': round(elapsed_ms, 1),
+                'dump': None,
+            }
+            if profile is not None and self.dump_dir:
+                entry['dump'] = self._dump(profile)
+            with self._lock:
+                self.slow.append(entry)
+
+    def _dump(self, profile):
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            path = os.path.join(self.dump_dir, f"slow-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._dump_ids)}.prof")
+            profile.dump_stats(path)
+            return path
+        except OSError:
+            return None
+
+    # -- control -------------------------------------------------------------
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self.requests = 0
+            self.profiled = 0
+            self.slow.clear()
+            self._stacks = {}
+            self.started = time.time()
+        if tracemalloc.is_tracing():
+            self._malloc_baseline = tracemalloc.take_snapshot()
+
+    def start_tracemalloc(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._malloc_baseline = tracemalloc.take_snapshot()
+
+    def stop_tracemalloc(self):
+        tracemalloc.stop()
+        self._malloc_baseline = None
+
+    def start_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+            self._sampler.start()
+
+    def stop_sampler(self):
+        self._sampler = None  # the loop exits on its next tick
+
+    def _sample_loop(self):
+        me = threading.current_thread()
+        while self._sampler is me:
+            frames = sys._current_frames()
+            keys = []
+            for thread_id in list(self._active_threads):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                keys.append(';'.join(reversed(stack)))
+            del frames
+            with self._lock:
+                for key in keys:
+                    self._stacks[key] = self._stacks.get(key, 0) + 1
+            time.sleep(SAMPLER_INTERVAL)
+
+    def configure(self, query):
+        """Apply /debug/profile query parameters; returns a list of what changed."""
+        changes = []
+        if 'reset' in query:
+            self.reset()
+            changes.append('reset')
+        if 'rate' in query:
+            self.sample_rate = min(1.0, max(0.0, float(query['rate'])))
+            changes.append(f"rate={self.sample_rate}")
+        if 'slow_ms' in query:
+            self.slow_ms = float(query['slow_ms']) or None
+            changes.append(f"slow_ms={self.slow_ms}")
+        if query.get('tracemalloc') == 'start':
+            self.start_tracemalloc()
+            changes.append('tracemalloc started')
+        elif query.get('tracemalloc') == 'stop':
+            self.stop_tracemalloc()
+            changes.append('tracemalloc stopped')
+        if query.get('sampler') == 'start':
+            self.start_sampler()
+            changes.append('sampler started')
+        elif query.get('sampler') == 'stop':
+            self.stop_sampler()
+            changes.append('sampler stopped')
+        return changes
+
+    # -- reports -------------------------------------------------------------
+
+    def pstats_bytes(self):
+        """Aggregated stats in the marshal format written by pstats.Stats.dump_stats()."""
+        with self._lock:
+            return marshal.dumps(self._stats.stats if self._stats is not None else {})
+
+    def collapsed(self):
+        """Sampled stacks as 'frame;frame;frame count' lines."""
+        with self._lock:
+            stacks = dict(self._stacks)
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def hot_functions(self, sort='cumulative', limit=REPORT_LIMIT):
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            sort = 'cumulative'
+        with self._lock:
+            if self._stats is None:
+                return ''
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+    def memory_top(self, limit=REPORT_LIMIT):
+        """Top allocation sites and growth since the baseline snapshot."""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        top = [str(stat) for stat in snapshot.statistics('lineno')[:limit]]
+        growth = []
+        if self._malloc_baseline is not None:
+            growth = [str(stat) for stat in snapshot.compare_to(self._malloc_baseline, 'lineno')[:limit]]
+        return {'current_kb': current // 1024, 'peak_kb': peak // 1024, 'top': top, 'growth': growth}
+
+    def summary(self):
+        with self._lock:
+            sampled_stacks = sum(self._stacks.values())
+            slow = list(self.slow)
+        return {
+            'pid': os.getpid(),
+            'since': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'requests': self.requests,
+            'profiled': self.profiled,
+            'sampler': self._sampler is not None,
+            'sampled_stacks': sampled_stacks,
+            'slow': slow,
+            'memory': self.memory_top(),
+        }
+
+    def text_report(self, sort='cumulative'):
+        s = self.summary()
+        lines = [
+            f"Profiler (pid {s['pid']}) since {s['since']}",
+            f"  sample rate {s['sample_rate']}, slow threshold {s['slow_ms']} ms, sampler {'on' if s['sampler'] else 'off'}",
+            f"  {s['requests']} requests, {s['profiled']} profiled, {s['sampled_stacks']} stack samples",
+            '',
+            f"Slow requests (last {SLOW_HISTORY}):",
+        ]
+        for entry in s['slow']:
+            dump = f"  -> {entry['dump']}" if entry['dump'] else ''
+            lines.append(f"  {entry['ts']} {entry['ms']:>8.1f} ms  {entry['method']} {entry['path']}{dump}")
+        if not s['slow']:
+            lines.append('  (none)')
+        memory = s['memory']
+        if memory is not None:
+            lines += ['', f"Memory: {memory['current_kb']} KiB traced, peak {memory['peak_kb']} KiB", 'Top allocations:']
+            lines += [f"  {line}" for line in memory['top']]
+            if memory['growth']:
+                lines.append('Growth since baseline:')
+                lines += [f"  {line}" for line in memory['growth']]
+        hot = self.hot_functions(sort)
+        lines += ['', f"Hot functions (sorted by {sort}):", hot or '  (no profiled requests yet; try ?rate=0.1)']
+        return '\n'.join(lines) + '\n'
+
+
+class ProfilingMixin:
+    """Request handler mixin: runs each request through `profiler` and serves /debug/profile.
+
+    Put it before the http.server base class and set `profiler`. Register
+    serve_profile for DEBUG_PATH in the handler's route table.
+    """
+
+    profiler = None
+
+    def handle_one_request(self):
+        profiler = self.profiler
+        if profiler is None or not profiler.enabled:
+            return super().handle_one_request()
+        profiler.run(self, super().handle_one_request)
+
+    def serve_profile(self):
+        """Localhost only: profiling report, controls and dumps."""
+        client = self.client_address[0] if self.client_address else ''
+        if client not in LOOPBACK_CLIENTS or self.profiler is None:
+            self.send_error(403, 'Forbidden')
+            return
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        try:
+            changes = self.profiler.configure(query)
+        except ValueError as e:
+            self.send_error(400, f"Bad profiling parameter: {e}")
+            return
+
+        fmt = query.get('format', 'text')
+        if fmt == 'pstats':
+            body = self.profiler.pstats_bytes()
+            content_type = 'application/octet-stream'
+        elif fmt == 'collapsed':
+            body = self.profiler.collapsed().encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        elif fmt == 'json':
+            summary = self.profiler.summary()
+            summary['changes'] = changes
+            body = json.dumps(summary, indent=2).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            report = self.profiler.text_report(query.get('sort', 'cumulative'))
+            if changes:
+                report = f"Applied: {', '.join(changes)}\n\n{report}"
+            body = report.encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        if fmt == 'pstats':
+            self.send_header('Content-Disposition', f'attachment; filename="profile-{os.getpid()}.prof"')
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,174 @@
+"""
+Shared request routing for server.py and ophthalmics.py.
+
+Routes are registered once at startup in exact-match, prefix and suffix
+tables and resolved with a single lookup per request. Constant responses
+(health checks, redirects, robots.txt, dummy API replies) are encoded to
+bytes up front so serving them is a dictionary lookup and one write.
+
+Usage:
+    routes = Router()
+    routes.add('GET', '/robots.txt', Response(200, b'...', 'text/plain'))
+    routes.add('GET', '/status', lambda handler: ...)
+    routes.add_prefix('GET', '/static/', serve_static)
+
+    # inside do_GET
+    if routes.dispatch(self, 'GET'):
+        return
+"""
+
+import time
+from email.utils import formatdate
+from http import HTTPStatus
+
+_date_cache = [0, '']
+
+
+def http_date():
+    """Return the current RFC 7231 date, recomputed at most once per second."""
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[0] = now
+        _date_cache[1] = formatdate(now, usegmt=True)
+    return _date_cache[1]
+
+
+def _reason(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+class Response:
+    """A response whose headers and body are encoded once.
+
+    The status line depends on the handler's protocol version and server
+    string, so the full head is cached per (protocol, server) pair on first use.
+    """
+
+    __slots__ = ('status', 'body', 'headers', '_header_block', '_heads')
+
+    def __init__(self, status, body=b'', content_type=None, headers=()):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.status = status
+        self.body = body
+        self.headers = list(headers)
+        if content_type:
+            self.headers.insert(0, ('Content-type', content_type))
+        if not any(name.lower() == 'content-length' for name, _ in self.headers):
+            self.headers.append(('Content-Length', str(len(body))))
+        self._header_block = b''.join(
+            f'{name}: {value}\r\n'.encode('latin-1', 'strict') for name, value in self.headers
+        )
+        self._heads = {}
+
+    def _head(self, handler):
+        key = (handler.protocol_version, handler.version_string())
+        head = self._heads.get(key)
+        if head is None:
+            head = (
+                f'{key[0]} {self.status} {_reason(self.status)}\r\n'
+                f'Server: {key[1]}\r\n'
+            ).encode('latin-1', 'strict')
+            self._heads[key] = head
+        return head
+
+    def send(self, handler, include_body=True):
+        """Write the whole response to the handler's socket."""
+        handler.wfile.write(b''.join((
+            self._head(handler),
+            b'Date: ', http_date().encode('ascii'), b'\r\n',
+            self._header_block,
+            b'\r\n',
+            self.body if include_body else b'',
+        )))
+        handler.log_request(self.status, len(self.body))
+
+    def __call__(self, handler):
+        self.send(handler)
+
+
+class TimedResponse:
+    """A response rebuilt at most once per `ttl` seconds by `build(now)`.
+
+    Useful for bodies such as health checks that carry a coarse timestamp.
+    """
+
+    __slots__ = ('build', 'ttl', '_expires', '_response')
+
+    def __init__(self, build, ttl=1):
+        self.build = build
+        self.ttl = ttl
+        self._expires = 0
+        self._response = None
+
+    def __call__(self, handler):
+        now = time.time()
+        if self._response is None or now >= self._expires:
+            self._response = self.build(int(now))
+            self._expires = int(now) + self.ttl
+        self._response.send(handler)
+
+
+class Router:
+    """Exact, prefix and suffix route tables keyed by HTTP method.
+
+    Resolution order: exact path, then the longest matching prefix, then
+    suffixes in registration order. The query string is ignored.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+        self.suffixes = {}
+
+    def add(self, method, path, target):
+        """Register target for an exact path (or several paths)."""
+        paths = [path] if isinstance(path, str) else path
+        table = self.exact.setdefault(method, {})
+        for p in paths:
+            table[p] = target
+        return target
+
+    def add_prefix(self, method, prefix, target):
+        """Register target for every path starting with prefix."""
+        prefixes = [prefix] if isinstance(prefix, str) else prefix
+        table = self.prefixes.setdefault(method, [])
+        for p in prefixes:
+            table.append((p, target))
+        table.sort(key=lambda entry: len(entry[0]), reverse=True)
+        return target
+
+    def add_suffix(self, method, suffix, target):
+        """Register target for every path ending with suffix."""
+        suffixes = [suffix] if isinstance(suffix, str) else suffix
+        table = self.suffixes.setdefault(method, [])
+        for s in suffixes:
+            table.append((s, target))
+        return target
+
+    def resolve(self, method, path):
+        """Return the target registered for (method, path), or None."""
+        query = path.find('?')
+        if query != -1:
+            path = path[:query]
+        target = self.exact.get(method, {}).get(path)
+        if target is not None:
+            return target
+        for prefix, target in self.prefixes.get(method, ()):
+            if path.startswith(prefix):
+                return target
+        for suffix, target in self.suffixes.get(method, ()):
+            if path.endswith(suffix):
+                return target
+        return None
+
+    def dispatch(self, handler, method):
+        """Run the route for the handler's request. Returns False if none matched."""
+        target = self.resolve(method, handler.path)
+        if target is None:
+            return False
+        target(handler)
+        return True
@@ -999,13 +999,191 @@ async function safeFetch(url, options) {
     return fetch(url, options);
 }
 
+// ═══════════════════════════════════════════════════════════════════════
+// LIBRARY MIRRORS (delta sync)
+// The last server/static library seen is kept in IndexedDB with its library
+// version; later syncs fetch only the changes after that version. The static
+// mirror also keeps the feed's origin (which log the version belongs to) and
+// identity (a digest of the item set).
+// ═══════════════════════════════════════════════════════════════════════
+const SERVER_MIRROR_KEY = 'server-mirror';
+const STATIC_MIRROR_KEY = 'static-mirror';
+
+async function loadLibraryMirror(key) {
+    try {
+        const db = await openLibraryIDB();
+        const tx = db.transaction(LIBRARY_IDB_STORE, 'readonly');
+        const req = tx.objectStore(LIBRARY_IDB_STORE).get(key);
+        const result = await new Promise((res, rej) => { req.onsuccess = () => res(req.result); req.onerror = rej; });
+        db.close();
+        return result && Array.isArray(result.items) ? result : null;
+    } catch (err) {
+        return null;
+    }
+}
+
+async function saveLibraryMirror(key, version, items, { origin = null, identity = null } = {}) {
+    if (!Number.isFinite(version)) return;
+    try {
+        const snapshot = structuredClone(items); // callers may modify items after this returns
+        const db = await openLibraryIDB();
+        const tx = db.transaction(LIBRARY_IDB_STORE, 'readwrite');
+        tx.objectStore(LIBRARY_IDB_STORE).put({ key, version, origin, identity, items: snapshot });
+        await new Promise((res, rej) => { tx.oncomplete = res; tx.onerror = rej; });
+        db.close();
+    } catch (err) {
+        console.warn('[Library] Could not save library mirror:', err);
+    }
+}
+
+// Apply change-log entries ({op: 'upsert'|'delete', id}) to a copy of items.
+// itemFor(change) returns the new item of an upsert.
+function applyLibraryChanges(items, changes, itemFor) {
+    const byId = new Map(items.map(item => [String(item.id), item]));
+    changes.forEach(change => {
+        const key = String(change.id);
+        if (change.op === 'delete') {
+            byId.delete(key);
+        } else {
+            const item = itemFor(change);
+            if (item) byId.set(key, item);
+        }
+    });
+    return Array.from(byId.values());
+}
+
+// Server mirror + api/library/changes; null when a full download is needed
+async function fetchServerLibraryChanges() {
+    const mirror = await loadLibraryMirror(SERVER_MIRROR_KEY);
+    if (!mirror) return null;
+    try {
+        const response = await safeFetch(`api/library/changes?since=${mirror.version}`);
+        if (!response.ok) return null;
+        const feed = await response.json();
+        if (feed.reset) return null;
+        const items = applyLibraryChanges(mirror.items, feed.changes || [], change => change.item);
+        if (feed.version !== mirror.version) saveLibraryMirror(SERVER_MIRROR_KEY, feed.version, items);
+        console.log(`[Library] Delta sync v${mirror.version} -> v${feed.version}: ${(feed.changes || []).length} change(s)`);
+        return items;
+    } catch (err) {
+        console.log('[Library] Delta sync unavailable:', err.message);
+        return null;
+    }
+}
+
+// Fetch the server library as NDJSON (api/library/stream), parsing items as they arrive.
+// onItem(item, count) is called per item so callers can render progressively.
+// Falls back to the buffered api/library/list endpoint on older servers.
+// When a mirror of an earlier download exists, only the changes since then are fetched.
+async function fetchLibraryFromServer(onItem) {
+    const changed = await fetchServerLibraryChanges();
+    if (changed) {
+        if (onItem) changed.forEach((item, i) => onItem(item, i + 1));
+        return changed;
+    }
+
+    const items = [];
+    const response = await safeFetch('api/library/stream');
+    const version = Number(response.headers.get('X-Library-Version') ?? NaN);
+    if (!response.ok || !response.body) {
+        const listResponse = await safeFetch('api/library/list');
+        if (!listResponse.ok) throw new Error('API response not ok');
+        const list = await listResponse.json();
+        if (onItem) list.forEach((item, i) => onItem(item, i + 1));
+        saveLibraryMirror(SERVER_MIRROR_KEY, Number(listResponse.headers.get('X-Library-Version') ?? NaN), list);
+        return list;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    const takeLine = (line) => {
+        if (!line.trim()) return;
+        const item = JSON.parse(line);
+        items.push(item);
+        if (onItem) onItem(item, items.length);
+    };
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.forEach(takeLine);
+    }
+    takeLine(buffered + decoder.decode());
+    saveLibraryMirror(SERVER_MIRROR_KEY, version, items);
+    return items;
+}
+
+// Resolve an index written with `sync_to_github.py --shared-sections`
+// ({items, sections}: duplicated sections are stored once and referenced by hash)
+function expandSharedSections(index) {
+    if (Array.isArray(index)) return index;
+    if (!index || !Array.isArray(index.items)) return [];
+    const shared = index.sections || {};
+    index.items.forEach(item => {
+        const sections = item && item.data && item.data.sections;
+        if (!Array.isArray(sections)) return;
+        item.data.sections = sections.map(section =>
+            section && section.$ref && shared[section.$ref]
+                ? JSON.parse(JSON.stringify(shared[section.$ref]))
+                : section
+        );
+    });
+    return index.items;
+}
+
+// Static mirror + library-changes.json (written by sync_to_github.py): fetch
+// only the library files that changed; null when a full download is needed
+async function fetchStaticLibraryChanges(feed) {
+    const mirror = await loadLibraryMirror(STATIC_MIRROR_KEY);
+    if (!feed || !mirror) return null;
+    if (feed.identity && mirror.identity === feed.identity) {
+        // Same items; the feed may still come from a new log (every Pages build starts one)
+        if (mirror.origin !== feed.origin || mirror.version !== feed.version) {
+            saveLibraryMirror(STATIC_MIRROR_KEY, feed.version, mirror.items, feed);
+        }
+        return mirror.items;
+    }
+    // Versions only compare within one log
+    if (!feed.origin || mirror.origin !== feed.origin) return null;
+    if (mirror.version < feed.floor || mirror.version > feed.version) return null;
+    const pending = (feed.changes || []).filter(change => change.version > mirror.version);
+    try {
+        const fetched = new Map();
+        await Promise.all(pending.filter(change => change.op === 'upsert').map(async change => {
+            const response = await fetch(`library/${encodeURIComponent(change.file)}`);
+            if (!response.ok) throw new Error(`${change.file}: HTTP ${response.status}`);
+            fetched.set(change.file, await response.json());
+        }));
+        const items = applyLibraryChanges(mirror.items, pending, change => fetched.get(change.file));
+        saveLibraryMirror(STATIC_MIRROR_KEY, feed.version, items, feed);
+        console.log(`[Library] Delta sync v${mirror.version} -> v${feed.version}: ${pending.length} change(s)`);
+        return items;
+    } catch (err) {
+        console.log('[Library] Delta sync failed, downloading the full index:', err.message);
+        return null;
+    }
+}
+
 // Fetch library from static JSON file (for GitHub Pages)
 async function fetchLibraryFromStatic() {
     try {
+        let feed = null;
+        try {
+            const feedResponse = await fetch('library-changes.json', { cache: 'no-cache' });
+            if (feedResponse.ok) feed = await feedResponse.json();
+        } catch (e) { /* no change feed published */ }
+        const changed = await fetchStaticLibraryChanges(feed);
+        if (changed) return changed;
+
         // Try fetching the pre-generated library index
         const response = await fetch('library-index.json');
         if (response.ok) {
-            return await response.json();
+            const items = expandSharedSections(await response.json());
+            if (feed) saveLibraryMirror(STATIC_MIRROR_KEY, feed.version, items, feed);
+            return items;
         }
 
         // Fallback: try fetching individual files from Library folder listing
@@ -2089,13 +2267,12 @@ function setupKnowledgeBase() {
                     console.log("Could not fetch community submissions:", communityErr.message);
                 }
             } else {
-                // Local/Server mode: Use API
-                const response = await safeFetch('api/library/list');
-                if (response.ok) {
-                    serverItems = await response.json();
-                } else {
-                    throw new Error('API response not ok');
-                }
+                // Local/Server mode: stream items from the API
+                serverItems = await fetchLibraryFromServer((item, count) => {
+                    if (importBtn && count % 25 === 0) {
+                        importBtn.innerHTML = `<span class="material-symbols-rounded">sync</span> ${count}`;
+                    }
+                });
             }
 
             // Merge community approved items into serverItems for unified processing
@@ -4742,10 +4919,7 @@ function setupSyncStatus() {
                 serverItems = await fetchLibraryFromStatic();
             } else {
                 try {
-                    const response = await safeFetch('api/library/list');
-                    if (response.ok) {
-                        serverItems = await response.json();
-                    }
+                    serverItems = await fetchLibraryFromServer();
                 } catch (e) {
                     console.log('Could not fetch server library:', e.message);
                 }
@@ -5326,8 +5500,29 @@ document.addEventListener('DOMContentLoaded', async () => {
     setupSyncStatus();
     setupFTPServer();
     setupCopyToNotes();
+    openLinkedLibraryItem();
 });
 
+// index.html?item=<id> (linked from the pre-rendered pages in rendered/): open that item.
+// The server may already have put its static poster on the page; this swaps in the interactive view.
+async function openLinkedLibraryItem() {
+    const itemId = new URLSearchParams(window.location.search).get('item');
+    if (!itemId) return;
+    let item = getLibraryCache().find(i => String(i.id) === itemId);
+    if (!item && !isGitHubPages()) {
+        try {
+            const response = await safeFetch(`api/library/item?id=${encodeURIComponent(itemId)}`);
+            if (response.ok) item = await response.json();
+        } catch (err) {
+            console.warn('Could not fetch linked library item:', err);
+        }
+    }
+    if (!item || !item.data) return;
+    if (item.chapterId) item.data.chapterId = item.chapterId;
+    currentInfographicData = item.data;
+    renderInfographic(item.data);
+}
+
 /* Copy Highlighted Text to Notes App (with iOS Safari support) */
 function setupCopyToNotes() {
     const outputContainer = document.getElementById('output-container');
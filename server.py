@@ -4,7 +4,7 @@ Simple HTTP server for serving the FRCS simulator locally.
 This avoids CORS issues when loading local JavaScript files.
 
 Usage:
-    python3 server.py
+    python3 server.py [PORT] [--workers N]
 
 Then open your browser to: http://localhost:8000
 """
@@ -19,12 +19,47 @@ import datetime
 import subprocess
 from pathlib import Path
 
+from access_log import AccessLog, AccessLogMixin
+from admission import Admission, AdmissionMixin, ConnectionLimitMixin
+from asset_cache import AssetCacheMixin
+from credentials import CachedSecret
+from prefork import adopt_socket, bind_listeners, parse_workers, serve_prefork
+from profiling import DEBUG_PATH, Profiler, ProfilingMixin
+from routing import Response, Router, TimedResponse
+
 # Configuration
 DEFAULT_PORT = 8000
 HOST = 'localhost'
 KEYCHAIN_ACCOUNT_LABEL = 'SMILE'
 SCRIPT_DIR = Path(__file__).resolve().parent
 
+# Access logging
+ACCESS_LOG_FILE = None      # e.g. 'logs/access.log' (rotated by size); None logs to stdout
+ACCESS_LOG_FORMAT = 'text'  # 'text' or 'json' (JSON lines with per-request timing)
+ACCESS_LOG_SAMPLE_RATES = {
+    '/health': 0.1,
+    'OPTIONS': 0.1,
+    204: 0.0,  # apple-touch-icon and similar no-content noise
+}
+
+# Admission control (per process; see admission.py)
+REQUEST_READ_TIMEOUT = 30       # seconds a client may idle while sending a request
+REQUEST_HEADER_TIMEOUT = 20     # seconds for a whole request line and headers (slowloris)
+MAX_CONNECTIONS = 256           # open connections (each holds a thread)
+MAX_IN_FLIGHT = 64              # concurrent requests before answering 503
+RATE_LIMIT_PER_SECOND = 50      # per client IP
+RATE_LIMIT_BURST = 300
+MAX_BODY_BYTES = 64 * 1024      # static server: no uploads expected
+
+# Profiling (off by default; can also be switched on at runtime via /debug/profile from localhost)
+PROFILE_SAMPLE_RATE = 0.0   # fraction of requests run under cProfile
+PROFILE_SLOW_MS = None      # e.g. 500 to record requests slower than 500 ms
+PROFILE_DUMP_DIR = None     # e.g. 'logs/profiles' for per-request .prof files of slow requests
+
+# Local-dev Gemini key: resolved off the request thread and cached (see credentials.py)
+GEMINI_KEY_FILE = SCRIPT_DIR / 'config' / 'gemini-api-key.local'
+GEMINI_KEY_TTL = 300        # seconds before the Keychain is asked again (in the background)
+
 
 def read_gemini_key_from_keychain():
     """Return Gemini API key from Keychain password field (account label SMILE)."""
@@ -48,127 +83,135 @@ def read_gemini_key_from_keychain():
         return None
     return key
 
-class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+
+def read_gemini_key_from_file():
+    """Return Gemini API key from config/gemini-api-key.local (fallback when Keychain has none)."""
+    if not GEMINI_KEY_FILE.is_file():
+        return None
+    key = GEMINI_KEY_FILE.read_text(encoding='utf-8').strip()
+    if not key or key == KEYCHAIN_ACCOUNT_LABEL:
+        return None
+    return key
+
+
+# Keychain first, then the local file; re-resolved when the file changes or the TTL passes
+GEMINI_KEY = CachedSecret(
+    [read_gemini_key_from_keychain, read_gemini_key_from_file],
+    ttl=GEMINI_KEY_TTL,
+    watch_paths=[GEMINI_KEY_FILE],
+)
+
+# CORS headers added to every response (see CORSHTTPRequestHandler.end_headers)
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', '*'),
+]
+
+# Enhanced CORS headers for preflight responses
+PREFLIGHT_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS, HEAD, PATCH'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With, Accept, Origin, Cache-Control, X-File-Name'),
+    ('Access-Control-Max-Age', '86400'),  # Cache preflight for 24 hours
+    ('Access-Control-Allow-Credentials', 'false'),
+]
+
+ROBOTS_TXT = """User-agent: *
+Disallow: /
+# This is a local development server
+"""
+
+
+class ThreadingServer(ConnectionLimitMixin, socketserver.ThreadingTCPServer):
+    """One thread per connection, so a slow client cannot stall the others."""
+    daemon_threads = True
+    max_connections = MAX_CONNECTIONS
+
+
+class CORSHTTPRequestHandler(AccessLogMixin, AdmissionMixin, ProfilingMixin, AssetCacheMixin, http.server.SimpleHTTPRequestHandler):
     """HTTP request handler with CORS headers to prevent any cross-origin issues."""
+
+    # Route table, built once by build_routes() below
+    routes = None
+
+    # Access log is written by a background thread; high-volume routes are sampled
+    access_log = AccessLog(
+        path=ACCESS_LOG_FILE,
+        fmt=ACCESS_LOG_FORMAT,
+        sample_rates=ACCESS_LOG_SAMPLE_RATES,
+    )
+
+    # Socket timeout for every single read; admission's header deadline bounds the whole head
+    timeout = REQUEST_READ_TIMEOUT
+
+    # Per-client token bucket, in-flight budget and body size limit (429/503/413)
+    admission = Admission(
+        rate=RATE_LIMIT_PER_SECOND,
+        burst=RATE_LIMIT_BURST,
+        max_in_flight=MAX_IN_FLIGHT,
+        max_body=MAX_BODY_BYTES,
+        exempt_paths=('/health',),
+        header_timeout=REQUEST_HEADER_TIMEOUT,
+    )
+
+    # Opt-in cProfile/tracemalloc hooks; report and controls at /debug/profile (localhost only)
+    profiler = Profiler(
+        sample_rate=PROFILE_SAMPLE_RATE,
+        slow_ms=PROFILE_SLOW_MS,
+        dump_dir=PROFILE_DUMP_DIR,
+    )
     
     def end_headers(self):
         # Add CORS headers
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', '*')
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
         super().end_headers()
 
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS preflight."""
         try:
-            # Send successful response for all OPTIONS requests
-            self.send_response(200, 'OK')
-            
-            # Set content type based on path
-            if self.path == '/health':
-                self.send_header('Content-type', 'application/json')
-            elif self.path.startswith('/api/'):
-                self.send_header('Content-type', 'application/json')
-            else:
-                self.send_header('Content-type', 'text/plain')
-            
-            # Enhanced CORS headers for preflight
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS, HEAD, PATCH')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With, Accept, Origin, Cache-Control, X-File-Name')
-            self.send_header('Access-Control-Max-Age', '86400')  # Cache preflight for 24 hours
-            self.send_header('Access-Control-Allow-Credentials', 'false')
-            self.send_header('Content-Length', '0')
-            
-            # Complete the headers
-            self.end_headers()
-            
-            # Log the preflight request for debugging
-            origin = self.headers.get('Origin', 'None')
-            requested_method = self.headers.get('Access-Control-Request-Method', 'None')
-            requested_headers = self.headers.get('Access-Control-Request-Headers', 'None')
-            
-            print(f"[PREFLIGHT] {self.path} from {origin} - Method: {requested_method}, Headers: {requested_headers}")
-            
+            # Pre-encoded 200 response; content type depends on path
+            self.routes.resolve('OPTIONS', self.path)(self)
         except Exception as e:
             print(f"[ERROR] OPTIONS request failed: {e}")
             self.send_error(500, f"Internal server error: {e}")
     
     def do_GET(self):
-        """Handle GET requests with special cases for common 404s."""
-        # Handle health check endpoint
-        if self.path == '/health':
-            # Log health check requests with headers for debugging
-            user_agent: str = str(self.headers.get('User-Agent', 'Unknown'))
-            origin: str = str(self.headers.get('Origin', 'None'))
-            print(f"[HEALTH] Request from User-Agent: {user_agent[:50]}... Origin: {origin}") # type: ignore
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = '{"status": "ok", "service": "FRCS Simulator", "timestamp": "' + str(int(time.time())) + '"}'
-            self.wfile.write(response.encode())
+        """Handle GET requests: routed endpoints first, then static files."""
+        if self.routes.dispatch(self, 'GET'):
             return
         
-        # Handle Apple touch icons (redirect to favicon.ico if it exists, otherwise return 204)
-        if self.path in ['/apple-touch-icon.png', '/apple-touch-icon-precomposed.png']:
-            if os.path.exists('favicon.ico'):
-                self.send_response(302)
-                self.send_header('Location', '/favicon.ico')
-                self.end_headers()
-            else:
-                # Return 204 No Content instead of 404
-                self.send_response(204)
-                self.end_headers()
-            return
-        
-        # Local dev only: Gemini key from Keychain password (account SMILE), never for public deploy
-        if self.path == '/local-dev/gemini-api-key':
-            client = self.client_address[0] if self.client_address else ''
-            if client not in ('127.0.0.1', '::1'):
-                self.send_error(403, 'Forbidden')
-                return
-            key = read_gemini_key_from_keychain()
-            if not key:
-                key_path = SCRIPT_DIR / 'config' / 'gemini-api-key.local'
-                if key_path.is_file():
-                    key = key_path.read_text(encoding='utf-8').strip()
-                    if key == KEYCHAIN_ACCOUNT_LABEL:
-                        key = ''
-            body = key.encode('utf-8') if key else b''
-            self.send_response(200 if body else 204)
-            self.send_header('Content-type', 'text/plain')
-            self.send_header('Cache-Control', 'no-store')
-            self.end_headers()
-            if body:
-                self.wfile.write(body)
-            return
+        # Default behavior for all other requests
+        super().do_GET()
 
-        # Block serving secret config paths via static file handler
-        if self.path.startswith('/config/') or self.path.endswith('.local'):
-            self.send_error(404)
+    def serve_gemini_key(self):
+        """Local dev only: Gemini key from Keychain password (account SMILE), never for public deploy."""
+        client = self.client_address[0] if self.client_address else ''
+        if client not in ('127.0.0.1', '::1'):
+            self.send_error(403, 'Forbidden')
             return
+        key = GEMINI_KEY.get()
+        body = key.encode('utf-8') if key else b''
+        self.send_response(200 if body else 204)
+        self.send_header('Content-type', 'text/plain')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
 
-        # Handle robots.txt
-        if self.path == '/robots.txt':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            robots_content = """User-agent: *
-Disallow: /
-# This is a local development server
-"""
-            self.wfile.write(robots_content.encode())
-            return
-        
-        # Handle status page
-        if self.path == '/status':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            # Get the current port from the server
-            current_port = int(self.server.server_address[1]) # type: ignore
-            status_html = f"""<!DOCTYPE html>
+    def serve_not_found(self):
+        """Block serving secret config paths via static file handler."""
+        self.send_error(404)
+
+    def serve_status(self):
+        """Handle status page."""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html')
+        self.end_headers()
+        # Get the current port from the server
+        current_port = int(self.server.server_address[1]) # type: ignore
+        status_html = f"""<!DOCTYPE html>
 <html>
 <head>
     <title>FRCS Simulator Server Status</title>
@@ -213,27 +256,63 @@ Disallow: /
     </div>
 </body>
 </html>"""
-            self.wfile.write(status_html.encode())
-            return
-        
-        # Default behavior for all other requests
-        super().do_GET()
-    
-    def log_message(self, format, *args):
-        """Override log_message to reduce noise from 204 responses."""
-        # Don't log successful apple-touch-icon requests (they return 204)
-        if len(args) >= 2 and '204' in str(args[1]):
-            return
-        # Log other requests normally but with cleaner formatting
-        timestamp = self.log_date_time_string()
-        print(f"[{timestamp}] {format % args}")
+        self.wfile.write(status_html.encode())
     
-    def log_date_time_string(self):
-        """Return formatted timestamp."""
-        import time
-        now = time.time()
-        year, month, day, hh, mm, ss, x, y, z = time.localtime(now)
-        return f"{day:02d}/{month:02d}/{year} {hh:02d}:{mm:02d}:{ss:02d}"
+    def access_log_extra(self):
+        """Add origin/user agent (and preflight details) to access log records."""
+        # Requests rejected before their headers were parsed (400, 414, 505) have none
+        headers = getattr(self, 'headers', None)
+        if headers is None:
+            return None
+        extra = {
+            'origin': headers.get('Origin'),
+            'user_agent': str(headers.get('User-Agent', ''))[:120],
+        }
+        if getattr(self, 'command', None) == 'OPTIONS':
+            extra['preflight_method'] = headers.get('Access-Control-Request-Method')
+            extra['preflight_headers'] = headers.get('Access-Control-Request-Headers')
+        return extra
+
+
+# Health check body carries a timestamp, so it is re-encoded at most once per second
+HEALTH_RESPONSE = TimedResponse(lambda now: Response(
+    200,
+    '{"status": "ok", "service": "FRCS Simulator", "timestamp": "' + str(now) + '"}',
+    'application/json',
+    CORS_HEADERS,
+))
+
+
+def build_routes():
+    """Build the route table and pre-encode the constant responses."""
+    routes = Router()
+    handler = CORSHTTPRequestHandler
+
+    routes.add('GET', '/health', HEALTH_RESPONSE)
+
+    # Apple touch icons: redirect to favicon.ico if it exists, otherwise 204 instead of 404
+    if (SCRIPT_DIR / 'favicon.ico').exists():
+        touch_icon = Response(302, headers=[('Location', '/favicon.ico')] + CORS_HEADERS)
+    else:
+        touch_icon = Response(204, headers=CORS_HEADERS)
+    routes.add('GET', ['/apple-touch-icon.png', '/apple-touch-icon-precomposed.png'], touch_icon)
+
+    routes.add('GET', '/local-dev/gemini-api-key', handler.serve_gemini_key)
+    routes.add('GET', DEBUG_PATH, handler.serve_profile)
+    routes.add_prefix('GET', '/config/', handler.serve_not_found)
+    routes.add_suffix('GET', '.local', handler.serve_not_found)
+    routes.add('GET', '/robots.txt', Response(200, ROBOTS_TXT, 'text/plain', CORS_HEADERS))
+    routes.add('GET', '/status', handler.serve_status)
+
+    # Preflight: every OPTIONS request gets 200, JSON content type for API paths
+    routes.add('OPTIONS', '/health', Response(200, b'', 'application/json', PREFLIGHT_HEADERS))
+    routes.add_prefix('OPTIONS', '/api/', Response(200, b'', 'application/json', PREFLIGHT_HEADERS))
+    routes.add_prefix('OPTIONS', '', Response(200, b'', 'text/plain', PREFLIGHT_HEADERS))
+    return routes
+
+
+CORSHTTPRequestHandler.routes = build_routes()
+
 
 def find_available_port(start_port=DEFAULT_PORT, max_attempts=10):
     """Find an available port starting from start_port."""
@@ -285,27 +364,49 @@ def show_help():
 🏥 FRCS Simulator Server
 
 Usage:
-    python3 server.py [PORT]
+    python3 server.py [PORT] [--workers N]
 
 Arguments:
     PORT        Port number to use (default: 8000)
 
 Options:
-    -h, --help  Show this help message
+    -h, --help     Show this help message
+    --workers N    Serve from N processes sharing the port (prefork mode)
 
 Examples:
     python3 server.py           # Start on default port 8000
     python3 server.py 8001      # Start on port 8001
     python3 server.py --help    # Show this help
+    python3 server.py 8000 --workers 4   # 4 worker processes (kill -HUP <pid> to reload)
 
 Features:
     • Automatic port detection if default port is busy
     • Option to kill existing server on same port
     • Health check endpoint (/health)
     • Status page (/status)
+    • Profiling report and controls (/debug/profile, localhost only)
     • Proper CORS headers for local development
     """)
 
+def serve_workers(port, workers):
+    """Serve from `workers` forked processes sharing one listening socket."""
+    try:
+        listeners = bind_listeners([(HOST, port)])
+    except OSError as e:
+        print(f"❌ Could not bind port {port}: {e}")
+        sys.exit(1)
+    
+    print(f"🌐 Server URL: http://{HOST}:{port}")
+    print(f"🧵 Prefork mode: {workers} workers (kill -HUP {os.getpid()} for a graceful reload)")
+    print(f"⏹️  Press Ctrl+C to stop the server")
+    print("-" * 60)
+    serve_prefork(
+        listeners,
+        lambda sockets: [adopt_socket(ThreadingServer, sockets[0], CORSHTTPRequestHandler)],
+        workers,
+    )
+
+
 def main():
     """Start the HTTP server."""
     # Check for help flag
@@ -313,6 +414,8 @@ def main():
         show_help()
         sys.exit(0)
     
+    workers = parse_workers(sys.argv)
+    
     # Change to the directory where this script is located
     script_dir = Path(__file__).parent
     os.chdir(script_dir)
@@ -331,6 +434,14 @@ def main():
             print(f"💡 Use 'python3 server.py --help' for usage information")
             port = DEFAULT_PORT
     
+    # Resolve the local-dev Gemini key before serving (requests never wait for it)
+    if not GEMINI_KEY.prime():
+        print("⚠️  Gemini key lookup still running; it will be served once resolved")
+    
+    if workers > 1:
+        serve_workers(port, workers)
+        return
+    
     # Try to start on the requested port first
     port_val: int = port
     original_port: int = port_val
@@ -339,7 +450,7 @@ def main():
     while not server_started:
         try:
             # Create server
-            with socketserver.TCPServer((HOST, port_val), CORSHTTPRequestHandler) as httpd:
+            with ThreadingServer((HOST, port_val), CORSHTTPRequestHandler) as httpd:
                 print(f"🌐 Server URL: http://{HOST}:{port_val}")
                 print(f"📄 Main App: http://{HOST}:{port_val}/FRCS%20simulator.html")
                 print(f"📊 Status Page: http://{HOST}:{port_val}/status")
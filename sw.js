@@ -0,0 +1,157 @@
+/**
+ * Offline-first service worker
+ *
+ * Precaches the app shell, the fingerprinted assets and the library index
+ * listed in precache-manifest.json (written by sync_to_github.py, one entry
+ * per file with a content hash). Every manifest version is installed into
+ * its own cache, so the worker that is still active keeps serving a
+ * consistent set of files; entries whose hash did not change are copied
+ * from the previous version's cache instead of being downloaded again, and
+ * activate deletes the old caches.
+ *
+ * Precached URLs are served cache-first. Precached HTML is only ever
+ * replaced by an install, because a newer page may point at fingerprinted
+ * assets that are not cached yet; other unfingerprinted entries are
+ * refreshed in the background. Navigations with a query string
+ * (index.html?item=<id>) try the network first. Everything else, including
+ * all API calls, goes straight to the network.
+ *
+ * Without a manifest (server or dev mode before sync_to_github.py --assets)
+ * the worker installs with an empty cache and passes every request through.
+ */
+
+// Rewritten by sync_to_github.py whenever the manifest changes, so browsers
+// see a new worker and run the install step again.
+const PRECACHE_VERSION = 'dev';
+
+const CACHE_PREFIX = 'ophthalmics-precache';
+const PRECACHE_NAME = `${CACHE_PREFIX}-${PRECACHE_VERSION}`;
+const MANIFEST_URL = 'precache-manifest.json';
+const HASHES_KEY = '__precache-hashes__';
+
+const scopeUrl = (path) => new URL(path, self.registration.scope).href;
+
+async function readStoredHashes(cache) {
+    const stored = await cache.match(scopeUrl(HASHES_KEY));
+    if (!stored) return {};
+    try {
+        return await stored.json();
+    } catch {
+        return {};
+    }
+}
+
+async function fetchManifest() {
+    try {
+        const response = await fetch(scopeUrl(MANIFEST_URL), { cache: 'no-cache' });
+        if (response.ok) return await response.json();
+        console.log(`[SW] No precache manifest (HTTP ${response.status}); nothing precached`);
+    } catch (err) {
+        console.log('[SW] Precache manifest unavailable; nothing precached:', err);
+    }
+    return null;
+}
+
+async function olderCaches() {
+    const older = [];
+    for (const name of await caches.keys()) {
+        if (name.startsWith(CACHE_PREFIX) && name !== PRECACHE_NAME) {
+            const cache = await caches.open(name);
+            older.push({ cache, hashes: await readStoredHashes(cache) });
+        }
+    }
+    return older;
+}
+
+async function precache() {
+    const manifest = await fetchManifest();
+    if (!manifest) return;
+
+    const cache = await caches.open(PRECACHE_NAME);
+    const current = await readStoredHashes(cache);
+    const older = await olderCaches();
+    const hashes = {};
+    let fetched = 0;
+
+    for (const entry of manifest.entries || []) {
+        const url = scopeUrl(entry.url);
+        hashes[url] = entry.hash;
+        if (current[url] === entry.hash && await cache.match(url)) continue;
+        let response = null;
+        for (const previous of older) {
+            if (previous.hashes[url] === entry.hash) {
+                response = await previous.cache.match(url);
+                if (response) break;
+            }
+        }
+        if (!response) {
+            response = await fetch(url, { cache: 'no-cache' });
+            if (!response.ok) throw new Error(`${entry.url}: HTTP ${response.status}`);
+            fetched++;
+        }
+        await cache.put(url, response);
+    }
+
+    await cache.put(scopeUrl(HASHES_KEY), new Response(JSON.stringify(hashes), {
+        headers: { 'Content-Type': 'application/json' }
+    }));
+    console.log(`[SW] Precache ${manifest.version}: ${fetched} of ${Object.keys(hashes).length} entries downloaded`);
+}
+
+async function deleteOldCaches() {
+    for (const name of await caches.keys()) {
+        if (name.startsWith(CACHE_PREFIX) && name !== PRECACHE_NAME) {
+            await caches.delete(name);
+        }
+    }
+}
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(precache().then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(deleteOldCaches().then(() => self.clients.claim()));
+});
+
+// Fingerprinted names (script.<hash>.js) never change content; HTML changes only with a new install
+const FINGERPRINTED = /\.[0-9a-f]{10}\.(?:js|css|json)$/;
+const HTML = /\.html$/;
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const [withoutHash] = request.url.split('#');
+    let [url, query] = withoutHash.split('?');
+    if (!url.startsWith(self.location.origin) || url.includes('/api/')) return;
+    const navigate = request.mode === 'navigate';
+    if (navigate && url === self.registration.scope) {
+        url = scopeUrl('index.html');
+    }
+
+    event.respondWith((async () => {
+        const cache = await caches.open(PRECACHE_NAME);
+        const cached = await cache.match(url);
+        if (!cached) return fetch(request);
+
+        if (navigate && query) {
+            // e.g. index.html?item=<id>: the server may put that item's poster into the page
+            try {
+                return await fetch(request);
+            } catch {
+                return cached;
+            }
+        }
+
+        if (!FINGERPRINTED.test(url) && !HTML.test(url)) {
+            // Background revalidation; the cached copy answers immediately
+            event.waitUntil(
+                fetch(url, { cache: 'no-cache' })
+                    .then(fresh => fresh.ok ? cache.put(url, fresh) : null)
+                    .catch(() => { /* offline */ })
+            );
+        }
+        return cached;
+    })());
+});
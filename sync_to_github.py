@@ -3,28 +3,77 @@
 Ophthalmic Infographic Library Sync Script
 
 This script:
-1. Generates a library-index.json from all JSON files in the library folder
-2. Commits and pushes changes to GitHub
+1. Builds the library outputs from the JSON files in the library folder:
+   - brings each file into canonical form once (missing id, title, date,
+     chapterId and seqId are filled and written back; see library_ingest.py)
+   - library-index.json, the items newest first, and
+     library-index.offsets.json, where each item sits in it (single-item reads)
+   - rendered/: a static page per infographic plus a listing page
+     (prerender.py); the servers also use the pages for first paint
+   - the next library version in the change log, and library-changes.json
+     listing what changed, so clients fetch only edited items
+   - library-facets.json: per-item analytics and chapter facets
+2. Writes content-hashed copies of the app assets (script.<hash>.js, ...),
+   points the HTML pages at them and writes the service worker's precache
+   manifest
+3. Commits and pushes changes to GitHub
 
 Usage:
     python sync_to_github.py           # Generate index and push
     python sync_to_github.py --index   # Only generate index (no git)
     python sync_to_github.py --push    # Only push (assumes index exists)
+    python sync_to_github.py --assets  # Only rebuild the fingerprinted assets and precache manifest
+    python sync_to_github.py --dedupe  # Only report near-duplicate (not merely same-topic) infographics
+
+    Add --shared-sections to store exact-duplicate sections once in the index.
+
+    After the asset stage the pages load the hashed copies, so re-run --assets
+    after editing script.js or style.css to see the change in the browser.
 """
 
 import os
+import re
 import sys
 import json
+import hashlib
 import subprocess
 from pathlib import Path
 from datetime import datetime
 
+from asset_cache import FINGERPRINT_LENGTH, fingerprinted_name
+from json_codec import DUMPS_BACKEND, LOADS_BACKEND, dump_file, load_file, dumps as json_dumps, loads as json_loads
+from library_changes import ChangeLog, item_digest
+from library_facets import build_facets, item_analytics
+from library_ingest import ItemSchemaError, canonicalize, id_from_name
+from library_offsets import encode_index, offsets_path
+from prerender import RENDER_DIR, render_library
+
 # Configuration
 SCRIPT_DIR = Path(__file__).parent
 LIBRARY_DIR = SCRIPT_DIR / "library"
 INDEX_FILE = SCRIPT_DIR / "library-index.json"
+CHANGES_FEED_FILE = SCRIPT_DIR / "library-changes.json"
+FACETS_FILE = SCRIPT_DIR / "library-facets.json"
 GITHUB_REPO = "https://github.com/genododi/ophthalmology.git"
 
+# Near-duplicate detection (MinHash over word shingles)
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 64  # 2 rows per band -> pairs above ~0.3 almost always become candidates
+SIMILARITY_THRESHOLD = 0.35
+SECTION_REF_KEY = "$ref"
+
+# Fingerprinted assets, in build order: files referenced from a later asset come first
+FINGERPRINT_ASSETS = ["library-index.json", "style.css", "firebase-storage.js",
+                      "community-submissions.js", "script.js"]
+ASSET_PAGES = ["index.html", "moderation.html", "qa-generator.html"]
+ASSET_MANIFEST_FILE = SCRIPT_DIR / "asset-manifest.json"
+
+# Service worker precache: app shell plus every fingerprinted asset
+PRECACHE_SHELL = ["index.html", "moderation.html", "qa-generator.html"]
+PRECACHE_MANIFEST_FILE = SCRIPT_DIR / "precache-manifest.json"
+SERVICE_WORKER_FILE = SCRIPT_DIR / "sw.js"
+
 def log(msg, level="INFO"):
     """Print colored log messages."""
     colors = {
@@ -37,66 +86,392 @@ def log(msg, level="INFO"):
     print(f"{colors.get(level, '')}{level}: {msg}{colors['RESET']}")
 
 
-def generate_library_index():
-    """Read all JSON files from library folder and create a combined index."""
-    log("Generating library index...")
-    
-    if not LIBRARY_DIR.exists():
-        log(f"Library directory not found: {LIBRARY_DIR}", "WARNING")
-        LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
-        log(f"Created library directory: {LIBRARY_DIR}", "INFO")
-    
-    all_items = []
+def _collect_text(value, parts):
+    """Append every string found in a (nested) section value to parts."""
+    if isinstance(value, str):
+        parts.append(value)
+    elif isinstance(value, list):
+        for entry in value:
+            _collect_text(entry, parts)
+    elif isinstance(value, dict):
+        for entry in value.values():
+            _collect_text(entry, parts)
+
+
+def item_text(item):
+    """Return the readable text of an infographic (title, summary and section content)."""
+    data = item.get('data') or {}
+    parts = [str(item.get('title', '')), str(item.get('summary', ''))]
+    for section in data.get('sections') or []:
+        if isinstance(section, dict):
+            _collect_text(section.get('title', ''), parts)
+            _collect_text(section.get('content', ''), parts)
+    return ' '.join(parts)
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Return the set of 64-bit hashes of the word shingles in text."""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < size:
+        words = words + [''] * (size - len(words))
+    hashes = set()
+    for i in range(len(words) - size + 1):
+        shingle = ' '.join(words[i:i + size]).encode('utf-8')
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'big'))
+    return hashes
+
+
+def minhash_signature(hashes, bins=MINHASH_PERMUTATIONS):
+    """Return a one-permutation MinHash signature (minimum hash per bin).
+
+    Empty bins hold None so they never count as agreement.
+    """
+    signature = [None] * bins
+    for h in hashes:
+        slot = h % bins
+        value = h // bins
+        current = signature[slot]
+        if current is None or value < current:
+            signature[slot] = value
+    return signature
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimate Jaccard similarity from two signatures."""
+    agree = used = 0
+    for x, y in zip(sig_a, sig_b):
+        if x is None and y is None:
+            continue
+        used += 1
+        if x == y:
+            agree += 1
+    return agree / used if used else 0.0
+
+
+def find_near_duplicates(items, threshold=SIMILARITY_THRESHOLD):
+    """Group items whose estimated Jaccard similarity is at least threshold.
+
+    Returns a list of clusters, each a list of (item, best_similarity) tuples.
+    """
+    signatures = [minhash_signature(shingle_hashes(item_text(item))) for item in items]
+
+    # LSH: items sharing any identical band become candidate pairs
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    candidates = set()
+    for band in range(MINHASH_BANDS):
+        buckets = {}
+        for idx, sig in enumerate(signatures):
+            key = tuple(sig[band * rows:(band + 1) * rows])
+            if all(v is None for v in key):
+                continue
+            buckets.setdefault(key, []).append(idx)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    candidates.add((members[i], members[j]))
+
+    # Verify candidates against the full signature and union matching pairs
+    parent = list(range(len(items)))
+    best = [0.0] * len(items)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in candidates:
+        similarity = estimate_similarity(signatures[i], signatures[j])
+        if similarity >= threshold:
+            parent[find(i)] = find(j)
+            best[i] = max(best[i], similarity)
+            best[j] = max(best[j], similarity)
+
+    clusters = {}
+    for idx in range(len(items)):
+        clusters.setdefault(find(idx), []).append(idx)
+    return [
+        [(items[idx], best[idx]) for idx in members]
+        for members in clusters.values() if len(members) > 1
+    ]
+
+
+def report_near_duplicates(items, threshold=SIMILARITY_THRESHOLD):
+    """Log near-duplicate clusters and return how many were found.
+
+    Only items sharing much of their wording are caught, i.e. copies and
+    light edits. Topical rewrites (the same subject written up again, such
+    as the Red Eye guides, at a similarity of about 0.15) are out of scope,
+    and only the library folder is scanned (not e.g. a stray JSON file in
+    the repo root).
+    """
+    clusters = find_near_duplicates(items, threshold)
+    if not clusters:
+        log(f"No near-duplicate infographics found (threshold {threshold:.2f})", "SUCCESS")
+        return 0
+
+    log(f"Found {len(clusters)} near-duplicate cluster(s) (threshold {threshold:.2f})", "WARNING")
+    for number, cluster in enumerate(clusters, 1):
+        print(f"  Cluster {number}:")
+        for item, similarity in cluster:
+            print(f"    - [{similarity:.2f}] {item.get('id')}: {item.get('title', 'Untitled')}")
+    return len(clusters)
+
+
+def section_hash(section):
+    """Return the content address of a section (SHA-256 of its canonical JSON)."""
+    return hashlib.sha256(json_dumps(section, sort_keys=True)).hexdigest()
+
+
+def share_duplicate_sections(items):
+    """Replace sections that occur more than once with {"$ref": hash} pointers.
+
+    Returns the shared section table (hash -> section). Items are modified in place.
+    """
+    counts = {}
+    for item in items:
+        for section in (item.get('data') or {}).get('sections') or []:
+            key = section_hash(section)
+            counts[key] = counts.get(key, 0) + 1
+
+    shared = {}
+    for item in items:
+        sections = (item.get('data') or {}).get('sections')
+        if not sections:
+            continue
+        for pos, section in enumerate(sections):
+            key = section_hash(section)
+            if counts[key] > 1:
+                shared.setdefault(key, section)
+                sections[pos] = {SECTION_REF_KEY: key}
+    return shared
+
+
+def write_atomic(path, data):
+    """Write bytes to path through a temporary file, so readers never see a partial file."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def load_library_items():
+    """Load every parseable library item (no normalization)."""
+    items = []
+    for json_file in sorted(LIBRARY_DIR.glob("*.json")):
+        try:
+            items.append(load_file(json_file))
+        except (ValueError, OSError) as e:
+            log(f"Skipping {json_file.name}: {e}", "WARNING")
+    return items
+
+
+def ingest_library_files():
+    """Bring every library file into canonical form (library_ingest.py), rewriting only those that change.
+
+    Files added by hand or uploaded before ingestion existed get their missing
+    fields once; from then on they are read as stored. Returns [(path, item)],
+    newest first.
+    """
     json_files = list(LIBRARY_DIR.glob("*.json"))
-    
     log(f"Found {len(json_files)} JSON files in library folder")
     
+    entries = []  # [path, item, changed]
     for json_file in json_files:
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                item = json.load(f)
-                
-                # Ensure essential fields exist
-                if 'id' not in item:
-                    # Generate ID from filename
-                    item['id'] = int(json_file.stem.split('_')[0]) if json_file.stem.split('_')[0].isdigit() else hash(json_file.stem)
-                
-                if 'title' not in item:
-                    # Generate title from filename
-                    item['title'] = json_file.stem.replace('_', ' ')
-                
-                if 'date' not in item:
-                    # Use file modification time
-                    item['date'] = datetime.fromtimestamp(json_file.stat().st_mtime).isoformat()
-                
-                if 'chapterId' not in item:
-                    item['chapterId'] = 'uncategorized'
-                
-                all_items.append(item)
-                
-        except json.JSONDecodeError as e:
+            with open(json_file, 'rb') as f:
+                raw = json_loads(f.read())
+            item, changed = canonicalize(
+                raw,
+                default_id=lambda: id_from_name(json_file.stem),
+                default_title=lambda: json_file.stem.replace('_', ' '),
+                # The file's mtime, once: stored with the item so later touches do not move it
+                default_date=lambda: datetime.fromtimestamp(json_file.stat().st_mtime).isoformat(),
+            )
+            entries.append([json_file, item, changed])
+        except ItemSchemaError as e:
+            log(f"Skipping {json_file.name}: {e}", "WARNING")
+        except ValueError as e:
             log(f"Invalid JSON in {json_file.name}: {e}", "WARNING")
         except Exception as e:
             log(f"Error reading {json_file.name}: {e}", "ERROR")
     
     # Sort by date (newest first)
-    all_items.sort(key=lambda x: x.get('date', ''), reverse=True)
+    entries.sort(key=lambda entry: entry[1].get('date', ''), reverse=True)
     
     # Assign sequential IDs if missing
-    max_seq_val: int = int(max((item.get('seqId', 0) for item in all_items), default=0))
-    for item in all_items:
+    max_seq_val = max((entry[1].get('seqId') or 0 for entry in entries), default=0)
+    
+    def next_seq_id():
+        nonlocal max_seq_val
+        max_seq_val += 1
+        return max_seq_val
+    
+    normalized = 0
+    for entry in entries:
+        json_file, item, changed = entry
         if not item.get('seqId'):
-            max_seq_val += 1  # type: ignore
-            item['seqId'] = max_seq_val
+            item, _ = canonicalize(item, next_seq_id=next_seq_id)
+            entry[1], changed = item, True
+        if changed:
+            write_atomic(json_file, json_dumps(item, indent=2))
+            normalized += 1
+    if normalized:
+        log(f"Normalized {normalized} library file(s) in place", "INFO")
+    return [(json_file, item) for json_file, item, _ in entries]
+
+
+def generate_library_index(shared_sections=False):
+    """Read all JSON files from library folder and create a combined index.
+
+    With shared_sections, sections that appear verbatim in several items are
+    stored once and the index is written as {"items": [...], "sections": {...}}.
+    """
+    log("Generating library index...")
+    
+    if not LIBRARY_DIR.exists():
+        log(f"Library directory not found: {LIBRARY_DIR}", "WARNING")
+        LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
+        log(f"Created library directory: {LIBRARY_DIR}", "INFO")
+    
+    entries = ingest_library_files()
+    
+    # Items are canonical on disk, so the index is their concatenation, newest first
+    all_items = []
+    current = {}  # filename -> (digest, id) for the change log
+    analytics = {}  # id -> per-item analytics for the facets file
+    for json_file, item in entries:
+        all_items.append(item)
+        current[json_file.name] = (item_digest(item), item['id'])
+        analytics[item['id']] = item_analytics(item)
+    
+    # Static pages for first paint (before sections are replaced by shared refs)
+    try:
+        rendered, reused = render_library(all_items)
+        log(f"Pre-rendered {rendered} page(s) into {RENDER_DIR.name}/ ({reused} unchanged)", "INFO")
+    except OSError as e:
+        log(f"Could not pre-render pages: {e}", "WARNING")
+    
+    sections = None
+    if shared_sections:
+        sections = share_duplicate_sections(all_items)
+        log(f"Stored {len(sections)} duplicated section(s) once in the index", "INFO")
+    
+    # Write the index file (the shared-sections form is written compact: it exists to shrink downloads).
+    # The bytes equal json.dump(..., ensure_ascii=False) whichever JSON backend runs. Both files are
+    # replaced atomically: the server memory-maps the index and locates items with the offset table,
+    # which names the index it belongs to by digest and so is written second.
+    index_bytes, offsets = encode_index(all_items, sections)
+    write_atomic(INDEX_FILE, index_bytes)
+    write_atomic(Path(offsets_path(INDEX_FILE)), json_dumps(offsets))
     
-    # Write the index file
-    with open(INDEX_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_items, f, indent=2, ensure_ascii=False)
+    log(f"Generated {INDEX_FILE.name} with {len(all_items)} items (JSON: {LOADS_BACKEND} decode, {DUMPS_BACKEND} encode)", "SUCCESS")
     
-    log(f"Generated {INDEX_FILE.name} with {len(all_items)} items", "SUCCESS")
+    # Library version and static change feed (the API equivalent is /api/library/changes)
+    changes = ChangeLog(str(LIBRARY_DIR))
+    version = changes.update(current)
+    dump_file(CHANGES_FEED_FILE, changes.feed())
+    log(f"Library version {version} ({CHANGES_FEED_FILE.name})", "SUCCESS")
+    
+    # Counts for dashboards and filters, without item bodies
+    facets = build_facets(analytics)
+    dump_file(FACETS_FILE, facets)
+    log(f"Wrote {FACETS_FILE.name}: {len(facets['chapters'])} chapters, {facets['totals']['words']} words", "SUCCESS")
     return len(all_items)
 
 
+def rewrite_asset_refs(text, manifest):
+    """Point quoted references to assets (plain, ?v= or older hashed names) at their hashed copies."""
+    for name, hashed in manifest.items():
+        stem, _, suffix = name.rpartition('.')
+        pattern = (r'(?<=["\'])' + re.escape(stem) + r'(?:\.[0-9a-f]{%d})?\.' % FINGERPRINT_LENGTH
+                   + re.escape(suffix) + r'(?:\?v=[\w.-]*)?(?=["\'])')
+        text = re.sub(pattern, hashed, text)
+    return text
+
+
+def fingerprint_assets():
+    """Write content-hashed copies of FINGERPRINT_ASSETS and repoint ASSET_PAGES at them.
+
+    Returns the manifest (original name -> hashed name), also written to
+    ASSET_MANIFEST_FILE. Hashed copies from earlier builds are removed.
+    """
+    log("Fingerprinting assets...")
+    manifest = {}
+    for name in FINGERPRINT_ASSETS:
+        source = SCRIPT_DIR / name
+        if not source.exists():
+            log(f"Asset not found, skipping: {name}", "WARNING")
+            continue
+        data = source.read_bytes()
+        if name.endswith('.js'):
+            # e.g. script.js fetches library-index.json: its copy fetches the hashed index
+            data = rewrite_asset_refs(data.decode('utf-8'), manifest).encode('utf-8')
+        hashed = fingerprinted_name(name, hashlib.sha256(data).hexdigest())
+        target = SCRIPT_DIR / hashed
+        if not target.exists():
+            tmp = target.with_name(target.name + '.tmp')
+            tmp.write_bytes(data)
+            tmp.replace(target)
+        manifest[name] = hashed
+
+        stem, _, suffix = name.rpartition('.')
+        stale = re.compile(re.escape(stem) + r'\.[0-9a-f]{%d}\.' % FINGERPRINT_LENGTH + re.escape(suffix) + '$')
+        for old in SCRIPT_DIR.glob(f"{stem}.*.{suffix}"):
+            if old.name != hashed and stale.match(old.name):
+                old.unlink()
+
+    for page in ASSET_PAGES:
+        path = SCRIPT_DIR / page
+        if not path.exists():
+            continue
+        html = path.read_text(encoding='utf-8')
+        updated = rewrite_asset_refs(html, manifest)
+        if updated != html:
+            path.write_text(updated, encoding='utf-8')
+            log(f"Updated asset references in {page}", "INFO")
+
+    with open(ASSET_MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    log(f"Fingerprinted {len(manifest)} assets ({ASSET_MANIFEST_FILE.name})", "SUCCESS")
+    return manifest
+
+
+def build_precache_manifest(asset_manifest):
+    """Write the service worker's precache manifest and stamp its version into sw.js.
+
+    Each entry carries a content hash, so clients re-download only entries
+    whose hash changed. The version is a hash over all entries.
+    """
+    entries = []
+    for name in PRECACHE_SHELL + sorted(asset_manifest.values()):
+        path = SCRIPT_DIR / name
+        if not path.exists():
+            log(f"Precache entry not found, skipping: {name}", "WARNING")
+            continue
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:FINGERPRINT_LENGTH]
+        entries.append({"url": name, "hash": digest})
+
+    canonical = json.dumps(entries, sort_keys=True, separators=(',', ':'))
+    version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:FINGERPRINT_LENGTH]
+    with open(PRECACHE_MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"version": version, "entries": entries}, f, indent=2)
+        f.write('\n')
+
+    # A byte change in sw.js is what makes browsers install the new version
+    if SERVICE_WORKER_FILE.exists():
+        worker = SERVICE_WORKER_FILE.read_text(encoding='utf-8')
+        stamped = re.sub(r"const PRECACHE_VERSION = '[^']*';",
+                         f"const PRECACHE_VERSION = '{version}';", worker, count=1)
+        if stamped != worker:
+            SERVICE_WORKER_FILE.write_text(stamped, encoding='utf-8')
+    else:
+        log(f"{SERVICE_WORKER_FILE.name} not found; precache manifest will not be used", "WARNING")
+
+    log(f"Precache manifest {version}: {len(entries)} entries ({PRECACHE_MANIFEST_FILE.name})", "SUCCESS")
+    return version
+
+
 def check_git_status():
     """Check if we're in a git repo and have changes."""
     try:
@@ -236,20 +611,29 @@ def main():
     print("="*50 + "\n")
     
     args = sys.argv[1:] # type: ignore
+    shared_sections = '--shared-sections' in args
     
-    if '--index' in args:
+    if '--dedupe' in args:
+        # Only report near-duplicate infographics
+        report_near_duplicates(load_library_items())
+    elif '--index' in args:
         # Only generate index
-        generate_library_index()
+        generate_library_index(shared_sections=shared_sections)
     elif '--push' in args:
         # Only push
         push_to_github()
+    elif '--assets' in args:
+        # Only rebuild the fingerprinted assets
+        build_precache_manifest(fingerprint_assets())
     else:
         # Full sync: generate index, copy files, and push
-        item_count = generate_library_index()
+        item_count = generate_library_index(shared_sections=shared_sections)
         
         if item_count > 0:
             copy_library_to_root()
         
+        build_precache_manifest(fingerprint_assets())
+        
         if check_git_status():
             push_to_github()
         else: